@@ -0,0 +1,303 @@
+# benchmarks/bench.py
+#
+# Times the manager CRUD and query paths against a synthetic database.
+# Memory is reported per operation: the RSS it kept and the peak RSS it
+# reached above where it started (meta.peak_rss_kb is the whole run's).
+#
+#   python -m benchmarks.bench --scale 100000 --output bench.json
+#   python -m benchmarks.bench --scale 100000 --compare bench.json
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from faker import Faker
+from models.database import Database
+from models.medication_tracker import MedicationTrackerDB
+from models.reminder import ReminderManager
+from models.schedule import ScheduleManager
+from models.timeutil import TIME_FORMAT
+
+USERS_PER_MEDICATION = 0.1
+SCHEDULES_PER_MEDICATION = 3
+REMINDERS_PER_MEDICATION = 3
+START = datetime.datetime(2024, 1, 1)
+SPAN_DAYS = 365
+
+
+def peak_rss_kb():
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def rss_kb():
+    # (current, peak) RSS in KiB from /proc, or None where there is no /proc.
+    try:
+        with open('/proc/self/status') as status:
+            fields = dict(line.split(':', 1) for line in status if line.startswith(('VmRSS', 'VmHWM')))
+        return int(fields['VmRSS'].split()[0]), int(fields['VmHWM'].split()[0])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def reset_peak_rss():
+    # Linux resets VmHWM to the current RSS on "5" in clear_refs.
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+@contextlib.contextmanager
+def memory_delta():
+    # Memory used by the block itself rather than the process-wide peak,
+    # which only ever grows and so credits one op with an earlier op's
+    # usage. Yields a dict filled in on exit with rss_delta_kb (RSS kept
+    # after the block) and peak_rss_delta_kb (highest RSS during the block
+    # above the RSS before it). Without /proc the peak falls back to the
+    # growth of ru_maxrss, which misses anything under an earlier peak.
+    memory = {}
+    before = rss_kb()
+    resettable = before is not None and reset_peak_rss()
+    peak_before = peak_rss_kb()
+    yield memory
+    after = rss_kb()
+    if before is not None and after is not None:
+        memory['rss_delta_kb'] = after[0] - before[0]
+    if resettable and after is not None:
+        memory['peak_rss_delta_kb'] = after[1] - before[0]
+    else:
+        memory['peak_rss_delta_kb'] = peak_rss_kb() - peak_before
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class SyntheticData:
+    # Faker is slow per call, so a vocabulary is drawn once and recombined.
+    def __init__(self, seed):
+        fake = Faker()
+        Faker.seed(seed)
+        self.random = random.Random(seed)
+        self.drugs = [fake.word().capitalize() + self.random.choice(['ol', 'ine', 'ex', 'ax', 'in'])
+                      for _ in range(500)]
+        self.messages = [fake.sentence(nb_words=6) for _ in range(200)]
+        self.first_names = [fake.first_name() for _ in range(200)]
+        self.last_names = [fake.last_name() for _ in range(200)]
+
+    def time(self):
+        offset = self.random.randrange(SPAN_DAYS * 24 * 60)
+        return (START + datetime.timedelta(minutes=offset)).strftime(TIME_FORMAT)
+
+    def medications(self, count, users):
+        for _ in range(count):
+            yield (self.random.randint(1, users), self.random.choice(self.drugs),
+                   f"{self.random.choice([5, 10, 20, 50, 100, 250, 500])}mg")
+
+    def users(self, count):
+        for _ in range(count):
+            yield (f"{self.random.choice(self.first_names)} {self.random.choice(self.last_names)}",)
+
+    def schedules(self, count, users):
+        for _ in range(count):
+            yield (self.random.randint(1, users), self.time())
+
+    def reminders(self, count, medications):
+        for _ in range(count):
+            yield (self.random.randint(1, medications), self.time(), self.random.choice(self.messages))
+
+
+class Benchmark:
+    def __init__(self, scale, samples, seed, path):
+        self.scale = scale
+        self.samples = samples
+        self.users = max(1, int(scale * USERS_PER_MEDICATION))
+        self.data = SyntheticData(seed)
+        self.random = random.Random(seed)
+        self.db = Database(path)
+        self.db.migrate()
+        self.medications = MedicationTrackerDB(self.db)
+        self.schedules = ScheduleManager(self.db)
+        self.reminders = ReminderManager(self.db)
+        self.results = {}
+
+    def record(self, name, latencies, rows=None, elapsed=None, memory=None):
+        elapsed = sum(latencies) if elapsed is None else elapsed
+        count = rows if rows is not None else len(latencies)
+        self.results[name] = {
+            'calls': len(latencies),
+            'rows': count,
+            'seconds': round(elapsed, 6),
+            'throughput_per_s': round(count / elapsed, 2) if elapsed else None,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 4),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 4),
+        }
+        self.results[name].update(memory or {})
+        print(f"{name:<28} {self.results[name]['throughput_per_s']:>12} rows/s  "
+              f"p50 {self.results[name]['p50_ms']:>9} ms  p99 {self.results[name]['p99_ms']:>9} ms",
+              file=sys.stderr)
+
+    def timed(self, name, call, repeat):
+        latencies = []
+        with contextlib.redirect_stdout(io.StringIO()) as sink, memory_delta() as memory:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                call()
+                latencies.append(time.perf_counter() - started)
+                sink.seek(0)
+                sink.truncate()
+        self.record(name, latencies, memory=memory)
+
+    def load(self):
+        plan = [
+            ('bulk_add_users', self.add_users_bulk, self.data.users(self.users)),
+            ('bulk_add_medications', self.medications.add_medications_bulk,
+             self.data.medications(self.scale, self.users)),
+            ('bulk_add_schedules', self.schedules.add_schedules_bulk,
+             self.data.schedules(self.scale * SCHEDULES_PER_MEDICATION, self.users)),
+            ('bulk_add_reminders', self.reminders.add_reminders_bulk,
+             self.data.reminders(self.scale * REMINDERS_PER_MEDICATION, self.scale)),
+        ]
+        for name, add_bulk, rows in plan:
+            with contextlib.redirect_stdout(io.StringIO()), memory_delta() as memory:
+                started = time.perf_counter()
+                result = add_bulk(rows)
+                elapsed = time.perf_counter() - started
+            self.record(name, [elapsed], rows=result.inserted, elapsed=elapsed, memory=memory)
+
+    def add_users_bulk(self, rows):
+        # The managers have no user writes, so users go in directly; ids
+        # 1..users are the ones the other generators draw from.
+        return self.db.insert_many('INSERT INTO user (Name) VALUES (?)', rows)
+
+    def window(self, hours):
+        start = datetime.datetime.strptime(self.data.time(), TIME_FORMAT)
+        return start.strftime(TIME_FORMAT), (start + datetime.timedelta(hours=hours)).strftime(TIME_FORMAT)
+
+    def run(self):
+        self.load()
+        rand = self.random
+
+        self.timed('add_medication', lambda: self.medications.add_medication(
+            rand.randint(1, self.users), rand.choice(self.data.drugs), '10mg'), self.samples)
+        self.timed('find_medication_user', lambda: self.medications.find_medication(
+            user_id=rand.randint(1, self.users)), self.samples)
+        self.timed('find_medication_name', lambda: self.medications.find_medication(
+            name=rand.choice(self.data.drugs)), max(1, self.samples // 10))
+        self.timed('find_schedule_user', lambda: self.schedules.find_schedule(
+            user_id=rand.randint(1, self.users)), self.samples)
+        self.timed('find_schedule_range_1h', lambda: self.schedules.find_schedule(
+            None, None, *self.window(1)), self.samples)
+        self.timed('find_schedule_user_range_1d', lambda: self.schedules.find_schedule(
+            rand.randint(1, self.users), None, *self.window(24)), self.samples)
+        self.timed('find_reminder_medication', lambda: self.reminders.find_reminder(
+            medication_id=rand.randint(1, self.scale)), self.samples)
+        self.timed('find_reminder_time', lambda: self.reminders.find_reminder(
+            time=self.data.time()), self.samples)
+
+        for name, rows in [('view_medication', self.medications.iter_medications),
+                           ('view_schedules', self.schedules.iter_schedules),
+                           ('view_reminders', self.reminders.iter_reminders)]:
+            with memory_delta() as memory:
+                started = time.perf_counter()
+                first = None
+                count = 0
+                for _ in rows():
+                    if first is None:
+                        first = time.perf_counter() - started
+                    count += 1
+                elapsed = time.perf_counter() - started
+            self.record(name, [elapsed], rows=count, elapsed=elapsed, memory=memory)
+            self.results[name]['first_row_ms'] = round((first or 0) * 1000, 4)
+        return self.results
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)['results']
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric, worse_when_higher in [('p50_ms', True), ('p99_ms', True), ('throughput_per_s', False)]:
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change > threshold) if worse_when_higher else (change < -threshold):
+                regressions.append(f"{name}.{metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the medication tracker managers.")
+    parser.add_argument('--scale', type=int, default=1000,
+                        help="Number of medications; schedules and reminders are generated at 3x")
+    parser.add_argument('--samples', type=int, default=200, help="Calls per timed operation")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', help="Database file to build (default: a temporary file)")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--compare', help="Baseline JSON to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Relative change counted as a regression (default 0.2)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = args.db or os.path.join(scratch, 'bench.db')
+        benchmark = Benchmark(args.scale, args.samples, args.seed, path)
+        results = benchmark.run()
+        benchmark.db.close()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'scale': args.scale,
+            'samples': args.samples,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'peak_rss_kb': peak_rss_kb(),
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
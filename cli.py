@@ -1,203 +1,25 @@
 # lib/cli.py
+import argparse
+import contextlib
+import io
+import json
 import sqlite3
-import datetime
-from models.reminder import ReminderManager
-from models.schedule import ScheduleManager
-from models.medication_tracker import MedicationTrackerDB
-
-def create_tables():
-    connection = sqlite3.connect("medicationtracker.db")
-    cursor = connection.cursor()
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS user(
-                      id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      Name TEXT NOT NULL
-                    )''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS medication (
-                      id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      Name TEXT NOT NULL,
-                      Dosage TEXT NOT NULL,
-                      user_id INTEGER,
-                      FOREIGN KEY (user_id) REFERENCES user(id)
-                    )''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS schedule (
-                      id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      user_id INTEGER,
-                      time TEXT NOT NULL,
-                      FOREIGN KEY (user_id) REFERENCES user(id)
-                    )''')
-    
-    cursor.execute('''CREATE TABLE IF NOT EXISTS reminder (
-                               id INTEGER PRIMARY KEY AUTOINCREMENT,
-                               medication_id INTEGER,
-                               time TEXT NOT NULL,
-                               message TEXT,
-                               FOREIGN KEY (medication_id) REFERENCES medication(id)
-                            )''')
-
-    connection.commit()
-    connection.close()
-
-create_tables()
-
-class MedicationTrackerDB:
-    def __init__(self):
-        self.connection = sqlite3.connect('medicationtracker.db')
-        self.cursor = self.connection.cursor()
-
-    def add_medication(self, user_id, name, dosage):
-        self.cursor.execute('INSERT INTO medication (user_id, Name, Dosage) VALUES (?, ?, ?)', 
-                            (user_id, name, dosage))
-        self.connection.commit()
-        print(f"Added medication: {name}, Dosage: {dosage} for User ID: {user_id}")
-
-    def view_medication(self):
-        self.cursor.execute('SELECT * FROM medication')
-        medications = self.cursor.fetchall()
-        for med in medications:
-            print(f"Medication ID: {med[0]}, Name: {med[1]}, Dosage: {med[2]}, User ID: {med[3]}")
-
-    def update_medication(self, med_id, name=None, dosage=None):
-        if name:
-            self.cursor.execute('UPDATE medication SET Name = ? WHERE id = ?', (name, med_id))
-        if dosage:
-            self.cursor.execute('UPDATE medication SET Dosage = ? WHERE id = ?', (dosage, med_id))
-        self.connection.commit()
-        print(f"Updated medication ID: {med_id}")
-
-    def find_medication(self, name=None, user_id=None):
-        if name and user_id:
-            self.cursor.execute('SELECT * FROM medication WHERE Name = ? AND user_id = ?', (name, user_id))
-        elif name:
-            self.cursor.execute('SELECT * FROM medication WHERE Name = ?', (name,))
-        elif user_id:
-            self.cursor.execute('SELECT * FROM medication WHERE user_id = ?', (user_id,))
-        medications = self.cursor.fetchall()
-        for med in medications:
-            print(f"Medication ID: {med[0]}, Name: {med[1]}, Dosage: {med[2]}, User ID: {med[3]}")
-        return medications
-
-    def delete_medication(self, med_id):
-        self.cursor.execute('DELETE FROM medication WHERE id = ?', (med_id,))
-        self.connection.commit()
-        print(f"Deleted medication with ID: {med_id}")
-
-    def close(self):
-        self.connection.close()
-
-class ScheduleManager:
-    def __init__(self):
-        self.connection = sqlite3.connect('medicationtracker.db')
-        self.cursor = self.connection.cursor()
-
-    def add_schedule(self, user_id, time):
-        try:
-            parsed_time = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('INSERT INTO schedule (user_id, time) VALUES (?, ?)', 
-                                (user_id, parsed_time))
-            self.connection.commit()
-            print(f"Added schedule for User ID: {user_id} at {parsed_time}")
-        except ValueError:
-            print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
-
-    def update_schedule(self, schedule_id, time):
-        try:
-            parsed_time = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('UPDATE schedule SET time = ? WHERE id = ?', 
-                                (parsed_time, schedule_id))
-            self.connection.commit()
-            print(f"Updated schedule ID: {schedule_id} to {parsed_time}")
-        except ValueError:
-            print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
-
-    def find_schedule(self, user_id=None, start_time=None, end_time=None):
-        if user_id:
-            self.cursor.execute('SELECT * FROM schedule WHERE user_id = ?', (user_id,))
-        elif start_time and end_time:
-            start_parsed = datetime.datetime.strptime(start_time, '%Y-%m-%d %H:%M')
-            end_parsed = datetime.datetime.strptime(end_time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('SELECT * FROM schedule WHERE time BETWEEN ? AND ?', 
-                                (start_parsed, end_parsed))
-        schedules = self.cursor.fetchall()
-        for sched in schedules:
-            print(f"Schedule ID: {sched[0]}, User ID: {sched[1]}, Time: {sched[2]}")
-        return schedules
-
-    def delete_schedule(self, schedule_id):
-        self.cursor.execute('DELETE FROM schedule WHERE id = ?', (schedule_id,))
-        self.connection.commit()
-        print(f"Deleted schedule with ID: {schedule_id}")
-
-    def view_schedules(self):
-        self.cursor.execute('SELECT * FROM schedule')
-        schedules = self.cursor.fetchall()
-        for sched in schedules:
-            print(f"Schedule ID: {sched[0]}, User ID: {sched[1]}, Time: {sched[2]}")
-
-    def close(self):
-        self.connection.close()
-
-    def add_reminder(self, medication_id, time, message):
-        try:
-            parsed_time = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('INSERT INTO reminder (medication_id, time, message) VALUES (?, ?, ?)', 
-                                (medication_id, parsed_time, message))
-            self.connection.commit()
-            print(f"Added reminder for Medication ID: {medication_id} at {parsed_time} with message: '{message}'")
-        except ValueError:
-            print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
-
-    def update_reminder(self, reminder_id, time=None, message=None):
-        try:
-            if time:
-                parsed_time = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M')
-                self.cursor.execute('UPDATE reminder SET time = ? WHERE id = ?', 
-                                    (parsed_time, reminder_id))
-            if message:
-                self.cursor.execute('UPDATE reminder SET message = ? WHERE id = ?', 
-                                    (message, reminder_id))
-            self.connection.commit()
-            print(f"Updated reminder ID: {reminder_id}")
-        except ValueError:
-            print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
-
-    def find_reminder(self, medication_id=None, time=None):
-        if medication_id and time:
-            parsed_time = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('SELECT * FROM reminder WHERE medication_id = ? AND time = ?', 
-                                (medication_id, parsed_time))
-        elif medication_id:
-            self.cursor.execute('SELECT * FROM reminder WHERE medication_id = ?', 
-                                (medication_id,))
-        elif time:
-            parsed_time = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('SELECT * FROM reminder WHERE time = ?', 
-                                (parsed_time,))
-        reminders = self.cursor.fetchall()
-        for reminder in reminders:
-            print(f"Reminder ID: {reminder[0]}, Medication ID: {reminder[1]}, Time: {reminder[2]}, Message: {reminder[3]}")
-        return reminders
-
-    def delete_reminder(self, reminder_id):
-        self.cursor.execute('DELETE FROM reminder WHERE id = ?', (reminder_id,))
-        self.connection.commit()
-        print(f"Deleted reminder with ID: {reminder_id}")
-
-    def view_reminders(self):
-        self.cursor.execute('SELECT * FROM reminder')
-        reminders = self.cursor.fetchall()
-        for reminder in reminders:
-            print(f"Reminder ID: {reminder[0]}, Medication ID: {reminder[1]}, Time: {reminder[2]}, Message: {reminder[3]}")
-
-    def close(self):
-        self.connection.close()
+import sys
+from models.database import init_db, close_databases, require_unsharded, BULK_CHUNK_SIZE
+from models.commands import Managers
 
 def main():
-    db = MedicationTrackerDB()
-    reminder_manager = ReminderManager()
-    schedule_manager = ScheduleManager()
+    try:
+        init_db()
+    except (RuntimeError, sqlite3.Error) as e:
+        print(f"An error occurred: {e}")
+        close_databases()
+        return
+    managers = Managers()
+    db = managers.medications
+    reminder_manager = managers.reminders
+    schedule_manager = managers.schedules
+    dose_log = managers.doses
 
     while True:
         menu()
@@ -207,6 +29,8 @@ def main():
             db.close()
             reminder_manager.close()
             schedule_manager.close()
+            dose_log.close()
+            close_databases()
             print("Exiting the program.")
             break
         elif choice == "1":
@@ -268,6 +92,36 @@ def main():
             time = input("Enter reminder time (YYYY-MM-DD HH:MM) to find reminders (or press enter to skip): ")
             reminder_manager.find_reminder(medication_id=int(medication_id) if medication_id else None, 
                                            time=time or None)
+        elif choice == "16":
+            user_id = int(input("Enter user ID: "))
+            start_time = input("Enter first dose time (YYYY-MM-DD HH:MM): ")
+            interval = input("Repeat every (e.g. 8h, 90m, 1d): ")
+            until = input("Enter end time (YYYY-MM-DD HH:MM) (or press enter for no end): ")
+            weekdays = input("Limit to days (e.g. weekdays, mon,wed,fri) (or press enter for every day): ")
+            schedule_manager.add_recurring_schedule(user_id, start_time, interval, until or None, weekdays or None)
+        elif choice == "17":
+            schedule_id = input("Enter schedule ID of the dose (or press enter if unscheduled): ")
+            rule_id = ""
+            if not schedule_id:
+                rule_id = input("Enter recurring schedule (rule) ID of the dose (or press enter to skip): ")
+            medication_id = input("Enter medication ID (or press enter to skip): ")
+            dose_time = input("Enter time the dose was taken (YYYY-MM-DD HH:MM): ")
+            status = input("Enter status (taken, skipped, missed) (or press enter for taken): ")
+            dose_log.record_dose(int(schedule_id) if schedule_id else None,
+                                 int(medication_id) if medication_id else None,
+                                 dose_time, status or "taken", int(rule_id) if rule_id else None)
+        elif choice == "18":
+            query = input("Enter part of a medication name or dosage: ")
+            user_id = input("Enter user ID to search within (or press enter to search everyone): ")
+            db.search_medications(query, int(user_id) if user_id else None)
+        elif choice == "19":
+            user_id = input("Enter user ID (or press enter to list a time window): ")
+            start_time = None
+            end_time = None
+            if not user_id:
+                start_time = input("Enter start time (YYYY-MM-DD HH:MM): ")
+                end_time = input("Enter end time (YYYY-MM-DD HH:MM): ")
+            managers.next_doses.find_next_doses(int(user_id) if user_id else None, start_time, end_time)
         else:
             print("Invalid choice. Please try again.")
 
@@ -289,6 +143,172 @@ def menu():
     print("13. Find schedule")
     print("14. Update reminder")
     print("15. Find reminder")
+    print("16. Add recurring schedule")
+    print("17. Record dose")
+    print("18. Search medications")
+    print("19. What's due next")
+
+def build_parser():
+    from models.commands import COMMANDS, BATCH_SIZE
+    from models.interactions import SEVERITIES
+    from models.transfer import KINDS, FORMATS
+
+    parser = argparse.ArgumentParser(description="Medication tracker. Run without arguments for the interactive menu.")
+    commands = parser.add_subparsers(dest="command")
+
+    for command in COMMANDS.values():
+        command_parser = commands.add_parser(command.name, help=command.help)
+        for argument in command.arguments:
+            command_parser.add_argument("--" + argument.name.replace("_", "-"), dest=argument.name,
+                                        type=argument.type, required=argument.required)
+        command_parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    batch_parser = commands.add_parser("batch", help="Run JSON Lines commands from stdin")
+    batch_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Commands per transaction")
+
+    audit_parser = commands.add_parser("audit-schedules", help="List doses scheduled too close together")
+    audit_parser.add_argument("--minutes", type=float, help="Gap to check (default: min_dose_gap_minutes)")
+    audit_parser.add_argument("--user-id", type=int, help="Only audit this user")
+
+    interactions_parser = commands.add_parser("audit-interactions",
+                                              help="Check every user's medications against the interactions dataset")
+    interactions_parser.add_argument("--user-id", type=int, help="Only audit this user")
+    interactions_parser.add_argument("--min-severity", choices=SEVERITIES, help="Ignore less severe interactions")
+
+    adherence_parser = commands.add_parser("adherence", help="Report dose adherence for a time window")
+    adherence_parser.add_argument("--start", required=True, help="Window start (YYYY-MM-DD HH:MM)")
+    adherence_parser.add_argument("--end", required=True, help="Window end (YYYY-MM-DD HH:MM)")
+    adherence_parser.add_argument("--grace-minutes", type=float, default=30, help="Doses taken later than this are late")
+    adherence_parser.add_argument("--users", help="Write per-user adherence as CSV to this file (- for stdout)")
+    adherence_parser.add_argument("--medications", help="Write per-medication adherence as CSV to this file")
+
+    import_parser = commands.add_parser("import", help="Load medications, schedules or reminders from CSV/JSONL")
+    import_parser.add_argument("kind", choices=sorted(KINDS))
+    import_parser.add_argument("path", help="File to read, or - for stdin")
+    import_parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension")
+    import_parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE, help="Rows per transaction")
+    import_parser.add_argument("--new-ids", action="store_true", help="Ignore ids in the file and assign new ones")
+
+    export_parser = commands.add_parser("export", help="Write medications, schedules or reminders as CSV/JSONL")
+    export_parser.add_argument("kind", choices=sorted(KINDS))
+    export_parser.add_argument("path", help="File to write, or - for stdout")
+    export_parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension")
+
+    changes_parser = commands.add_parser("changes", help="Write changes after a sequence number as JSON Lines")
+    changes_parser.add_argument("--since", type=int, default=0, help="Last sequence number already applied")
+    changes_parser.add_argument("--kind", action="append", choices=sorted(KINDS), help="Only these kinds (repeatable)")
+    changes_parser.add_argument("--output", default="-", help="File to write, or - for stdout")
+
+    prune_parser = commands.add_parser("prune-changes", help="Delete old change log entries")
+    prune_parser.add_argument("--before-seq", type=int, help="Delete changes before this sequence number")
+    prune_parser.add_argument("--keep-days", type=float, help="Delete changes older than this many days")
+
+    backup_parser = commands.add_parser("backup", help="Copy the live database to a file")
+    backup_parser.add_argument("path", help="File to write")
+    backup_parser.add_argument("--verify", action="store_true", help="Run an integrity check on the copy")
+
+    snapshot_parser = commands.add_parser("snapshot", help="Take timestamped backups into a directory")
+    snapshot_parser.add_argument("--dir", required=True, help="Directory for the snapshots")
+    snapshot_parser.add_argument("--keep", type=int, help="Keep only this many newest snapshots")
+    snapshot_parser.add_argument("--every", help="Keep running and snapshot at this interval (e.g. 6h, 1d)")
+
+    restore_parser = commands.add_parser("restore", help="Replace the database with a checked backup")
+    restore_parser.add_argument("path", help="Backup file to restore")
+
+    archive_parser = commands.add_parser("archive", help="Move old schedules and reminders to the archive file")
+    archive_parser.add_argument("--retention-days", type=float,
+                                help="Archive rows older than this many days (default: archive_retention_days)")
+    archive_parser.add_argument("--batch-size", type=int, default=5000, help="Rows moved per transaction")
+    return parser
+
+# Commands that read or write one database file directly.
+UNSHARDED_COMMANDS = ("import", "export", "changes", "prune-changes", "adherence")
+
+def run_command(args):
+    from models.commands import COMMANDS, run_batch
+    from models.commands import run_command as run_named_command
+    from models.transfer import import_file, export_file
+
+    try:
+        # stdout carries command results, so setup messages go to stderr.
+        with contextlib.redirect_stdout(sys.stderr):
+            init_db()
+        if args.command in UNSHARDED_COMMANDS:
+            require_unsharded(args.command)
+        if args.command in COMMANDS:
+            if args.json:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    outcome = run_named_command(Managers(), args.command, vars(args))
+                print(json.dumps(outcome))
+                return 0 if outcome["ok"] else 1
+            managers = Managers()
+            views = {"view-medications": managers.medications.view_medication,
+                     "view-reminders": managers.reminders.view_reminders,
+                     "view-schedules": managers.schedules.view_schedules}
+            if args.command in views:
+                views[args.command]()
+                return 0
+            return 0 if COMMANDS[args.command].run(managers, vars(args)) is not None else 1
+        if args.command == "audit-schedules":
+            return 1 if Managers().schedules.audit_conflicts(args.minutes, args.user_id) else 0
+        if args.command == "audit-interactions":
+            return 1 if Managers().medications.audit_interactions(args.user_id, args.min_severity) else 0
+        if args.command == "adherence":
+            from models.adherence import report
+            from models.timeutil import parse_time, to_epoch
+            report(to_epoch(parse_time(args.start)), to_epoch(parse_time(args.end)),
+                   args.grace_minutes, args.users, args.medications)
+            return 0
+        if args.command == "batch":
+            return 1 if run_batch(batch_size=args.batch_size) else 0
+        if args.command == "import":
+            result = import_file(args.kind, args.path, args.format, args.chunk_size, keep_ids=not args.new_ids)
+            return 1 if result.failures else 0
+        if args.command == "export":
+            export_file(args.kind, args.path, args.format)
+            return 0
+        if args.command == "changes":
+            from models.change_log import ChangeLogManager
+            ChangeLogManager().export_changes(args.since, args.output, args.kind)
+            return 0
+        if args.command == "prune-changes":
+            from models.change_log import ChangeLogManager
+            with contextlib.redirect_stdout(sys.stderr):
+                ChangeLogManager().prune_changes(args.before_seq, args.keep_days)
+            return 0
+        if args.command == "backup":
+            from models.backup import backup
+            backup(args.path, verify=args.verify)
+            return 0
+        if args.command == "snapshot":
+            from models.backup import snapshot, SnapshotScheduler
+            if not args.every:
+                snapshot(args.dir, args.keep)
+                return 0
+            scheduler = SnapshotScheduler(args.dir, args.every, args.keep)
+            try:
+                scheduler.run()
+            except KeyboardInterrupt:
+                scheduler.stop()
+                print("Snapshots stopped.")
+            return 0
+        if args.command == "restore":
+            from models.backup import restore
+            restore(args.path)
+            return 0
+        if args.command == "archive":
+            from models.archive import archive_old_rows
+            managers = Managers()
+            for database in managers.shards.databases if managers.shards is not None else [None]:
+                archive_old_rows(args.retention_days, batch_size=args.batch_size, db=database)
+            return 0
+    except (OSError, ValueError, RuntimeError, sqlite3.Error) as e:
+        print(f"An error occurred: {e}", file=sys.stderr)
+        return 1
+    finally:
+        close_databases()
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_command(build_parser().parse_args()))
     main()    
\ No newline at end of file
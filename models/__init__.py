@@ -1,4 +1,15 @@
 import sqlite3
 
-CONN = sqlite3.connect('medication_tracker.db')
-CURSOR = CONN.cursor()
+_debug = {}
+
+
+def __getattr__(name):
+    # CONN/CURSOR are for the debug console; they are opened on first use
+    # rather than whenever anything under models/ is imported.
+    if name in ('CONN', 'CURSOR'):
+        if not _debug:
+            from models.config import load_config
+            _debug['CONN'] = sqlite3.connect(load_config().path)
+            _debug['CURSOR'] = _debug['CONN'].cursor()
+        return _debug[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,241 @@
+# models/adherence.py
+#
+# Adherence reports over a time window, computed on NumPy columns rather
+# than per-row Python loops:
+#
+#   python cli.py adherence --start "2024-01-01 00:00" --end "2024-02-01 00:00" \
+#       --users users.csv --medications medications.csv
+#
+# Due doses are the schedule rows in the window plus the occurrences of
+# recurring schedule rules in it. A due dose counts as taken when a 'taken'
+# dose_event points at it (a rule dose by its rule_id and due time);
+# anything else (skipped, missed or never logged) counts against adherence.
+# Schedules carry no medication, so per-medication rates are taken / logged
+# events for that medication. Schedules moved to the archive (see
+# models/archive.py) are read back for the part of the window before the
+# archive horizon.
+import csv
+import json
+import sys
+from collections import namedtuple
+import numpy as np
+from models.archive import horizon, iter_archived
+from models.database import get_database
+
+STATUS_CODES = {'taken': 0, 'skipped': 1, 'missed': 2}
+
+# Lateness of taken doses in minutes; the first bucket is "early".
+LATE_EDGES_MINUTES = (-np.inf, 0, 5, 15, 30, 60, 120, 240, np.inf)
+LATE_LABELS = ('early', '0-5m', '5-15m', '15-30m', '30-60m', '1-2h', '2-4h', '4h+')
+DEFAULT_GRACE_MINUTES = 30
+
+DoseWindow = namedtuple('DoseWindow', ['start', 'end', 'schedules', 'events'])
+UserAdherence = namedtuple('UserAdherence', ['user_id', 'due', 'taken', 'rate', 'late', 'mean_delay_minutes',
+                                             'longest_missed_streak', 'current_missed_streak'])
+MedicationAdherence = namedtuple('MedicationAdherence', ['medication_id', 'events', 'taken', 'rate'])
+
+
+def _columns(rows, names):
+    # One int64 column per name; NULL ids load as -1.
+    table = np.array(rows, dtype=np.int64).reshape(-1, len(names))
+    return {name: table[:, index] for index, name in enumerate(names)}
+
+
+def _rule_doses(rules, start, end):
+    # (rule_id, user_id, due) rows for every occurrence of the rules in
+    # [start, end], like recurrence.expand but one array per rule.
+    doses = []
+    for rule_id, user_id, first, until, interval, weekdays in rules:
+        if start > first:
+            first += -(-(start - first) // interval) * interval
+        last = end if until is None else min(end, until)
+        due = np.arange(first, last + 1, interval, dtype=np.int64)
+        if weekdays:
+            due = due[(weekdays >> ((due // 86400 + 3) % 7)) & 1 == 1]
+        doses.append(np.column_stack([np.full(len(due), rule_id), np.full(len(due), user_id), due]))
+    return np.concatenate(doses) if doses else np.empty((0, 3), dtype=np.int64)
+
+
+def load_window(start, end, db=None):
+    # Both reads share one transaction so events and schedules come from the
+    # same snapshot. Times are epoch seconds.
+    db = db or get_database()
+    with db.connection() as connection:
+        began = not connection.in_transaction
+        if began:
+            connection.execute('BEGIN')
+        try:
+            schedules = connection.execute(
+                'SELECT id, COALESCE(user_id, -1), time FROM schedule WHERE time BETWEEN ? AND ?',
+                (start, end)).fetchall()
+            rules = connection.execute(
+                '''SELECT id, COALESCE(user_id, -1), start, until, interval_seconds, weekdays FROM schedule_rule
+                   WHERE start <= ? AND (until IS NULL OR until >= ?)''',
+                (end, start)).fetchall()
+            events = connection.execute(
+                '''SELECT COALESCE(schedule_id, -1), COALESCE(rule_id, -1), COALESCE(medication_id, -1),
+                          COALESCE(user_id, -1), due, time,
+                          CASE status WHEN 'taken' THEN 0 WHEN 'skipped' THEN 1 ELSE 2 END
+                   FROM dose_event WHERE due BETWEEN ? AND ?''',
+                (start, end)).fetchall()
+        finally:
+            if began:
+                connection.rollback()
+    cutoff = horizon(db, 'schedule')
+    if cutoff is not None and start < cutoff:
+        # A row caught in both places by an interrupted archive run counts once.
+        live = {row[0] for row in schedules}
+        schedules += [(schedule_id, -1 if user_id is None else user_id, time)
+                      for schedule_id, user_id, time in iter_archived(db, 'schedule', start, min(end, cutoff - 1))
+                      if schedule_id not in live]
+    schedules = _columns(schedules, ['id', 'user_id', 'due'])
+    schedules['rule_id'] = np.full(len(schedules['id']), -1, dtype=np.int64)
+    # Rule occurrences have no schedule row, so their id is -1.
+    occurrences = _columns(_rule_doses(rules, start, end), ['rule_id', 'user_id', 'due'])
+    occurrences['id'] = np.full(len(occurrences['due']), -1, dtype=np.int64)
+    return DoseWindow(start, end,
+                      {name: np.concatenate([schedules[name], occurrences[name]]) for name in schedules},
+                      _columns(events, ['schedule_id', 'rule_id', 'medication_id', 'user_id', 'due', 'time',
+                                        'status']))
+
+
+def _rule_keys(window, rule_ids, due):
+    # One int64 per (rule_id, due) pair; rule ids are made dense first so
+    # sharded ids do not overflow.
+    _, dense = np.unique(rule_ids, return_inverse=True)
+    return dense * (window.end - window.start + 1) + (due - window.start)
+
+
+def _taken_mask(window):
+    events = window.events
+    schedules = window.schedules
+    taken = events['status'] == STATUS_CODES['taken']
+    taken_ids = events['schedule_id'][taken & (events['schedule_id'] >= 0)]
+    mask = np.isin(schedules['id'], taken_ids)
+
+    # Rule doses match on (rule_id, due).
+    rule_events = taken & (events['rule_id'] >= 0)
+    rule_doses = np.flatnonzero(schedules['rule_id'] >= 0)
+    keys = _rule_keys(window, np.concatenate([schedules['rule_id'][rule_doses], events['rule_id'][rule_events]]),
+                      np.concatenate([schedules['due'][rule_doses], events['due'][rule_events]]))
+    mask[rule_doses] = np.isin(keys[:len(rule_doses)], keys[len(rule_doses):])
+    return mask
+
+
+def _taken_delays(window):
+    # Minutes between due and taken for scheduled or rule doses that were taken.
+    events = window.events
+    taken = (events['status'] == STATUS_CODES['taken']) & ((events['schedule_id'] >= 0) | (events['rule_id'] >= 0))
+    return events['user_id'][taken], (events['time'][taken] - events['due'][taken]) / 60.0
+
+
+def missed_streaks(user_index, due, taken, users):
+    # Longest and trailing runs of consecutive untaken doses per user, in due
+    # order. A new run starts at every taken dose and at every user boundary.
+    longest = np.zeros(users, dtype=np.int64)
+    current = np.zeros(users, dtype=np.int64)
+    if len(due) == 0:
+        return longest, current
+    order = np.lexsort((due, user_index))
+    user_sorted = user_index[order]
+    missed = ~taken[order]
+    boundary = np.ones(len(order), dtype=bool)
+    boundary[1:] = user_sorted[1:] != user_sorted[:-1]
+    runs = np.cumsum(boundary | ~missed) - 1
+    run_lengths = np.bincount(runs, weights=missed).astype(np.int64)
+    run_users = user_sorted[np.flatnonzero(boundary | ~missed)]
+    np.maximum.at(longest, run_users, run_lengths)
+    last_in_user = np.append(np.flatnonzero(boundary[1:]), len(order) - 1)
+    current[user_sorted[last_in_user]] = run_lengths[runs[last_in_user]]
+    return longest, current
+
+
+def adherence_by_user(window, grace_minutes=DEFAULT_GRACE_MINUTES):
+    schedules = window.schedules
+    user_ids, user_index = np.unique(schedules['user_id'], return_inverse=True)
+    users = len(user_ids)
+    taken = _taken_mask(window)
+    due = np.bincount(user_index, minlength=users)
+    taken_count = np.bincount(user_index, weights=taken, minlength=users).astype(np.int64)
+
+    delay_users, delays = _taken_delays(window)
+    # Delays of doses whose schedule has since moved out of the window are dropped.
+    known = np.isin(delay_users, user_ids)
+    position = np.searchsorted(user_ids, delay_users[known])
+    delays = delays[known]
+    delay_count = np.bincount(position, minlength=users)
+    delay_sum = np.bincount(position, weights=delays, minlength=users)
+    late = np.bincount(position, weights=delays > grace_minutes, minlength=users).astype(np.int64)
+
+    longest, current = missed_streaks(user_index, schedules['due'], taken, users)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = taken_count / due
+        mean_delay = np.where(delay_count > 0, delay_sum / np.maximum(delay_count, 1), np.nan)
+    return UserAdherence(user_ids, due, taken_count, rate, late, mean_delay, longest, current)
+
+
+def adherence_by_medication(window):
+    events = window.events
+    scoped = events['medication_id'] >= 0
+    medication_ids, index = np.unique(events['medication_id'][scoped], return_inverse=True)
+    total = np.bincount(index, minlength=len(medication_ids))
+    taken = np.bincount(index, weights=events['status'][scoped] == STATUS_CODES['taken'],
+                        minlength=len(medication_ids)).astype(np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = taken / total
+    return MedicationAdherence(medication_ids, total, taken, rate)
+
+
+def late_dose_distribution(window):
+    _, delays = _taken_delays(window)
+    counts, _ = np.histogram(delays, bins=LATE_EDGES_MINUTES)
+    percentiles = np.percentile(delays, [50, 90, 99]).round(2).tolist() if len(delays) else [None] * 3
+    return {
+        'buckets': dict(zip(LATE_LABELS, counts.tolist())),
+        'p50_minutes': percentiles[0],
+        'p90_minutes': percentiles[1],
+        'p99_minutes': percentiles[2],
+    }
+
+
+def summary(window, users, medications):
+    due = int(users.due.sum())
+    taken = int(users.taken.sum())
+    return {
+        'window': [int(window.start), int(window.end)],
+        'users': len(users.user_id),
+        'medications': len(medications.medication_id),
+        'due_doses': due,
+        'taken_doses': taken,
+        'adherence': round(taken / due, 4) if due else None,
+        'late_doses': int(users.late.sum()),
+        'late_distribution': late_dose_distribution(window),
+        'users_with_missed_streak_3_plus': int((users.longest_missed_streak >= 3).sum()),
+        'longest_missed_streak': int(users.longest_missed_streak.max()) if len(users.user_id) else 0,
+    }
+
+
+def write_table(table, path):
+    # One CSV row per entry of a UserAdherence/MedicationAdherence table.
+    output = sys.stdout if path == '-' else open(path, 'w', newline='')
+    try:
+        writer = csv.writer(output)
+        writer.writerow(table._fields)
+        columns = [column.round(4) if column.dtype.kind == 'f' else column for column in table]
+        writer.writerows(zip(*[column.tolist() for column in columns]))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def report(start, end, grace_minutes=DEFAULT_GRACE_MINUTES, users_path=None, medications_path=None, db=None):
+    window = load_window(start, end, db)
+    users = adherence_by_user(window, grace_minutes)
+    medications = adherence_by_medication(window)
+    if users_path:
+        write_table(users, users_path)
+    if medications_path:
+        write_table(medications, medications_path)
+    result = summary(window, users, medications)
+    print(json.dumps(result, indent=2))
+    return result
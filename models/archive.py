@@ -0,0 +1,210 @@
+# models/archive.py
+#
+# Hot/cold archival. Schedules and reminders older than the retention
+# window move out of the live tables into a separate archive file
+# (archive_path, default medicationtracker.archive.db next to the database):
+#
+#   python cli.py archive --retention-days 180
+#
+# The archive holds blocks of up to ARCHIVE_BATCH_SIZE rows, sorted by
+# time, as zlib-compressed JSON, with each block's time span and owners
+# (user or medication) indexed. The job moves one block per short
+# transaction, so writers are never locked out for long.
+#
+# iter_schedules and iter_reminders (and so find_schedule/find_reminder)
+# merge archived rows back in when, and only when, a requested time range
+# starts before the archive horizon; other queries never open the file.
+# Archived rows are streamed too: only the blocks overlapping the current
+# position are decompressed at a time.
+import heapq
+import json
+import os
+import sqlite3
+import time
+import zlib
+from models.database import connect, get_database
+from models.records import schedule_from_row, reminder_from_row
+from models.schedule_index import get_schedule_index
+from models.timeutil import now_epoch
+
+ARCHIVE_BATCH_SIZE = 5000
+ARCHIVE_PAUSE = 0.05
+
+# table -> (columns in row order, owner column, row converter)
+ARCHIVED_TABLES = {
+    'schedule': (('id', 'user_id', 'time'), 'user_id', schedule_from_row),
+    'reminder': (('id', 'medication_id', 'time', 'message'), 'medication_id', reminder_from_row),
+}
+
+ARCHIVE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS archive.archive_block (
+           id INTEGER PRIMARY KEY,
+           table_name TEXT NOT NULL,
+           min_time INTEGER NOT NULL,
+           max_time INTEGER NOT NULL,
+           row_count INTEGER NOT NULL,
+           data BLOB NOT NULL
+       )''',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archive_block_span ON archive_block (table_name, max_time, min_time)',
+    '''CREATE TABLE IF NOT EXISTS archive.archive_block_owner (
+           table_name TEXT NOT NULL,
+           owner INTEGER NOT NULL,
+           block_id INTEGER NOT NULL,
+           PRIMARY KEY (table_name, owner, block_id)
+       ) WITHOUT ROWID''',
+]
+
+
+def archive_file(path, config):
+    # The archive of the database file at path. Each shard keeps its own
+    # archive, named after the shard.
+    stem, extension = os.path.splitext(path)
+    if not config.archive_path:
+        return f'{stem}.archive{extension or ".db"}'
+    if config.shards > 1:
+        archive_stem, archive_extension = os.path.splitext(config.archive_path)
+        return f'{archive_stem}{os.path.splitext(stem)[1]}{archive_extension or ".db"}'
+    return config.archive_path
+
+
+def archive_path(db):
+    return archive_file(db.path, db.config)
+
+
+def _move_block(connection, table, cutoff, batch_size):
+    # Moves the oldest batch_size rows older than cutoff into one archive
+    # block, in one transaction. Returns the number of rows moved.
+    columns, owner_column, _ = ARCHIVED_TABLES[table]
+    owner_index = columns.index(owner_column)
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        rows = connection.execute(f'SELECT {", ".join(columns)} FROM main.{table} WHERE time < ? '
+                                  f'ORDER BY time, id LIMIT ?', (cutoff, batch_size)).fetchall()
+        if rows:
+            last_time, last_id = rows[-1][2], rows[-1][0]
+            block_id = connection.execute(
+                'INSERT INTO archive.archive_block (table_name, min_time, max_time, row_count, data) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (table, rows[0][2], last_time, len(rows),
+                 zlib.compress(json.dumps([list(row) for row in rows]).encode()))).lastrowid
+            owners = {row[owner_index] for row in rows if row[owner_index] is not None}
+            connection.executemany('INSERT INTO archive.archive_block_owner (table_name, owner, block_id) '
+                                   'VALUES (?, ?, ?)', [(table, owner, block_id) for owner in owners])
+            # Archiving is not a deletion for downstream sync, so the
+            # change_log entries the delete triggers write are dropped.
+            last_seq = connection.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'change_log'").fetchone()[0]
+            connection.execute(f'DELETE FROM main.{table} WHERE time < ? AND (time, id) <= (?, ?)',
+                               (cutoff, last_time, last_id))
+            connection.execute('DELETE FROM main.change_log WHERE seq > ?', (last_seq,))
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    return len(rows)
+
+
+def archive_old_rows(retention_days=None, before=None, batch_size=ARCHIVE_BATCH_SIZE, pause=ARCHIVE_PAUSE,
+                     db=None):
+    # Moves schedules and reminders with time < before (default: older than
+    # retention_days, or the archive_retention_days setting) to the archive.
+    # Returns {table: rows moved}.
+    db = db or get_database()
+    if before is None:
+        days = db.config.archive_retention_days if retention_days is None else retention_days
+        before = now_epoch() - int(days * 86400)
+    connection = connect(db.path, db.config, isolation_level=None)
+    moved = {}
+    try:
+        connection.execute('ATTACH DATABASE ? AS archive', (archive_path(db),))
+        for statement in ARCHIVE_SCHEMA:
+            connection.execute(statement)
+        for table in ARCHIVED_TABLES:
+            # The horizon moves first, so readers look in the archive before
+            # any row has left the live table.
+            connection.execute('INSERT INTO main.archive_horizon (table_name, before) VALUES (?, ?) '
+                               'ON CONFLICT (table_name) DO UPDATE SET before = MAX(before, excluded.before)',
+                               (table, before))
+            moved[table] = 0
+            while True:
+                count = _move_block(connection, table, before, batch_size)
+                moved[table] += count
+                if count < batch_size:
+                    break
+                time.sleep(pause)
+    finally:
+        connection.close()
+    if moved.get('schedule'):
+        get_schedule_index(db).clear()
+    print(f"Archived {moved.get('schedule', 0)} schedules and {moved.get('reminder', 0)} reminders "
+          f"to {archive_path(db)}")
+    return moved
+
+
+def horizon(db, table):
+    row = db.query_one('SELECT before FROM archive_horizon WHERE table_name = ?', (table,))
+    return row[0] if row else None
+
+
+def archived_rows(db, table, start, end, owner=None):
+    # Archived rows of table with start <= time <= end (and the given
+    # owner), as records in (time, id) order.
+    return map(ARCHIVED_TABLES[table][2], iter_archived(db, table, start, end, owner))
+
+
+def iter_archived(db, table, start, end, owner=None):
+    # archived_rows as plain rows in the ARCHIVED_TABLES column order.
+    # Blocks are opened in min_time order and a row is yielded once no
+    # unopened block can hold an earlier one, so memory stays at the blocks
+    # overlapping the current time.
+    path = archive_path(db)
+    if not os.path.exists(path):
+        return
+    columns, owner_column, _ = ARCHIVED_TABLES[table]
+    owner_index = columns.index(owner_column)
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        # Block list and block data come from one snapshot.
+        connection.execute('BEGIN')
+        if owner is None:
+            blocks = connection.execute('SELECT id, min_time FROM archive_block WHERE table_name = ? '
+                                        'AND max_time >= ? AND min_time <= ? ORDER BY min_time, id',
+                                        (table, start, end)).fetchall()
+        else:
+            blocks = connection.execute('''SELECT b.id, b.min_time FROM archive_block_owner o
+                                           JOIN archive_block b ON b.id = o.block_id
+                                           WHERE o.table_name = ? AND o.owner = ?
+                                                 AND b.max_time >= ? AND b.min_time <= ?
+                                           ORDER BY b.min_time, b.id''', (table, owner, start, end)).fetchall()
+        pending = []
+        for block_id, min_time in blocks:
+            while pending and pending[0][0] < min_time:
+                yield heapq.heappop(pending)[2]
+            data, = connection.execute('SELECT data FROM archive_block WHERE id = ?', (block_id,)).fetchone()
+            for row in json.loads(zlib.decompress(data)):
+                if start <= row[2] <= end and (owner is None or row[owner_index] == owner):
+                    heapq.heappush(pending, (row[2], row[0], row))
+        while pending:
+            yield heapq.heappop(pending)[2]
+    finally:
+        connection.close()
+
+
+def with_archived(db, table, records, owner, start, end):
+    # records (live rows in (time, id) order) with the archived rows in the
+    # same range merged in lazily, if the range reaches below the horizon.
+    # A row caught in both places by an interrupted archive run is yielded
+    # once.
+    cutoff = horizon(db, table)
+    if cutoff is None or start >= cutoff:
+        return records
+    archived = archived_rows(db, table, start, min(end, cutoff - 1), owner)
+    return _unique(heapq.merge(archived, records, key=lambda record: (record.time, record.id)))
+
+
+def _unique(records):
+    previous = None
+    for record in records:
+        if previous is None or (record.time, record.id) != (previous.time, previous.id):
+            yield record
+        previous = record
@@ -0,0 +1,160 @@
+# models/async_managers.py
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from models.database import get_database, PAGE_SIZE
+from models.medication_tracker import MedicationTrackerDB
+from models.reminder import ReminderManager
+from models.schedule import ScheduleManager
+
+
+class DatabaseExecutors:
+    # Reads run on a pool as wide as the connection pool; writes share one
+    # thread so they reach SQLite one at a time instead of fighting over the
+    # write lock.
+    def __init__(self, db):
+        self.reader = ThreadPoolExecutor(max_workers=db.pool.size, thread_name_prefix='db-read')
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-write')
+
+    def shutdown(self, wait=True):
+        self.reader.shutdown(wait=wait)
+        self.writer.shutdown(wait=wait)
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executors(db):
+    with _executors_lock:
+        executors = _executors.get(db.path)
+        if executors is None:
+            executors = DatabaseExecutors(db)
+            _executors[db.path] = executors
+        return executors
+
+
+def shutdown_executors(wait=True):
+    with _executors_lock:
+        for executors in _executors.values():
+            executors.shutdown(wait)
+        _executors.clear()
+
+
+class AsyncManager:
+    manager_class = None
+
+    def __init__(self, db=None):
+        self.db = db or get_database()
+        self.manager = self.manager_class(self.db)
+        self.executors = get_executors(self.db)
+
+    async def _run(self, executor, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(method, *args, **kwargs))
+
+    async def _read(self, method, *args, **kwargs):
+        return await self._run(self.executors.reader, method, *args, **kwargs)
+
+    async def _write(self, method, *args, **kwargs):
+        return await self._run(self.executors.writer, method, *args, **kwargs)
+
+    async def _stream(self, rows, page_size=PAGE_SIZE):
+        # Pulls a page at a time from a blocking generator on the read pool.
+        while True:
+            page = await self._read(lambda: list(islice(rows, page_size)))
+            for row in page:
+                yield row
+            if len(page) < page_size:
+                return
+
+    async def close(self):
+        self.manager.close()
+
+
+class AsyncMedicationTrackerDB(AsyncManager):
+    manager_class = MedicationTrackerDB
+
+    async def add_medication(self, user_id, name, dosage):
+        return await self._write(self.manager.add_medication, user_id, name, dosage)
+
+    async def add_medications_bulk(self, medications, **kwargs):
+        return await self._write(self.manager.add_medications_bulk, medications, **kwargs)
+
+    async def update_medication(self, med_id, name=None, dosage=None):
+        return await self._write(self.manager.update_medication, med_id, name, dosage)
+
+    async def delete_medication(self, med_id):
+        return await self._write(self.manager.delete_medication, med_id)
+
+    async def find_medication(self, name=None, user_id=None):
+        return await self._read(self.manager.find_medication, name, user_id)
+
+    async def view_medication(self):
+        return await self._read(self.manager.view_medication)
+
+    async def iter_medications(self, name=None, user_id=None, page_size=PAGE_SIZE):
+        async for med in self._stream(self.manager.iter_medications(name, user_id, page_size), page_size):
+            yield med
+
+
+class AsyncScheduleManager(AsyncManager):
+    manager_class = ScheduleManager
+
+    async def add_schedule(self, user_id, schedule_time):
+        return await self._write(self.manager.add_schedule, user_id, schedule_time)
+
+    async def add_schedules_bulk(self, schedules, **kwargs):
+        return await self._write(self.manager.add_schedules_bulk, schedules, **kwargs)
+
+    async def add_recurring_schedule(self, user_id, start_time, interval, until=None, weekdays=None):
+        return await self._write(self.manager.add_recurring_schedule, user_id, start_time, interval, until, weekdays)
+
+    async def update_schedule(self, schedule_id, new_time):
+        return await self._write(self.manager.update_schedule, schedule_id, new_time)
+
+    async def delete_schedule(self, schedule_id):
+        return await self._write(self.manager.delete_schedule, schedule_id)
+
+    async def delete_schedule_rule(self, rule_id):
+        return await self._write(self.manager.delete_schedule_rule, rule_id)
+
+    async def find_schedule(self, user_id=None, time=None, start_time=None, end_time=None):
+        return await self._read(self.manager.find_schedule, user_id, time, start_time, end_time)
+
+    async def view_schedules(self):
+        return await self._read(self.manager.view_schedules)
+
+    async def iter_schedules(self, user_id=None, time=None, start_time=None, end_time=None, page_size=PAGE_SIZE):
+        rows = self.manager.iter_schedules(user_id, time, start_time, end_time, page_size)
+        async for schedule in self._stream(rows, page_size):
+            yield schedule
+
+
+class AsyncReminderManager(AsyncManager):
+    manager_class = ReminderManager
+
+    async def add_reminder(self, medication_id, reminder_time, message):
+        return await self._write(self.manager.add_reminder, medication_id, reminder_time, message)
+
+    async def add_reminders_bulk(self, reminders, **kwargs):
+        return await self._write(self.manager.add_reminders_bulk, reminders, **kwargs)
+
+    async def update_reminder(self, reminder_id, new_time=None, new_message=None):
+        return await self._write(self.manager.update_reminder, reminder_id, new_time, new_message)
+
+    async def delete_reminder(self, reminder_id):
+        return await self._write(self.manager.delete_reminder, reminder_id)
+
+    async def find_reminder(self, medication_id=None, time=None, start_time=None, end_time=None):
+        return await self._read(self.manager.find_reminder, medication_id, time, start_time, end_time)
+
+    async def view_reminders(self):
+        return await self._read(self.manager.view_reminders)
+
+    async def iter_reminders(self, medication_id=None, time=None, start_time=None, end_time=None, page_size=PAGE_SIZE):
+        rows = self.manager.iter_reminders(medication_id, time, start_time, end_time, page_size)
+        async for rem in self._stream(rows, page_size):
+            yield rem
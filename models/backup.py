@@ -0,0 +1,254 @@
+# models/backup.py
+#
+# Online backups through SQLite's backup API, safe while other connections
+# and processes keep writing:
+#
+#   python cli.py backup medicationtracker-copy.db
+#   python cli.py snapshot --dir backups --keep 7 --every 6h
+#   python cli.py restore backups/medicationtracker-20240101-060000.db
+#
+# Pages are copied backup_pages at a time with a backup_sleep_ms pause
+# between batches. In WAL mode the copy reads from one snapshot held open
+# for its whole length: writers carry on into the WAL and the copy never
+# has to restart. In the other journal modes a held read lock would block
+# writers, so each batch takes its own lock and SQLite restarts the copy if
+# another connection commits in between.
+#
+# In sharded mode each command covers every shard, one file per shard.
+# A database's archive (see models/archive.py) is copied along with it, to
+# the backup file's name with .archive before the extension.
+import datetime
+import os
+import re
+import sqlite3
+import threading
+import time
+from models import migrations
+from models.archive import archive_file, archive_path
+from models.change_log import read_log_state, record_rewind
+from models.config import load_config
+from models.database import connect, get_database, init_db, close_databases
+from models.recurrence import parse_interval
+
+SNAPSHOT_TIME_FORMAT = '%Y%m%d-%H%M%S'
+
+
+def _pause(sleep_ms):
+    def progress(status, remaining, total):
+        if remaining and sleep_ms:
+            time.sleep(sleep_ms / 1000)
+
+    return progress
+
+
+def _copy(source, target, pages, sleep_ms):
+    source.backup(target, pages=pages or -1, progress=_pause(sleep_ms))
+
+
+def check_integrity(path):
+    # The problems PRAGMA integrity_check finds in the file at path, or an
+    # empty list if it is sound.
+    if not os.path.exists(path):
+        return [f"{path} does not exist"]
+    try:
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            problems = [row[0] for row in connection.execute('PRAGMA integrity_check')]
+            version = migrations.schema_version(connection)
+        finally:
+            connection.close()
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+    if problems == ['ok']:
+        problems = []
+    if version > migrations.LATEST_VERSION:
+        problems.append(f"Schema version {version} is newer than this code ({migrations.LATEST_VERSION})")
+    return problems
+
+
+def _files(path, db=None):
+    # The (Database, file) pairs a backup at path is made of: in sharded
+    # mode one per shard, named from path the way shard_paths names the
+    # shard files, else just db (or the shared Database) and path.
+    if db is None:
+        config = load_config()
+        if config.shards > 1:
+            from models.sharding import get_shard_set, shard_paths
+            return list(zip(get_shard_set(config).databases, shard_paths(path, config.shards)))
+        db = get_database()
+    return [(db, path)]
+
+
+def archive_copy_path(path):
+    # Where the backup file at path keeps its database's archive.
+    stem, extension = os.path.splitext(path)
+    return f'{stem}.archive{extension or ".db"}'
+
+
+def _backup_file(destination, db, verify):
+    # The copies are written next to their destinations and renamed into
+    # place, so a destination is never a partial file. The archive, if
+    # there is one, is attached and copied in the same read transaction.
+    archive = archive_path(db)
+    copies = [('main', destination)]
+    if os.path.exists(archive):
+        copies.append(('archive', archive_copy_path(destination)))
+    for _, path in copies:
+        if os.path.exists(path + '.partial'):
+            os.remove(path + '.partial')
+    source = connect(db.path, db.config, isolation_level=None)
+    try:
+        if len(copies) > 1:
+            source.execute('ATTACH DATABASE ? AS archive', (archive,))
+        hold_snapshot = source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        if hold_snapshot:
+            source.execute('BEGIN')
+            for schema, _ in copies:
+                source.execute(f'SELECT 1 FROM {schema}.sqlite_master LIMIT 1').fetchall()
+        try:
+            for schema, path in copies:
+                target = sqlite3.connect(path + '.partial')
+                try:
+                    source.backup(target, pages=db.config.backup_pages or -1, name=schema,
+                                  progress=_pause(db.config.backup_sleep_ms))
+                    # A standalone file: reading it must not leave -wal/-shm files.
+                    target.execute('PRAGMA journal_mode = DELETE')
+                finally:
+                    target.close()
+        finally:
+            if hold_snapshot:
+                source.execute('ROLLBACK')
+    finally:
+        source.close()
+    if verify:
+        for _, path in copies:
+            problems = check_integrity(path + '.partial')
+            if problems:
+                for _, partial in copies:
+                    if os.path.exists(partial + '.partial'):
+                        os.remove(partial + '.partial')
+                raise ValueError(f"Backup failed its integrity check: {'; '.join(problems[:5])}")
+    for _, path in copies:
+        os.replace(path + '.partial', path)
+    print(f"Backed up {db.path} to {destination} ({os.path.getsize(destination)} bytes)")
+    if len(copies) > 1:
+        print(f"Backed up {archive} to {copies[1][1]} ({os.path.getsize(copies[1][1])} bytes)")
+    return [path for _, path in copies]
+
+
+def backup(destination, db=None, verify=False):
+    # Copies the live database to destination and returns the files
+    # written. In sharded mode every shard is copied, each to its own file
+    # (destination.shard0.db, ...); the shards are copied one after another,
+    # not from one point in time.
+    return [path for database, path in _files(destination, db) for path in _backup_file(path, database, verify)]
+
+
+def _snapshot_name(path, when):
+    stem, extension = os.path.splitext(os.path.basename(path))
+    return f'{stem}-{when}{extension or ".db"}'
+
+
+def list_snapshots(directory, db=None):
+    # Oldest first, as the paths snapshot() returned; the timestamp in the
+    # name sorts chronologically. Only names snapshot() would write are
+    # listed, so retention never touches other files in the directory.
+    path = db.path if db is not None else load_config().path
+    first = os.path.basename(_files(_snapshot_name(path, '@'), db)[0][1])
+    pattern = re.compile(re.escape(first).replace('@', r'(\d{8}-\d{6})') + '$')
+    names = os.listdir(directory) if os.path.isdir(directory) else []
+    stamps = sorted(match.group(1) for match in map(pattern.match, names) if match)
+    return [os.path.join(directory, _snapshot_name(path, stamp)) for stamp in stamps]
+
+
+def snapshot(directory, keep=None, db=None):
+    # A timestamped backup in directory; with keep, only the newest keep
+    # snapshots are left afterwards.
+    path = db.path if db is not None else load_config().path
+    os.makedirs(directory, exist_ok=True)
+    name = _snapshot_name(path, datetime.datetime.now().strftime(SNAPSHOT_TIME_FORMAT))
+    snapshot_path = os.path.join(directory, name)
+    backup(snapshot_path, db)
+    if keep:
+        for old in list_snapshots(directory, db)[:-keep]:
+            for _, old_file in _files(old, db):
+                for path in (old_file, archive_copy_path(old_file)):
+                    if os.path.exists(path):
+                        os.remove(path)
+            print(f"Removed old snapshot {old}")
+    return snapshot_path
+
+
+class SnapshotScheduler:
+    # Takes a snapshot every interval seconds until stopped. A failed
+    # snapshot is reported and retried at the next interval.
+    def __init__(self, directory, interval, keep=None, db=None):
+        self.directory = directory
+        self.interval = parse_interval(interval) if isinstance(interval, str) else interval
+        self.keep = keep
+        self.db = db
+        self._stop = threading.Event()
+
+    def run(self):
+        print(f"Taking a snapshot every {self.interval // 60} min in {self.directory}.")
+        while not self._stop.is_set():
+            try:
+                snapshot(self.directory, self.keep, self.db)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                print(f"An error occurred: {e}")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+def _restore_file(source_path, path, config):
+    source = sqlite3.connect(f'file:{source_path}?mode=ro', uri=True)
+    target = connect(path, config)
+    try:
+        _copy(source, target, config.backup_pages, 0)
+        problems = [row[0] for row in target.execute('PRAGMA quick_check')]
+    finally:
+        source.close()
+        target.close()
+    if problems != ['ok']:
+        raise ValueError(f"Restored database failed its integrity check: {'; '.join(problems[:5])}")
+    print(f"Restored {path} from {source_path}")
+
+
+def restore(source_path, path=None, config=None):
+    # Replaces the database at path with the backup at source_path after
+    # checking the backup; in sharded mode every shard is replaced from its
+    # file in the backup. The change log's rewind is recorded (see
+    # models/change_log.py). Each archive is replaced from the backup's copy,
+    # or removed if the backup has none, so no archived rows outlive the
+    # database they were moved out of. Every shared Database is closed
+    # first so no pooled connection or cache outlives the old contents; the
+    # next get_database() starts fresh.
+    config = config or load_config(path=path)
+    files = [(source_path, config.path)]
+    if config.shards > 1:
+        from models.sharding import shard_paths
+        files = list(zip(shard_paths(source_path, config.shards), shard_paths(config.path, config.shards)))
+    archives = [(archive_copy_path(source), archive_file(target, config)) for source, target in files]
+    log_states = [read_log_state(target) for _, target in files]
+    for source in [source for source, _ in files] + [source for source, _ in archives if os.path.exists(source)]:
+        problems = check_integrity(source)
+        if problems:
+            raise ValueError(f"Backup {source} failed its integrity check: {'; '.join(problems[:5])}")
+    close_databases()
+    for source, target in files:
+        _restore_file(source, target, config)
+    for source, target in archives:
+        if os.path.exists(source):
+            _restore_file(source, target, config)
+        elif os.path.exists(target):
+            for stale in (target, target + '-wal', target + '-shm'):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            print(f"Removed {target}; the backup has no archive")
+    # A backup from older code is brought up to the current schema.
+    init_db(config.path)
+    for (_, target), (last_seq, rewinds) in zip(files, log_states):
+        record_rewind(get_database(target), last_seq, rewinds)
+    return config.path
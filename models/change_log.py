@@ -0,0 +1,185 @@
+# models/change_log.py
+#
+# Incremental sync for downstream copies. Triggers append every insert,
+# update and delete on medication, schedule and reminder to change_log, so
+# a consumer only asks for what happened after the last seq it applied:
+#
+#   python cli.py changes --since 1200 > delta.jsonl
+#   python cli.py prune-changes --keep-days 30
+#
+# Each change carries the row as it is now in the export format of
+# models/transfer.py, or null once the row is gone. Applying changes in seq
+# order (upsert, or delete on null) is idempotent, so a consumer that
+# crashes part way can start again from its last saved seq.
+#
+# Restoring a backup takes the log back to the backup's seq. The restore
+# records that in change_log_rewind and moves the sequence past every seq
+# handed out before, so seqs are never reused and a consumer whose saved
+# seq belongs to the discarded history is told to resync.
+import json
+import sqlite3
+import sys
+from collections import namedtuple
+from models.database import get_database, PAGE_SIZE
+from models.transfer import KINDS, export_record
+
+PRUNE_BATCH_SIZE = 10000
+
+Change = namedtuple('Change', ['seq', 'kind', 'id', 'operation', 'record'])
+
+# change_log.table_name -> export kind
+TABLE_KINDS = {table: kind for kind, (table, _) in KINDS.items()}
+
+
+def _sequence(connection):
+    row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+
+def read_log_state(path):
+    # (last seq, recorded rewinds) of the database file at path, read
+    # before a restore replaces it; (0, []) if it has no change log.
+    try:
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    except sqlite3.Error:
+        return 0, []
+    try:
+        return (_sequence(connection),
+                connection.execute('SELECT restored_seq, lost_seq, time FROM change_log_rewind').fetchall())
+    except sqlite3.Error:
+        return 0, []
+    finally:
+        connection.close()
+
+
+def record_rewind(db, last_seq, rewinds=()):
+    # Called after db was restored over a database whose log had reached
+    # last_seq; rewinds are the ones that database had recorded.
+    def work(connection):
+        connection.executemany('INSERT OR IGNORE INTO change_log_rewind (restored_seq, lost_seq, time) '
+                               'VALUES (?, ?, ?)', rewinds)
+        restored = _sequence(connection)
+        if last_seq <= restored:
+            return None
+        connection.execute('INSERT INTO change_log_rewind (restored_seq, lost_seq) VALUES (?, ?)',
+                           (restored, last_seq))
+        if connection.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'change_log'",
+                              (last_seq,)).rowcount == 0:
+            connection.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?)", (last_seq,))
+        return restored
+
+    restored = db.write(work)
+    if restored is not None:
+        print(f"Change log of {db.path} rewound from seq {last_seq} to {restored}; "
+              f"consumers past seq {restored} must resync")
+    return restored
+
+
+class ChangeLogManager:
+    def __init__(self, db=None):
+        self.db = db or get_database()
+
+    def last_seq(self):
+        # The highest seq ever handed out, even if it has since been pruned.
+        row = self.db.query_one("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")
+        return row[0] if row else 0
+
+    def _check_since(self, since):
+        rewind = self.db.query_one('SELECT restored_seq FROM change_log_rewind WHERE restored_seq < ? AND ? <= lost_seq '
+                                   'ORDER BY restored_seq LIMIT 1', (since, since))
+        if rewind or since > self.last_seq():
+            restored = rewind[0] if rewind else self.last_seq()
+            raise ValueError(f"Change log rewound to seq {restored} (seq {since} is from before a restore); "
+                             f"resync from a full export")
+        first = self.db.query_one('SELECT MIN(seq) FROM change_log')[0]
+        oldest_kept = first - 1 if first is not None else self.last_seq()
+        if since < oldest_kept:
+            raise ValueError(f"Changes after seq {since} have been pruned (log starts after seq {oldest_kept}); "
+                             f"resync from a full export")
+
+    def _records(self, connection, changes):
+        # Current rows for one page of changes, one IN query per table.
+        ids = {}
+        for _, table, row_id, _ in changes:
+            ids.setdefault(table, set()).add(row_id)
+        records = {}
+        for table, row_ids in ids.items():
+            kind = TABLE_KINDS[table]
+            columns = ', '.join(column for _, column, _ in KINDS[kind][1])
+            placeholders = ', '.join('?' * len(row_ids))
+            for row in connection.execute(f'SELECT {columns} FROM {table} WHERE id IN ({placeholders})',
+                                          list(row_ids)):
+                records[(table, row[0])] = export_record(kind, row)
+        return records
+
+    def iter_changes(self, since=0, kinds=None, page_size=PAGE_SIZE):
+        # Changes with seq > since, oldest first, one page at a time. Raises
+        # ValueError if some of them have already been pruned.
+        self._check_since(since)
+        tables = [KINDS[kind][0] for kind in kinds] if kinds else list(TABLE_KINDS)
+        placeholders = ', '.join('?' * len(tables))
+        while True:
+            # Log page and rows come from one snapshot.
+            with self.db.connection() as connection:
+                began = not connection.in_transaction
+                if began:
+                    connection.execute('BEGIN')
+                try:
+                    changes = connection.execute(
+                        f'''SELECT seq, table_name, row_id, operation FROM change_log
+                            WHERE seq > ? AND table_name IN ({placeholders}) ORDER BY seq LIMIT ?''',
+                        [since, *tables, page_size]).fetchall()
+                    records = self._records(connection, changes)
+                finally:
+                    if began:
+                        connection.rollback()
+            for seq, table, row_id, operation in changes:
+                yield Change(seq, TABLE_KINDS[table], row_id, operation, records.get((table, row_id)))
+            if len(changes) < page_size:
+                return
+            since = changes[-1][0]
+
+    def export_changes(self, since=0, path='-', kinds=None):
+        # Writes JSON Lines and returns (changes written, seq to resume after).
+        last = max(since, self.last_seq())
+        count = 0
+        output = sys.stdout if path == '-' else open(path, 'w')
+        try:
+            for change in self.iter_changes(since, kinds):
+                output.write(json.dumps(change._asdict()) + '\n')
+                count += 1
+                last = max(last, change.seq)
+            output.flush()
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        print(f"Exported {count} changes; next sync: --since {last}", file=sys.stderr)
+        return count, last
+
+    def prune_changes(self, before_seq=None, keep_days=None):
+        # Deletes changes with seq < before_seq and/or older than keep_days,
+        # PRUNE_BATCH_SIZE rows per transaction so writers are not held up.
+        limits = []
+        if before_seq is not None:
+            limits.append(before_seq)
+        if keep_days is not None:
+            # time grows with seq, so the first change young enough to keep
+            # bounds everything before it.
+            row = self.db.query_one(
+                "SELECT seq FROM change_log WHERE time >= CAST(strftime('%s', 'now') AS INTEGER) - ? "
+                "ORDER BY seq LIMIT 1", (int(keep_days * 86400),))
+            limits.append(row[0] if row else self.last_seq() + 1)
+        if not limits:
+            print("Please provide before_seq or keep_days.")
+            return 0
+        cutoff = min(limits)
+        deleted = 0
+        while True:
+            batch = self.db.execute('DELETE FROM change_log WHERE seq IN '
+                                    '(SELECT seq FROM change_log WHERE seq < ? ORDER BY seq LIMIT ?)',
+                                    (cutoff, PRUNE_BATCH_SIZE))
+            deleted += batch
+            if batch < PRUNE_BATCH_SIZE:
+                break
+        print(f"Pruned {deleted} changes before seq {cutoff}")
+        return deleted
@@ -0,0 +1,277 @@
+# models/commands.py
+#
+# The menu actions as named commands, for scripts and cron jobs:
+#
+#   python cli.py add-medication --user-id 1 --name Aspirin --dosage 10mg
+#   python cli.py batch < commands.jsonl
+#
+# A batch reads one JSON object per line, e.g.
+#   {"command": "add-reminder", "medication_id": 1, "time": "2024-12-25 09:00", "message": "Take it"}
+# and writes one JSON result per line in the same order.
+import contextlib
+import datetime
+import io
+import json
+import sys
+from collections import namedtuple
+from models.config import load_config
+from models.database import get_database
+from models.dose_log import DoseLogManager
+from models.medication_tracker import MedicationTrackerDB, get_medication_cache
+from models.next_dose import NextDoseManager
+from models.reminder import ReminderManager
+from models.schedule import ScheduleManager
+from models.search import SEARCH_LIMIT
+from models.timeutil import TIME_FORMAT
+
+BATCH_SIZE = 1000
+
+# type is applied to the raw value; required arguments must be present.
+Argument = namedtuple('Argument', ['name', 'type', 'required'])
+Command = namedtuple('Command', ['name', 'help', 'arguments', 'run'])
+
+
+class Managers:
+    # The managers for one database, or their sharded counterparts when
+    # the shards setting is above 1 and no database is given.
+    def __init__(self, db=None):
+        config = load_config()
+        self.shards = None
+        if db is None and config.shards > 1:
+            from models import sharding
+            self.db = None
+            self.shards = sharding.get_shard_set(config)
+            self.medications = sharding.ShardedMedicationTrackerDB(self.shards)
+            self.schedules = sharding.ShardedScheduleManager(self.shards)
+            self.reminders = sharding.ShardedReminderManager(self.shards)
+            self.doses = sharding.ShardedDoseLogManager(self.shards)
+            self.next_doses = sharding.ShardedNextDoseManager(self.shards)
+            return
+        self.db = db or get_database()
+        self.medications = MedicationTrackerDB(self.db)
+        self.schedules = ScheduleManager(self.db)
+        self.reminders = ReminderManager(self.db)
+        self.doses = DoseLogManager(self.db)
+        self.next_doses = NextDoseManager(self.db)
+
+
+def _required(name, type=str):
+    return Argument(name, type, True)
+
+
+def _optional(name, type=str):
+    return Argument(name, type, False)
+
+
+# In menu order (options 1-19), plus view and delete for recurring
+# schedules, which the menu lacks. A command's result is None when the manager
+# reported a failure; updates and deletes return the number of rows changed.
+COMMANDS = {command.name: command for command in [
+    Command('add-medication', "Add medication",
+            [_required('user_id', int), _required('name'), _required('dosage')],
+            lambda m, a: m.medications.add_medication(a['user_id'], a['name'], a['dosage'])),
+    Command('add-schedule', "Add schedule",
+            [_required('user_id', int), _required('time')],
+            lambda m, a: m.schedules.add_schedule(a['user_id'], a['time'])),
+    Command('delete-medication', "Delete medication",
+            [_required('medication_id', int)],
+            lambda m, a: m.medications.delete_medication(a['medication_id'])),
+    Command('delete-schedule', "Delete schedule",
+            [_required('schedule_id', int)],
+            lambda m, a: m.schedules.delete_schedule(a['schedule_id'])),
+    Command('view-medications', "View all medications", [],
+            lambda m, a: list(m.medications.iter_medications())),
+    Command('view-reminders', "View all reminders", [],
+            lambda m, a: list(m.reminders.iter_reminders())),
+    Command('add-reminder', "Add reminder",
+            [_required('medication_id', int), _required('time'), _required('message')],
+            lambda m, a: m.reminders.add_reminder(a['medication_id'], a['time'], a['message'])),
+    Command('delete-reminder', "Delete reminder",
+            [_required('reminder_id', int)],
+            lambda m, a: m.reminders.delete_reminder(a['reminder_id'])),
+    Command('view-schedules', "View all schedules", [],
+            lambda m, a: list(m.schedules.iter_schedules())),
+    Command('update-medication', "Update medication",
+            [_required('medication_id', int), _optional('name'), _optional('dosage')],
+            lambda m, a: m.medications.update_medication(a['medication_id'], a['name'], a['dosage'])),
+    Command('find-medication', "Find medication",
+            [_optional('name'), _optional('user_id', int)],
+            lambda m, a: m.medications.find_medication(a['name'], a['user_id'])),
+    Command('update-schedule', "Update schedule",
+            [_required('schedule_id', int), _required('time')],
+            lambda m, a: m.schedules.update_schedule(a['schedule_id'], a['time'])),
+    Command('find-schedule', "Find schedule",
+            [_optional('user_id', int), _optional('time'), _optional('start_time'), _optional('end_time')],
+            lambda m, a: m.schedules.find_schedule(a['user_id'], a['time'], a['start_time'], a['end_time'])),
+    Command('update-reminder', "Update reminder",
+            [_required('reminder_id', int), _optional('time'), _optional('message')],
+            lambda m, a: m.reminders.update_reminder(a['reminder_id'], a['time'], a['message'])),
+    Command('find-reminder', "Find reminder",
+            [_optional('medication_id', int), _optional('time'), _optional('start_time'), _optional('end_time')],
+            lambda m, a: m.reminders.find_reminder(a['medication_id'], a['time'], a['start_time'], a['end_time'])),
+    Command('add-recurring-schedule', "Add recurring schedule",
+            [_required('user_id', int), _required('start_time'), _required('interval'), _optional('until'),
+             _optional('weekdays')],
+            lambda m, a: m.schedules.add_recurring_schedule(a['user_id'], a['start_time'], a['interval'],
+                                                            a['until'], a['weekdays'])),
+    Command('view-recurring-schedules', "View recurring schedules",
+            [_optional('user_id', int)],
+            lambda m, a: list(m.schedules.iter_schedule_rules(a['user_id']))),
+    Command('delete-recurring-schedule', "Delete recurring schedule",
+            [_required('rule_id', int)],
+            lambda m, a: m.schedules.delete_schedule_rule(a['rule_id'])),
+    Command('record-dose', "Record a dose as taken, skipped or missed",
+            [_optional('schedule_id', int), _optional('medication_id', int), _required('time'), _optional('status'),
+             _optional('rule_id', int)],
+            lambda m, a: m.doses.record_dose(a['schedule_id'], a['medication_id'], a['time'], a['status'] or 'taken',
+                                             a['rule_id'])),
+    Command('search-medications', "Search medications by name or dosage, allowing typos",
+            [_required('query'), _optional('user_id', int), _optional('limit', int)],
+            lambda m, a: m.medications.search_medications(a['query'], a['user_id'], a['limit'] or SEARCH_LIMIT)),
+    Command('next-doses', "Show what is due next for a user or in a time window",
+            [_optional('user_id', int), _optional('start_time'), _optional('end_time')],
+            lambda m, a: m.next_doses.find_next_doses(a['user_id'], a['start_time'], a['end_time'])),
+]}
+
+
+def parse_arguments(command, values):
+    arguments = {}
+    for argument in command.arguments:
+        value = values.get(argument.name)
+        if value is None or value == '':
+            if argument.required:
+                raise ValueError(f"{command.name} needs {argument.name}")
+            arguments[argument.name] = None
+        else:
+            arguments[argument.name] = argument.type(value)
+    return arguments
+
+
+def _plain(value):
+    # Records become dicts and datetimes 'YYYY-MM-DD HH:MM' so results are JSON.
+    if isinstance(value, datetime.datetime):
+        return value.strftime(TIME_FORMAT)
+    if hasattr(value, '_asdict'):
+        return {key: _plain(item) for key, item in value._asdict().items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def run_command(managers, name, values):
+    # Runs one command with the managers' messages captured. Returns a
+    # JSON-ready outcome; messages are only kept when the command failed,
+    # and warnings (e.g. schedule conflicts) when it succeeded.
+    outcome = {'command': name}
+    command = COMMANDS.get(name)
+    if command is None:
+        outcome['ok'] = False
+        outcome['error'] = f"Unknown command: {name}"
+        return outcome
+    captured = io.StringIO()
+    try:
+        arguments = parse_arguments(command, values)
+        with contextlib.redirect_stdout(captured):
+            result = command.run(managers, arguments)
+        outcome['ok'] = result is not None
+        outcome['result'] = _plain(result)
+    except Exception as e:
+        outcome['ok'] = False
+        outcome['error'] = str(e)
+    messages = captured.getvalue().splitlines()
+    if not outcome['ok'] and messages:
+        outcome['messages'] = messages
+    warnings = [message for message in messages if message.startswith('Warning:')]
+    if outcome['ok'] and warnings:
+        outcome['warnings'] = warnings
+    return outcome
+
+
+def _parse(line):
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("Each line must be a JSON object")
+    return request
+
+
+def _run_batch(managers, lines, connection):
+    # Each command gets a savepoint, so a failed one is undone on its own
+    # and the rest of the batch still commits.
+    if not connection.in_transaction:
+        connection.execute('BEGIN IMMEDIATE')
+    outcomes = []
+    for number, line in lines:
+        try:
+            request = _parse(line)
+        except ValueError as e:
+            outcomes.append({'line': number, 'ok': False, 'error': f"Invalid JSON: {e}"})
+            continue
+        connection.execute('SAVEPOINT command')
+        outcome = run_command(managers, request.get('command'), request)
+        if not outcome['ok']:
+            connection.execute('ROLLBACK TO command')
+        connection.execute('RELEASE command')
+        outcome['line'] = number
+        outcomes.append(outcome)
+    return outcomes
+
+
+def _run_unbatched(managers, lines):
+    # Sharded mode: commands may touch different files, so each one commits
+    # on its own (still grouped per shard by that shard's writer).
+    outcomes = []
+    for number, line in lines:
+        try:
+            request = _parse(line)
+        except ValueError as e:
+            outcomes.append({'line': number, 'ok': False, 'error': f"Invalid JSON: {e}"})
+            continue
+        outcome = run_command(managers, request.get('command'), request)
+        outcome['line'] = number
+        outcomes.append(outcome)
+    return outcomes
+
+
+def _chunks(stream, size):
+    chunk = []
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        chunk.append((number, line))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(stream=None, output=None, batch_size=BATCH_SIZE, db=None):
+    # Every batch_size commands run back to back on the write connection in
+    # one transaction; results are written once that transaction commits.
+    # Returns the number of failed commands.
+    managers = Managers(db)
+    stream = stream or sys.stdin
+    output = output or sys.stdout
+    failed = 0
+    for chunk in _chunks(stream, batch_size):
+        if managers.shards is not None:
+            outcomes = _run_unbatched(managers, chunk)
+        else:
+            outcomes = _run_batched(managers, chunk)
+        for outcome in outcomes:
+            failed += not outcome['ok']
+            output.write(json.dumps(outcome) + '\n')
+        output.flush()
+    return failed
+
+
+def _run_batched(managers, chunk):
+    try:
+        return managers.db.write(lambda connection: _run_batch(managers, chunk, connection))
+    except Exception as e:
+        # The whole transaction was lost, including commands that had
+        # succeeded, so anything cached or indexed from inside it is
+        # suspect too.
+        get_medication_cache(managers.db).clear()
+        managers.schedules.index.clear()
+        return [{'line': number, 'ok': False, 'error': f"Batch rolled back: {e}"} for number, _ in chunk]
@@ -0,0 +1,106 @@
+# models/config.py
+import json
+import os
+
+CONFIG_PATH = os.environ.get('MEDICATION_TRACKER_CONFIG', 'medicationtracker.json')
+
+DEFAULTS = {
+    'path': os.environ.get('MEDICATION_TRACKER_DB', 'medicationtracker.db'),
+    'pool_size': 5,
+    'shards': 0,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 268435456,
+    'single_writer': True,
+    'write_batch_size': 500,
+    'medication_cache_size': 1024,
+    'medication_cache_ttl': 30,
+    'schedule_index_users': 10000,
+    'schedule_index_ttl': 30,
+    'min_dose_gap_minutes': 30,
+    'interactions_path': None,
+    'metrics': False,
+    'metrics_path': None,
+    'slow_query_ms': 0,
+    'slow_query_log': None,
+    'backup_pages': 1000,
+    'backup_sleep_ms': 10,
+    'archive_path': None,
+    'archive_retention_days': 365,
+}
+
+# Every setting can also come from MEDICATION_TRACKER_<NAME>, e.g.
+# MEDICATION_TRACKER_SYNCHRONOUS=full; the environment wins over the file.
+SYNCHRONOUS_LEVELS = ('off', 'normal', 'full', 'extra')
+JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+
+
+class DatabaseConfig:
+    def __init__(self, **settings):
+        unknown = set(settings) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown database settings: {', '.join(sorted(unknown))}")
+        values = dict(DEFAULTS, **settings)
+        self.path = values['path']
+        self.pool_size = int(values['pool_size'])
+        self.shards = int(values['shards'])
+        self.journal_mode = str(values['journal_mode']).lower()
+        self.synchronous = str(values['synchronous']).lower()
+        self.busy_timeout = int(values['busy_timeout'])
+        self.cache_size = int(values['cache_size'])
+        self.mmap_size = int(values['mmap_size'])
+        self.single_writer = _as_bool(values['single_writer'])
+        self.write_batch_size = int(values['write_batch_size'])
+        self.medication_cache_size = int(values['medication_cache_size'])
+        self.medication_cache_ttl = float(values['medication_cache_ttl'])
+        self.schedule_index_users = int(values['schedule_index_users'])
+        self.schedule_index_ttl = float(values['schedule_index_ttl'])
+        self.min_dose_gap_minutes = float(values['min_dose_gap_minutes'])
+        self.interactions_path = values['interactions_path'] or None
+        self.metrics = _as_bool(values['metrics']) or bool(values['metrics_path'])
+        self.metrics_path = values['metrics_path'] or None
+        self.slow_query_ms = float(values['slow_query_ms'])
+        self.slow_query_log = values['slow_query_log'] or None
+        self.backup_pages = int(values['backup_pages'])
+        self.backup_sleep_ms = float(values['backup_sleep_ms'])
+        self.archive_path = values['archive_path'] or None
+        self.archive_retention_days = float(values['archive_retention_days'])
+        if self.journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Invalid journal_mode: {self.journal_mode}")
+        if self.synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Invalid synchronous level: {self.synchronous}")
+
+    def pragmas(self):
+        return [
+            f'PRAGMA journal_mode = {self.journal_mode}',
+            f'PRAGMA synchronous = {self.synchronous}',
+            f'PRAGMA busy_timeout = {self.busy_timeout}',
+            f'PRAGMA cache_size = {self.cache_size}',
+            f'PRAGMA mmap_size = {self.mmap_size}',
+        ]
+
+    def apply(self, connection):
+        for pragma in self.pragmas():
+            connection.execute(pragma).fetchall()
+
+
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def load_config(config_path=None, **overrides):
+    settings = {}
+    config_path = config_path or CONFIG_PATH
+    if os.path.exists(config_path):
+        with open(config_path) as config_file:
+            settings.update(json.load(config_file))
+    for name in DEFAULTS:
+        value = os.environ.get(f'MEDICATION_TRACKER_{name.upper()}')
+        if value is not None:
+            settings[name] = value
+    settings.update({name: value for name, value in overrides.items() if value is not None})
+    return DatabaseConfig(**settings)
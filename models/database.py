@@ -0,0 +1,418 @@
+# models/database.py
+import queue
+import sqlite3
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+from models.config import DEFAULTS, DatabaseConfig, load_config
+from models.metrics import QueryTracer, get_metrics
+from models import migrations
+
+DB_PATH = DEFAULTS['path']
+POOL_SIZE = DEFAULTS['pool_size']
+STATEMENT_CACHE_SIZE = 256
+BULK_CHUNK_SIZE = 5000
+PAGE_SIZE = 1000
+
+BulkResult = namedtuple('BulkResult', ['inserted', 'failures'])
+
+
+class PooledConnection(sqlite3.Connection):
+    # Each pooled connection keeps one cursor around so hot paths don't
+    # allocate a new cursor per statement.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shared_cursor = self.cursor()
+
+
+def connect(path, config=None, cached_statements=STATEMENT_CACHE_SIZE, tracer=None, **kwargs):
+    connection = sqlite3.connect(path,
+                                 factory=PooledConnection,
+                                 check_same_thread=False,
+                                 cached_statements=cached_statements,
+                                 **kwargs)
+    (config or DatabaseConfig()).apply(connection)
+    if tracer is not None:
+        connection.set_trace_callback(tracer.trace)
+    return connection
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE, cached_statements=STATEMENT_CACHE_SIZE, config=None, tracer=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.path = path
+        self.size = size
+        self.cached_statements = cached_statements
+        self.config = config
+        self.tracer = tracer
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Autocommit: reads take no lock, and Database.write() opens its
+        # transactions explicitly so DDL is never committed on its own.
+        return connect(self.path, self.config, self.cached_statements, self.tracer, isolation_level=None)
+
+    def acquire(self, timeout=None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._connect()
+            except sqlite3.Error:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"No free connection to {self.path} after {timeout}s")
+
+    def release(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+        self._idle.put(connection)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self._lock:
+                self._created -= 1
+
+
+class WriteQueue:
+    # One thread owns the only writing connection. Callers hand it work and
+    # wait on a future; the thread drains whatever has queued up and runs it
+    # as one transaction (group commit), each job in its own savepoint so a
+    # failing job is rolled back and reported without affecting the others.
+    def __init__(self, path, config, batch_size, tracer=None):
+        self.batch_size = batch_size
+        self._jobs = queue.Queue()
+        self._connection = connect(path, config, tracer=tracer, isolation_level=None)
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def in_writer(self):
+        return threading.current_thread() is self._thread
+
+    def active_connection(self):
+        return self._connection if self.in_writer() else None
+
+    def submit(self, work):
+        future = Future()
+        if self.in_writer():
+            # Nested write from inside a job: it joins the open transaction.
+            future.set_result(work(self._connection))
+            return future
+        self._jobs.put((work, future))
+        return future
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < self.batch_size:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._jobs.put(None)
+                    break
+                batch.append(job)
+            self._commit(batch)
+        self._connection.close()
+
+    def _commit(self, batch):
+        connection = self._connection
+        outcomes = []
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            for work, _ in batch:
+                connection.execute('SAVEPOINT job')
+                try:
+                    outcomes.append((work(connection), None))
+                    connection.execute('RELEASE job')
+                except Exception as e:
+                    connection.execute('ROLLBACK TO job')
+                    connection.execute('RELEASE job')
+                    outcomes.append((None, e))
+            connection.execute('COMMIT')
+        except Exception as e:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            outcomes = [(None, e)] * len(batch)
+        for (_, future), (result, error) in zip(batch, outcomes):
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def close(self):
+        self._jobs.put(None)
+        self._thread.join()
+
+
+class Database:
+    def __init__(self, path=None, pool_size=None, config=None):
+        self.config = config or load_config(path=path, pool_size=pool_size)
+        self.path = self.config.path
+        self.tracer = None
+        if self.config.slow_query_ms > 0:
+            self.tracer = QueryTracer(self.config.slow_query_ms, self.config.slow_query_log)
+        self.pool = ConnectionPool(self.path, self.config.pool_size, config=self.config, tracer=self.tracer)
+        self.writer = None
+        self._local = threading.local()
+        if self.config.single_writer:
+            self.writer = WriteQueue(self.path, self.config, self.config.write_batch_size, self.tracer)
+
+    def schema_version(self):
+        return self.query_one('PRAGMA user_version')[0]
+
+    def migrate(self, target=migrations.LATEST_VERSION):
+        # Cheap when up to date: one PRAGMA read, no DDL.
+        if self.schema_version() >= target:
+            return []
+        return self.write(lambda connection: migrations.migrate(connection, target))
+
+    def _active_connection(self):
+        # The connection of the write transaction this thread is inside, if any.
+        if self.writer is not None:
+            return self.writer.active_connection()
+        return getattr(self._local, 'connection', None)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        # Reads made from inside a write job use its connection, so they see
+        # the job's own uncommitted changes.
+        active = self._active_connection()
+        if active is not None:
+            yield active
+            return
+        with self.pool.connection(timeout) as connection:
+            yield connection
+
+    def _traced(self, connection, label):
+        if self.tracer is None:
+            return nullcontext()
+        return self.tracer.timed(connection, label)
+
+    def query(self, sql, parameters=()):
+        with self.connection() as connection, self._traced(connection, 'query'):
+            cursor = connection.shared_cursor
+            cursor.execute(sql, parameters)
+            return cursor.fetchall()
+
+    def query_one(self, sql, parameters=()):
+        with self.connection() as connection, self._traced(connection, 'query'):
+            cursor = connection.shared_cursor
+            cursor.execute(sql, parameters)
+            return cursor.fetchone()
+
+    def iter_keyset(self, table, conditions=(), parameters=(), order=('id',), page_size=PAGE_SIZE, lower=None):
+        # Streams SELECT * FROM table one page at a time, resuming each page
+        # after the last row's order key (WHERE (key) > (last) ... LIMIT n),
+        # so memory stays at one page and no OFFSET scan is needed. order
+        # must end in a unique column and name columns by position in the row.
+        # lower is an optional (condition, parameters) lower bound on order[0]
+        # for the first page only: later pages bound order[0] by the last key
+        # instead, since SQLite seeks on one lower bound and would otherwise
+        # rescan from the start of the range on every page.
+        columns = [name for name, in self.query('SELECT name FROM pragma_table_info(?)', (table,))]
+        positions = [columns.index(column) for column in order]
+        order_by = ', '.join(order)
+        if len(order) == 1:
+            after = [f'{order[0]} > ?']
+        else:
+            after = [f'{order[0]} >= ?', f'({order_by}) > ({", ".join("?" * len(order))})']
+        last = None
+        while True:
+            where = list(conditions)
+            values = list(parameters)
+            if last is not None:
+                where.extend(after)
+                values.extend(last if len(order) == 1 else [last[0]] + last)
+            elif lower is not None:
+                where.append(lower[0])
+                values.extend(lower[1])
+            sql = f'SELECT * FROM {table}'
+            if where:
+                sql += ' WHERE ' + ' AND '.join(where)
+            sql += f' ORDER BY {order_by} LIMIT ?'
+            values.append(page_size)
+            rows = self.query(sql, values)
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last = [rows[-1][position] for position in positions]
+
+    def write(self, work):
+        # Runs work(connection) in a single transaction and returns its result.
+        # With single_writer on, the transaction may be shared with other
+        # queued writes and commits together with them.
+        # A write made from inside another one joins its transaction.
+        if self.tracer is not None:
+            work = self._traced_work(work)
+        if self.writer is not None:
+            return self.writer.submit(work).result()
+        active = self._active_connection()
+        if active is not None:
+            return work(active)
+        with self.pool.connection() as connection:
+            self._local.connection = connection
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    result = work(connection)
+                    connection.execute('COMMIT')
+                except BaseException:
+                    if connection.in_transaction:
+                        connection.execute('ROLLBACK')
+                    raise
+                return result
+            finally:
+                self._local.connection = None
+
+    def _traced_work(self, work):
+        # Timed on whichever thread ends up running it.
+        def traced(connection):
+            with self.tracer.timed(connection, 'write'):
+                return work(connection)
+        return traced
+
+    def execute(self, sql, parameters=()):
+        return self.write(lambda connection: connection.shared_cursor.execute(sql, parameters).rowcount)
+
+    def insert(self, sql, parameters=()):
+        return self.write(lambda connection: connection.shared_cursor.execute(sql, parameters).lastrowid)
+
+    def insert_many(self, sql, rows, prepare=tuple, chunk_size=BULK_CHUNK_SIZE):
+        # prepare(row) turns each input row into statement parameters and may
+        # raise ValueError/TypeError to reject it. Each chunk is one
+        # executemany in one transaction; a chunk that fails is replayed row
+        # by row so a bad row is reported without losing the rest.
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be at least 1")
+        inserted = 0
+        failures = []
+        chunk = []
+        for index, row in enumerate(rows):
+            try:
+                chunk.append((index, row, prepare(row)))
+            except (ValueError, TypeError) as e:
+                failures.append((index, row, str(e)))
+                continue
+            if len(chunk) >= chunk_size:
+                count, failed = self.write(lambda connection: _insert_chunk(connection, sql, chunk))
+                inserted += count
+                failures.extend(failed)
+                chunk = []
+        if chunk:
+            count, failed = self.write(lambda connection: _insert_chunk(connection, sql, chunk))
+            inserted += count
+            failures.extend(failed)
+        failures.sort(key=lambda failure: failure[0])
+        return BulkResult(inserted, failures)
+
+    def close(self):
+        # Managers hold no connections of their own, so their close() is a
+        # no-op; the pooled connections and the writer are released here.
+        if self.writer is not None:
+            self.writer.close()
+        self.pool.close()
+
+
+def _insert_chunk(connection, sql, chunk):
+    cursor = connection.shared_cursor
+    cursor.execute('SAVEPOINT bulk_chunk')
+    try:
+        cursor.executemany(sql, [parameters for _, _, parameters in chunk])
+        cursor.execute('RELEASE bulk_chunk')
+        return len(chunk), []
+    except sqlite3.Error:
+        cursor.execute('ROLLBACK TO bulk_chunk')
+        cursor.execute('RELEASE bulk_chunk')
+
+    inserted = 0
+    failures = []
+    for index, row, parameters in chunk:
+        try:
+            cursor.execute(sql, parameters)
+            inserted += 1
+        except sqlite3.Error as e:
+            failures.append((index, row, str(e)))
+    return inserted, failures
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path=None):
+    path = path or load_config().path
+    with _databases_lock:
+        database = _databases.get(path)
+        if database is None:
+            database = Database(path)
+            _databases[path] = database
+        return database
+
+
+def require_unsharded(command, path=None):
+    # For commands that work on one database file and have no sharded
+    # counterpart; in sharded mode the base file holds no data.
+    config = load_config(path=path)
+    if config.shards > 1:
+        raise ValueError(f"{command} does not support sharded mode (shards = {config.shards}); "
+                         f"run it against one shard file with MEDICATION_TRACKER_SHARDS=1")
+
+
+def init_db(path=None):
+    # The explicit setup step for the CLI, batch jobs and tests: opens the
+    # shared Database (or every shard, in sharded mode) and applies any
+    # pending migrations.
+    config = load_config(path=path)
+    if config.shards > 1:
+        from models.sharding import get_shard_set
+        database = get_shard_set(config)
+    else:
+        database = get_database(path)
+    applied = database.migrate()
+    if applied:
+        print(f"Applied schema migrations: {', '.join(map(str, applied))}")
+    return database
+
+
+def close_databases():
+    if 'models.sharding' in sys.modules:
+        sys.modules['models.sharding'].close_shard_sets()
+    with _databases_lock:
+        for database in _databases.values():
+            if database.config.metrics_path:
+                get_metrics().dump(database.config.metrics_path)
+            database.close()
+        _databases.clear()
@@ -0,0 +1,262 @@
+# models/dispatcher.py
+import argparse
+import datetime
+import heapq
+import json
+import threading
+import urllib.request
+from collections import namedtuple
+from models.database import get_database, init_db, connect, require_unsharded
+from models.timeutil import from_epoch, now_epoch
+
+POLL_INTERVAL = 0.5
+EVENT_BATCH_SIZE = 1000
+# A reminder written (or moved) up to this long after its due time still
+# fires, so one set for the current minute is not lost.
+LATE_GRACE = 15 * 60
+# After a sink fails, firing pauses this long before the reminder is retried.
+RETRY_DELAY = 30
+
+DueReminder = namedtuple('DueReminder', ['id', 'medication_id', 'time', 'message'])
+
+
+class StdoutSink:
+    def send(self, reminder):
+        print(f"Reminder ID: {reminder.id}, Medication ID: {reminder.medication_id}, "
+              f"Time: {reminder.time}, Message: {reminder.message}")
+
+
+class LogFileSink:
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, reminder):
+        with open(self.path, 'a') as log:
+            log.write(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} reminder={reminder.id} "
+                      f"medication={reminder.medication_id} due={reminder.time} message={reminder.message}\n")
+
+
+class WebhookSink:
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, reminder):
+        body = json.dumps({
+            'id': reminder.id,
+            'medication_id': reminder.medication_id,
+            'time': str(reminder.time),
+            'message': reminder.message,
+        }).encode()
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class ReminderDispatcher:
+    # Keeps every pending reminder in a heap ordered by due time and sleeps
+    # until the earliest one. Changes made by any process are read from
+    # change_log (see models/change_log.py), so the reminder table itself is
+    # only scanned at startup. Superseded heap entries are skipped lazily.
+    #
+    # The (due, id) of the last fired reminder is saved in dispatcher_state,
+    # so a restarted dispatcher first fires whatever fell due while it was
+    # down; reminders added later for that same minute have higher ids and
+    # still fire. Assumes a single dispatcher per database.
+    #
+    # A reminder whose send fails stays pending and nothing after it fires
+    # until it has been sent, so the saved key never skips past it.
+    def __init__(self, sink=None, db=None, poll_interval=POLL_INTERVAL, grace=LATE_GRACE, retry_delay=RETRY_DELAY):
+        self.db = db or get_database()
+        self.sink = sink or StdoutSink()
+        self.poll_interval = poll_interval
+        self.grace = grace
+        self.retry_delay = retry_delay
+        self.connection = connect(self.db.path, self.db.config)
+        self._heap = []
+        self._pending = {}
+        # Reminders fired within the grace window (id -> due), so editing
+        # one afterwards does not fire it again.
+        self._fired = {}
+        self._last_seq = 0
+        self._rewinds = 0
+        # (due, id) of the last reminder fired by this process.
+        self._latest = None
+        self._retry_at = 0
+        self._data_version = None
+        self._stop = threading.Event()
+
+    def _schedule(self, reminder_id, medication_id, due, message):
+        if self._fired.get(reminder_id) == due:
+            return
+        self._pending[reminder_id] = (due, medication_id, message)
+        heapq.heappush(self._heap, (due, reminder_id))
+
+    def last_fired(self):
+        # (due, id) of the last reminder fired, or None.
+        return self.connection.execute('SELECT due, reminder_id FROM dispatcher_state').fetchone()
+
+    def _log_seq(self):
+        row = self.connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+        return row[0] if row else 0
+
+    def _rewind_count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM change_log_rewind').fetchone()[0]
+
+    def load(self, after=None):
+        # Loads the reminders after the (due, id) key after: by default the
+        # last fired one, or the start of the grace window on a first start.
+        # A restored dispatcher_state may be older than what this process
+        # has fired, so the later key wins.
+        fired = [key for key in (self.last_fired(), self._latest) if key is not None]
+        after = after or (max(map(tuple, fired)) if fired else (now_epoch() - self.grace, 0))
+        self._last_seq = self._log_seq()
+        self._rewinds = self._rewind_count()
+        self._heap = []
+        self._pending = {}
+        cursor = self.connection.execute(
+            'SELECT id, medication_id, time, message FROM reminder WHERE (time, id) > (?, ?)', tuple(after))
+        for reminder_id, medication_id, due, message in cursor:
+            if self._fired.get(reminder_id) != due:
+                self._pending[reminder_id] = (due, medication_id, message)
+                self._heap.append((due, reminder_id))
+        heapq.heapify(self._heap)
+        self._data_version = self._read_data_version()
+        return len(self._pending)
+
+    def _read_data_version(self):
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def _missed_changes(self):
+        # True if change_log entries after _last_seq were pruned unread, or
+        # the log was taken back by a restore (see models/change_log.py).
+        if self._log_seq() < self._last_seq or self._rewind_count() != self._rewinds:
+            return True
+        first = self.connection.execute('SELECT MIN(seq) FROM change_log').fetchone()[0]
+        if first is not None:
+            return first > self._last_seq + 1
+        return self._log_seq() > self._last_seq
+
+    def poll_changes(self):
+        # PRAGMA data_version only moves when another connection commits, so
+        # an idle database costs one pragma per poll.
+        data_version = self._read_data_version()
+        if data_version == self._data_version:
+            return 0
+        self._data_version = data_version
+        if self._missed_changes():
+            print("Reminder changes were pruned or rewound before they were read; reloading.")
+            return self.load()
+
+        # Read up to the newest seq as of now; entries of other tables up to
+        # it are then never scanned again.
+        upto = self._log_seq()
+        applied = 0
+        while True:
+            events = self.connection.execute(
+                "SELECT seq, row_id FROM change_log WHERE seq > ? AND seq <= ? AND table_name = 'reminder' "
+                "ORDER BY seq LIMIT ?", (self._last_seq, upto, EVENT_BATCH_SIZE)).fetchall()
+            if not events:
+                break
+            self._last_seq = events[-1][0]
+            reminder_ids = list({reminder_id for _, reminder_id in events})
+            placeholders = ', '.join('?' * len(reminder_ids))
+            rows = self.connection.execute(
+                f'SELECT id, medication_id, time, message FROM reminder WHERE id IN ({placeholders})',
+                reminder_ids).fetchall()
+            for reminder_id in reminder_ids:
+                self._pending.pop(reminder_id, None)
+            # Reminders already due but inside the grace window fire on the
+            # next fire_due().
+            oldest = now_epoch() - self.grace
+            for reminder_id, medication_id, due, message in rows:
+                if due >= oldest:
+                    self._schedule(reminder_id, medication_id, due, message)
+            applied += len(events)
+            if len(events) < EVENT_BATCH_SIZE:
+                break
+        self._last_seq = max(self._last_seq, upto)
+        return applied
+
+    def fire_due(self):
+        fired = 0
+        latest = None
+        now = now_epoch()
+        if now < self._retry_at:
+            return 0
+        while self._heap and self._heap[0][0] <= now:
+            due, reminder_id = self._heap[0]
+            pending = self._pending.get(reminder_id)
+            if pending is None or pending[0] != due:
+                heapq.heappop(self._heap)
+                continue
+            try:
+                self.sink.send(DueReminder(reminder_id, pending[1], from_epoch(due), pending[2]))
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                print(f"Retrying reminder {reminder_id} in {self.retry_delay} s")
+                self._retry_at = now + self.retry_delay
+                break
+            heapq.heappop(self._heap)
+            del self._pending[reminder_id]
+            self._fired[reminder_id] = due
+            latest = (due, reminder_id)
+            fired += 1
+        if latest is not None:
+            self._latest = latest
+            with self.connection:
+                self.connection.execute(
+                    'INSERT INTO dispatcher_state (id, due, reminder_id) VALUES (1, ?, ?) '
+                    'ON CONFLICT (id) DO UPDATE SET (due, reminder_id) = (excluded.due, excluded.reminder_id) '
+                    'WHERE (excluded.due, excluded.reminder_id) > (due, reminder_id)', latest)
+            self._fired = {reminder_id: due for reminder_id, due in self._fired.items() if due >= now - self.grace}
+        return fired
+
+    def next_wait(self):
+        while self._heap and self._pending.get(self._heap[0][1], (None,))[0] != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return self.poll_interval
+        return max(0, min(self.poll_interval, max(self._heap[0][0], self._retry_at) - now_epoch()))
+
+    def run(self):
+        loaded = self.load()
+        print(f"Dispatcher started with {loaded} pending reminders.")
+        while not self._stop.is_set():
+            self.poll_changes()
+            self.fire_due()
+            self._stop.wait(self.next_wait())
+        self.connection.close()
+
+    def stop(self):
+        self._stop.set()
+
+
+def make_sink(kind, target=None):
+    if kind == 'stdout':
+        return StdoutSink()
+    if kind == 'log':
+        return LogFileSink(target or 'reminders.log')
+    if kind == 'webhook':
+        return WebhookSink(target or 'http://127.0.0.1:8080/reminders')
+    raise ValueError(f"Unknown sink: {kind}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fire due reminders as they come up.")
+    parser.add_argument('--sink', choices=['stdout', 'log', 'webhook'], default='stdout')
+    parser.add_argument('--target', help="Log file path or webhook URL")
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    args = parser.parse_args()
+
+    try:
+        require_unsharded("The dispatcher")
+    except ValueError as e:
+        parser.error(str(e))
+    init_db()
+    dispatcher = ReminderDispatcher(make_sink(args.sink, args.target), poll_interval=args.poll_interval)
+    try:
+        dispatcher.run()
+    except KeyboardInterrupt:
+        dispatcher.stop()
+        print("Dispatcher stopped.")
@@ -0,0 +1,114 @@
+# models/dose_log.py
+import sqlite3
+from models.database import get_database, init_db, BULK_CHUNK_SIZE, PAGE_SIZE
+from models.metrics import instrument
+from models.records import dose_event_from_row, format_dose_event, print_rows
+from models.recurrence import nearest_occurrence
+from models.timeutil import parse_time, to_epoch
+
+DOSE_STATUSES = ('taken', 'skipped', 'missed')
+
+# The user and due time come from the schedule row when there is one, else
+# from the rule or the medication and the given due time (the rule's
+# occurrence, or the event time). The (SELECT 1) row makes the insert
+# happen even when no id matches.
+RECORD_DOSE = '''INSERT INTO dose_event (schedule_id, medication_id, user_id, due, time, status, rule_id)
+                 SELECT ?, ?, COALESCE(s.user_id, r.user_id, m.user_id), COALESCE(s.time, ?), ?, ?, ?
+                 FROM (SELECT 1)
+                 LEFT JOIN schedule s ON s.id = ?
+                 LEFT JOIN schedule_rule r ON r.id = ?
+                 LEFT JOIN medication m ON m.id = ?'''
+
+
+def _dose_parameters(schedule_id, medication_id, dose_time, status, rule_id=None, due=None):
+    if status not in DOSE_STATUSES:
+        raise ValueError(f"Status must be one of: {', '.join(DOSE_STATUSES)}")
+    if schedule_id is None and medication_id is None and rule_id is None:
+        raise ValueError("A dose needs a schedule ID, a rule ID or a medication ID")
+    dose_epoch = to_epoch(parse_time(dose_time))
+    return (schedule_id, medication_id, dose_epoch if due is None else due, dose_epoch, status, rule_id,
+            schedule_id, rule_id, medication_id)
+
+
+class DoseLogManager:
+    def __init__(self, db=None):
+        self.db = db or get_database()
+        if self.db.config.metrics:
+            instrument(self)
+
+    def _rule_due(self, rule_id, dose_time):
+        # The occurrence of the rule a dose at dose_time was for.
+        rule = self.db.query_one('SELECT start, interval_seconds, until, weekdays FROM schedule_rule WHERE id = ?',
+                                 (rule_id,))
+        if rule is None:
+            raise ValueError(f"No recurring schedule with ID {rule_id}")
+        due = nearest_occurrence(*rule, to_epoch(parse_time(dose_time)))
+        if due is None:
+            raise ValueError(f"Recurring schedule {rule_id} has no dose near {dose_time}")
+        return due
+
+    def record_dose(self, schedule_id, medication_id, dose_time, status='taken', rule_id=None):
+        # With rule_id the dose is linked to the rule's nearest occurrence.
+        try:
+            due = self._rule_due(rule_id, dose_time) if rule_id is not None else None
+            event_id = self.db.insert(RECORD_DOSE, _dose_parameters(schedule_id, medication_id, dose_time, status,
+                                                                    rule_id, due))
+            linked = f"Rule ID: {rule_id}" if rule_id is not None else f"Schedule ID: {schedule_id}"
+            print(f"Recorded dose as {status} for {linked}, Medication ID: {medication_id}")
+            return event_id
+        except ValueError as e:
+            print(f"Invalid dose: {e}")
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+
+    def record_doses_bulk(self, doses, chunk_size=BULK_CHUNK_SIZE):
+        # doses yields (schedule_id, medication_id, 'YYYY-MM-DD HH:MM', status) rows.
+        def prepare(row):
+            schedule_id, medication_id, dose_time, status = row
+            return _dose_parameters(schedule_id, medication_id, dose_time, status)
+
+        result = self.db.insert_many(RECORD_DOSE, doses, prepare, chunk_size)
+        print(f"Recorded {result.inserted} doses, {len(result.failures)} failed")
+        return result
+
+    def iter_dose_events(self, user_id=None, medication_id=None, start_time=None, end_time=None,
+                         page_size=PAGE_SIZE):
+        conditions = []
+        parameters = []
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            parameters.append(user_id)
+        if medication_id is not None:
+            conditions.append('medication_id = ?')
+            parameters.append(medication_id)
+        lower = None
+        if start_time is not None and end_time is not None:
+            conditions.append('due <= ?')
+            parameters.append(to_epoch(parse_time(end_time)))
+            lower = ('due >= ?', [to_epoch(parse_time(start_time))])
+
+        order = ('due', 'id') if conditions else ('id',)
+        for row in self.db.iter_keyset('dose_event', conditions, parameters, order, page_size, lower):
+            yield dose_event_from_row(row)
+
+    def view_dose_events(self, user_id=None):
+        return print_rows(self.iter_dose_events(user_id), format_dose_event, "No doses recorded.")
+
+    def delete_dose_event(self, event_id):
+        try:
+            deleted = self.db.execute('DELETE FROM dose_event WHERE id = ?', (event_id,))
+            print(f"Deleted dose with ID: {event_id}")
+            return deleted
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+
+    def close(self):
+        pass
+
+if __name__ == "__main__":
+    init_db()
+    manager = DoseLogManager()
+    # Example usage
+    manager.record_dose(1, 1, '2024-12-25 09:10')
+    manager.view_dose_events()
+    manager.close()
@@ -0,0 +1,141 @@
+# models/interactions.py
+#
+# Drug-interaction checks against a local CSV dataset, set with the
+# interactions_path setting (MEDICATION_TRACKER_INTERACTIONS_PATH):
+#
+#   drug_a,drug_b,severity,description
+#   warfarin,aspirin,major,Increased risk of bleeding
+#
+# The file is compiled once into a name -> drug number map and a
+# (drug, drug) -> interaction map, so checking a pair is two dict lookups
+# however large the dataset is.
+import csv
+import os
+import re
+import threading
+from collections import namedtuple
+
+SEVERITIES = ('minor', 'moderate', 'major', 'contraindicated')
+
+Interaction = namedtuple('Interaction', ['drug_a', 'drug_b', 'severity', 'description'])
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+_DIGIT = re.compile(r'\d')
+
+
+def normalize_name(name):
+    # 'Aspirin  (EC)' -> 'aspirin ec'; case, punctuation and spacing are ignored.
+    return _NON_WORD.sub(' ', (name or '').casefold()).strip()
+
+
+def _candidates(name):
+    # The full name first, then without dosage-like words, so a stored
+    # 'Aspirin 81mg' still matches 'aspirin' in the dataset.
+    normalized = normalize_name(name)
+    yield normalized
+    words = [word for word in normalized.split() if not _DIGIT.search(word)]
+    if words and len(words) < len(normalized.split()):
+        yield ' '.join(words)
+
+
+def severity_rank(severity):
+    return SEVERITIES.index(severity)
+
+
+class InteractionIndex:
+    def __init__(self):
+        self.drugs = {}
+        self.pairs = {}
+
+    def _drug(self, name):
+        key = normalize_name(name)
+        if not key:
+            raise ValueError("Drug name is empty")
+        return self.drugs.setdefault(key, len(self.drugs))
+
+    def add(self, drug_a, drug_b, severity, description=''):
+        severity = severity.strip().lower()
+        if severity not in SEVERITIES:
+            raise ValueError(f"Unknown severity {severity!r}; expected one of {', '.join(SEVERITIES)}")
+        a, b = self._drug(drug_a), self._drug(drug_b)
+        pair = (a, b) if a <= b else (b, a)
+        current = self.pairs.get(pair)
+        # Duplicate rows keep the most severe entry.
+        if current is None or severity_rank(severity) > severity_rank(current.severity):
+            self.pairs[pair] = Interaction(drug_a.strip(), drug_b.strip(), severity, description.strip())
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path, newline='') as dataset:
+            for line, row in enumerate(csv.DictReader(dataset), 2):
+                try:
+                    index.add(row['drug_a'], row['drug_b'], row['severity'] or '', row.get('description') or '')
+                except (KeyError, TypeError, ValueError) as e:
+                    raise ValueError(f"{path} line {line}: {e}")
+        return index
+
+    def drug_id(self, name):
+        for candidate in _candidates(name):
+            drug = self.drugs.get(candidate)
+            if drug is not None:
+                return drug
+        return None
+
+    def lookup(self, name_a, name_b):
+        a, b = self.drug_id(name_a), self.drug_id(name_b)
+        if a is None or b is None:
+            return None
+        return self.pairs.get((a, b) if a <= b else (b, a))
+
+    def check(self, name, others):
+        # Interactions between name and each of others, as (other, Interaction).
+        # others may be any objects with a .name, e.g. Medication records.
+        drug = self.drug_id(name)
+        if drug is None:
+            return []
+        found = []
+        for other in others:
+            other_drug = self.drug_id(other.name)
+            if other_drug is None:
+                continue
+            interaction = self.pairs.get((drug, other_drug) if drug <= other_drug else (other_drug, drug))
+            if interaction is not None:
+                found.append((other, interaction))
+        return found
+
+    def check_all(self, medications):
+        # Every interacting pair within one user's medications.
+        resolved = [(med, self.drug_id(med.name)) for med in medications]
+        resolved = [(med, drug) for med, drug in resolved if drug is not None]
+        found = []
+        for position, (first, a) in enumerate(resolved):
+            for second, b in resolved[position + 1:]:
+                interaction = self.pairs.get((a, b) if a <= b else (b, a))
+                if interaction is not None:
+                    found.append((first, second, interaction))
+        return found
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def get_interaction_index(path):
+    # Compiled once per file and reloaded when the file changes.
+    if not path:
+        return None
+    modified = os.path.getmtime(path)
+    with _loaded_lock:
+        entry = _loaded.get(path)
+        if entry is None or entry[0] != modified:
+            entry = (modified, InteractionIndex.load(path))
+            _loaded[path] = entry
+        return entry[1]
+
+
+def format_interaction(first, second, interaction):
+    text = f"Interaction ({interaction.severity}): {first.name} + {second.name}"
+    if interaction.description:
+        text += f" - {interaction.description}"
+    return text
@@ -1,86 +1,241 @@
-# lib/cli.py
-import sqlite3
-import datetime
+# models/medication_tracker.py
+import weakref
+from models.cache import LRUCache
+from models.interactions import SEVERITIES, get_interaction_index, format_interaction, severity_rank
+from models.database import get_database, BULK_CHUNK_SIZE, PAGE_SIZE
+from models.metrics import instrument
+from models.records import Medication, medication_from_row, format_medication, print_rows
+from models.search import SEARCH_LIMIT, CANDIDATES, TRIGRAM, query_words, match_query, fuzzy_query, like_pattern, \
+    score
+
+_caches = weakref.WeakKeyDictionary()
+
+
+def get_medication_cache(db):
+    # One cache per Database so every manager sharing it sees the same
+    # invalidations. Writes from other processes are only picked up once an
+    # entry's TTL runs out.
+    cache = _caches.get(db)
+    if cache is None:
+        cache = LRUCache(db.config.medication_cache_size, db.config.medication_cache_ttl or None)
+        _caches[db] = cache
+    return cache
+
+
+def _cache_keys(name, user_id):
+    return [('user', user_id), ('name', name), ('name_user', name, user_id)]
+
 
 class MedicationTrackerDB:
-    def __init__(self):
-        self.connection = sqlite3.connect('medicationtracker.db')
-        self.cursor = self.connection.cursor()
+    def __init__(self, db=None, cache=None):
+        self.db = db or get_database()
+        self.cache = cache or get_medication_cache(self.db)
+        if self.db.config.metrics:
+            instrument(self)
+
+    def interactions(self):
+        return get_interaction_index(self.db.config.interactions_path)
 
     def add_medication(self, user_id, name, dosage):
-        self.cursor.execute('INSERT INTO medication (user_id, Name, Dosage) VALUES (?, ?, ?)', 
-                            (user_id, name, dosage))
-        self.connection.commit()
+        # With an interactions dataset configured, the new medication is
+        # checked against the user's others; interactions are reported as
+        # warnings and do not stop the add, and neither does a dataset that
+        # is missing or cannot be read.
+        try:
+            index = self.interactions()
+            found = index.check(name, self._lookup(None, user_id)) if index and user_id else []
+        except (OSError, ValueError) as e:
+            print(f"Warning: interactions not checked: {e}")
+            found = []
+        med_id = self.db.insert('INSERT INTO medication (user_id, Name, Dosage) VALUES (?, ?, ?)',
+                                (user_id, name, dosage))
+        self.cache.invalidate(*_cache_keys(name, user_id))
         print(f"Added medication: {name}, Dosage: {dosage} for User ID: {user_id}")
+        for other, interaction in found:
+            print(f"Warning: {format_interaction(Medication(med_id, name, dosage, user_id), other, interaction)}"
+                  f" (Medication ID: {other.id})")
+        return med_id
 
-    def view_medication(self):
-        self.cursor.execute('SELECT * FROM medication')
-        medications = self.cursor.fetchall()
-        for med in medications:
-            print(f"Medication ID: {med[0]}, Name: {med[1]}, Dosage: {med[2]}, User ID: {med[3]}")
+    def add_medications_bulk(self, medications, chunk_size=BULK_CHUNK_SIZE):
+        # medications yields (user_id, name, dosage) rows.
+        def prepare(row):
+            user_id, name, dosage = row
+            return (user_id, name, dosage)
 
-    def add_schedule(self, user_id, time):
-        try:
-            parsed_time = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('INSERT INTO schedule (user_id, time) VALUES (?, ?)', 
-                                (user_id, parsed_time))
-            self.connection.commit()
-            print(f"Added schedule for User ID: {user_id} at {parsed_time}")
-        except ValueError:
-            print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
+        result = self.db.insert_many('INSERT INTO medication (user_id, Name, Dosage) VALUES (?, ?, ?)',
+                                     medications, prepare, chunk_size)
+        self.cache.clear()
+        print(f"Added {result.inserted} medications, {len(result.failures)} failed")
+        return result
 
-    def delete_medication(self, med_id):
-        self.cursor.execute('DELETE FROM medication WHERE id = ?', (med_id,))
-        self.connection.commit()
-        print(f"Deleted medication with ID: {med_id}")
+    def iter_medications(self, name=None, user_id=None, page_size=PAGE_SIZE):
+        conditions = []
+        parameters = []
+        if name:
+            conditions.append('Name = ?')
+            parameters.append(name)
+        if user_id:
+            conditions.append('user_id = ?')
+            parameters.append(user_id)
+        for row in self.db.iter_keyset('medication', conditions, parameters, page_size=page_size):
+            yield medication_from_row(row)
 
-    def delete_schedule(self, schedule_id):
-        self.cursor.execute('DELETE FROM schedule WHERE id = ?', (schedule_id,))
-        self.connection.commit()
-        print(f"Deleted schedule with ID: {schedule_id}")
+    def view_medication(self):
+        return print_rows(self.iter_medications(), format_medication)
 
     def update_medication(self, med_id, name=None, dosage=None):
-        if name:
-            self.cursor.execute('UPDATE medication SET Name = ? WHERE id = ?', (name, med_id))
-        if dosage:
-            self.cursor.execute('UPDATE medication SET Dosage = ? WHERE id = ?', (dosage, med_id))
-        self.connection.commit()
+        def work(connection):
+            old = connection.execute('SELECT Name, user_id FROM medication WHERE id = ?', (med_id,)).fetchone()
+            if name:
+                connection.execute('UPDATE medication SET Name = ? WHERE id = ?', (name, med_id))
+            if dosage:
+                connection.execute('UPDATE medication SET Dosage = ? WHERE id = ?', (dosage, med_id))
+            return old
+
+        old = self.db.write(work)
+        if old:
+            self.cache.invalidate(*_cache_keys(old[0], old[1]), *_cache_keys(name, old[1]))
         print(f"Updated medication ID: {med_id}")
+        return 1 if old else 0
 
-    def find_medication(self, name=None, user_id=None):
+    def _lookup(self, name, user_id):
         if name and user_id:
-            self.cursor.execute('SELECT * FROM medication WHERE Name = ? AND user_id = ?', (name, user_id))
+            key = ('name_user', name, user_id)
         elif name:
-            self.cursor.execute('SELECT * FROM medication WHERE Name = ?', (name,))
-        elif user_id:
-            self.cursor.execute('SELECT * FROM medication WHERE user_id = ?', (user_id,))
-        medications = self.cursor.fetchall()
-        for med in medications:
-            print(f"Medication ID: {med[0]}, Name: {med[1]}, Dosage: {med[2]}, User ID: {med[3]}")
+            key = ('name', name)
+        else:
+            key = ('user', user_id)
+
+        medications = self.cache.get(key)
+        if medications is None:
+            generation = self.cache.generation
+            medications = tuple(self.iter_medications(name, user_id))
+            self.cache.put(key, medications, generation)
         return medications
 
-    def update_schedule(self, schedule_id, time):
-        try:
-            parsed_time = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('UPDATE schedule SET time = ? WHERE id = ?', 
-                                (parsed_time, schedule_id))
-            self.connection.commit()
-            print(f"Updated schedule ID: {schedule_id} to {parsed_time}")
-        except ValueError:
-            print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
-
-    def find_schedule(self, user_id=None, start_time=None, end_time=None):
+    def find_medication(self, name=None, user_id=None):
+        if not (name or user_id):
+            return []
+        medications = self._lookup(name, user_id)
+        for med in medications:
+            print(format_medication(med))
+        return list(medications)
+
+    def _label_candidates(self, words):
+        # (Name, Dosage, uses) labels worth scoring: substring matches from
+        # the trigram index, plus typo candidates when those run short.
+        # Without the index, only substring matches are found, by LIKE.
+        def like(terms):
+            return ' AND '.join(["(l.Name || ' ' || l.Dosage) LIKE ? ESCAPE '\\'"] * len(terms))
+
+        if not self.db.query_one("SELECT 1 FROM sqlite_master WHERE name = 'medication_label_fts'"):
+            return self.db.query(f'SELECT Name, Dosage, uses FROM medication_label l WHERE {like(words)} '
+                                 f'ORDER BY uses DESC LIMIT ?', [*map(like_pattern, words), CANDIDATES])
+
+        short = [word for word in words if len(word) < TRIGRAM]
+        where = like(short)
+
+        labels = []
+        match = match_query(words)
+        if match:
+            labels = self.db.query(f'''SELECT l.Name, l.Dosage, l.uses FROM medication_label_fts f
+                                       JOIN medication_label l ON l.id = f.rowid
+                                       WHERE medication_label_fts MATCH ? {'AND ' + where if where else ''}
+                                       ORDER BY f.rank LIMIT ?''', [match, *map(like_pattern, short), CANDIDATES])
+        elif short:
+            labels = self.db.query(f'SELECT Name, Dosage, uses FROM medication_label l WHERE {where} '
+                                   f'ORDER BY uses DESC LIMIT ?', [*map(like_pattern, short), CANDIDATES])
+        fuzzy = fuzzy_query(words)
+        if len(labels) < SEARCH_LIMIT and fuzzy:
+            labels = labels + self.db.query('''SELECT l.Name, l.Dosage, l.uses FROM medication_label_fts f
+                                               JOIN medication_label l ON l.id = f.rowid
+                                               WHERE medication_label_fts MATCH ?
+                                               ORDER BY f.rank LIMIT ?''', (fuzzy, CANDIDATES))
+        return labels
+
+    def _search(self, query, user_id=None, limit=SEARCH_LIMIT):
+        # (score, uses, Medication) for the best matches, best first. One
+        # user's medications are few, so they are scored directly.
+        words = query_words(query)
+        if not words:
+            return []
         if user_id:
-            self.cursor.execute('SELECT * FROM schedule WHERE user_id = ?', (user_id,))
-        elif start_time and end_time:
-            start_parsed = datetime.datetime.strptime(start_time, '%Y-%m-%d %H:%M')
-            end_parsed = datetime.datetime.strptime(end_time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('SELECT * FROM schedule WHERE time BETWEEN ? AND ?', 
-                                (start_parsed, end_parsed))
-        schedules = self.cursor.fetchall()
-        for sched in schedules:
-            print(f"Schedule ID: {sched[0]}, User ID: {sched[1]}, Time: {sched[2]}")
-        return schedules
+            matches = [(score(words, med.name, med.dosage), 1, med) for med in self._lookup(None, user_id)]
+            matches = sorted((match for match in matches if match[0] is not None),
+                             key=lambda match: (-match[0], match[2].id))
+            return matches[:limit]
+
+        labels = {}
+        for name, dosage, uses in self._label_candidates(words):
+            rank = score(words, name, dosage)
+            if rank is not None:
+                labels[(name, dosage)] = (rank, uses)
+        matches = []
+        for (name, dosage), (rank, uses) in sorted(labels.items(), key=lambda item: (-item[1][0], -item[1][1], item[0])):
+            if len(matches) >= limit:
+                break
+            rows = self.db.query('SELECT * FROM medication WHERE Name = ? AND Dosage = ? ORDER BY id LIMIT ?',
+                                 (name, dosage, limit - len(matches)))
+            matches.extend((rank, uses, medication_from_row(row)) for row in rows)
+        return matches
+
+    def search_medications(self, query, user_id=None, limit=SEARCH_LIMIT):
+        # Ranked prefix, substring and typo-tolerant search over names and
+        # dosages (see models/search.py), unlike find_medication's exact match.
+        medications = [med for _, _, med in self._search(query, user_id, limit)]
+        for med in medications:
+            print(format_medication(med))
+        if not medications:
+            print(f"No medications match '{query}'.")
+        return medications
+
+    def iter_interactions(self, user_id=None, min_severity=None):
+        # Streams medications in (user_id, id) order and checks each user's
+        # full set once, yielding (first, second, Interaction).
+        index = self.interactions()
+        if index is None:
+            raise ValueError("No interactions dataset configured (set interactions_path)")
+        floor = severity_rank(min_severity) if min_severity else 0
+        conditions = ['user_id = ?'] if user_id is not None else []
+        parameters = [user_id] if user_id is not None else []
+        group = []
+        rows = self.db.iter_keyset('medication', conditions, parameters, ('user_id', 'id'),
+                                   lower=('user_id IS NOT NULL', []))
+        for med in map(medication_from_row, rows):
+            if group and group[0].user_id != med.user_id:
+                yield from self._interacting(index, group, floor)
+                group = []
+            group.append(med)
+        yield from self._interacting(index, group, floor)
+
+    def _interacting(self, index, medications, floor):
+        for first, second, interaction in index.check_all(medications):
+            if severity_rank(interaction.severity) >= floor:
+                yield first, second, interaction
+
+    def audit_interactions(self, user_id=None, min_severity=None):
+        counts = dict.fromkeys(SEVERITIES, 0)
+        for first, second, interaction in self.iter_interactions(user_id, min_severity):
+            print(f"User ID {first.user_id}: {format_interaction(first, second, interaction)} "
+                  f"(Medication IDs: {first.id}, {second.id})")
+            counts[interaction.severity] += 1
+        print("Found " + ", ".join(f"{count} {severity}" for severity, count in counts.items()) + " interactions.")
+        return sum(counts.values())
+
+    def delete_medication(self, med_id):
+        def work(connection):
+            old = connection.execute('SELECT Name, user_id FROM medication WHERE id = ?', (med_id,)).fetchone()
+            connection.execute('DELETE FROM medication WHERE id = ?', (med_id,))
+            return old
+
+        old = self.db.write(work)
+        if old:
+            self.cache.invalidate(*_cache_keys(old[0], old[1]))
+        print(f"Deleted medication with ID: {med_id}")
+        return 1 if old else 0
+
+    def cache_stats(self):
+        return self.cache.stats()
 
     def close(self):
-        self.connection.close()
+        pass
@@ -0,0 +1,265 @@
+# models/metrics.py
+#
+# Opt-in instrumentation, switched on through the config layer:
+#
+#   MEDICATION_TRACKER_METRICS=1 MEDICATION_TRACKER_METRICS_PATH=metrics.prom python cli.py ...
+#   MEDICATION_TRACKER_SLOW_QUERY_MS=50 MEDICATION_TRACKER_SLOW_QUERY_LOG=slow.jsonl python cli.py ...
+#
+# Metrics count calls, failures, latency and rows per manager method and are
+# written when the databases are closed (.prom/.txt as Prometheus text,
+# anything else as JSON). The slow-query log gets one JSON line per database
+# call over the threshold, with the statements it ran and their query plans.
+import bisect
+import functools
+import json
+import sys
+import threading
+import time
+
+# Upper bounds in milliseconds; the last bucket is +Inf.
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Methods that are bookkeeping rather than operations.
+UNINSTRUMENTED = {'close', 'cache_stats', 'interactions'}
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def cumulative(self):
+        running = 0
+        buckets = []
+        for bound, count in zip(list(self.bounds) + ['+Inf'], self.counts):
+            running += count
+            buckets.append((bound, running))
+        return buckets
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.failures = 0
+        self.rows = 0
+        self.latency_ms = Histogram()
+
+
+class Metrics:
+    def __init__(self):
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, rows=0, error=False, failed=False):
+        with self._lock:
+            stats = self._operations.get(name)
+            if stats is None:
+                stats = self._operations[name] = OperationStats()
+            stats.calls += 1
+            stats.errors += error
+            stats.failures += failed
+            stats.rows += rows
+            stats.latency_ms.observe(seconds * 1000)
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {
+                'calls': stats.calls,
+                'errors': stats.errors,
+                'failures': stats.failures,
+                'rows': stats.rows,
+                'latency_ms_sum': round(stats.latency_ms.total, 4),
+                'latency_ms_buckets': {str(bound): count for bound, count in stats.latency_ms.cumulative()},
+            } for name, stats in sorted(self._operations.items())}
+
+    def to_prometheus(self):
+        lines = [
+            '# HELP medtracker_calls_total Manager method calls.',
+            '# TYPE medtracker_calls_total counter',
+            '# HELP medtracker_errors_total Calls that raised an exception.',
+            '# TYPE medtracker_errors_total counter',
+            '# HELP medtracker_failures_total Calls whose manager reported a failure.',
+            '# TYPE medtracker_failures_total counter',
+            '# HELP medtracker_rows_total Rows returned or changed.',
+            '# TYPE medtracker_rows_total counter',
+            '# HELP medtracker_latency_ms Call latency in milliseconds.',
+            '# TYPE medtracker_latency_ms histogram',
+        ]
+        for name, stats in self.snapshot().items():
+            label = f'operation="{name}"'
+            lines.append(f'medtracker_calls_total{{{label}}} {stats["calls"]}')
+            lines.append(f'medtracker_errors_total{{{label}}} {stats["errors"]}')
+            lines.append(f'medtracker_failures_total{{{label}}} {stats["failures"]}')
+            lines.append(f'medtracker_rows_total{{{label}}} {stats["rows"]}')
+            for bound, count in stats['latency_ms_buckets'].items():
+                lines.append(f'medtracker_latency_ms_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'medtracker_latency_ms_sum{{{label}}} {stats["latency_ms_sum"]}')
+            lines.append(f'medtracker_latency_ms_count{{{label}}} {stats["calls"]}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        with open(path, 'w') as output:
+            if path.endswith(('.prom', '.txt')):
+                output.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), output, indent=2)
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def _rows(result):
+    # Lists are rows returned; ints are ids or changed-row counts.
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    if isinstance(result, bool):
+        return int(result)
+    if isinstance(result, int):
+        return 1 if result else 0
+    return 0
+
+
+def _timed_iterator(iterator, name, metrics):
+    # Generators do their work as they are consumed, so only the time spent
+    # producing rows counts, and the call is recorded once it is exhausted.
+    rows = 0
+    elapsed = 0.0
+    error = False
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                return
+            elapsed += time.perf_counter() - started
+            rows += 1
+            yield row
+    except Exception:
+        error = True
+        raise
+    finally:
+        metrics.observe(name, elapsed, rows, error=error)
+
+
+def _wrap(method, name, metrics):
+    @functools.wraps(method)
+    def instrumented(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            metrics.observe(name, time.perf_counter() - started, error=True)
+            raise
+        if hasattr(result, '__next__'):
+            return _timed_iterator(result, name, metrics)
+        # Managers print a failure and return None instead of raising.
+        metrics.observe(name, time.perf_counter() - started, _rows(result), failed=result is None)
+        return result
+    return instrumented
+
+
+def instrument(manager, metrics=None):
+    # Replaces the manager's public methods with timed wrappers on this
+    # instance only; calls between methods are counted separately.
+    metrics = metrics or _metrics
+    prefix = type(manager).__name__
+    for attribute in dir(type(manager)):
+        if attribute.startswith('_') or attribute in UNINSTRUMENTED:
+            continue
+        method = getattr(manager, attribute)
+        if callable(method):
+            setattr(manager, attribute, _wrap(method, f'{prefix}.{attribute}', metrics))
+    return manager
+
+
+class QueryTracer:
+    # set_trace_callback() reports each statement as it starts. timed()
+    # collects what ran on this thread during one database call and, when
+    # the call took longer than the threshold, logs the statements with
+    # their EXPLAIN QUERY PLAN.
+    def __init__(self, threshold_ms, log_path=None):
+        self.threshold = threshold_ms / 1000
+        self.log_path = log_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def trace(self, statement):
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            stack[-1].append(statement)
+
+    def timed(self, connection, label):
+        return _TracedCall(self, connection, label)
+
+    def _plan(self, connection, statement):
+        words = statement.split(None, 1)
+        if not words or words[0].upper() not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE'):
+            return None
+        try:
+            return [row[-1] for row in connection.execute(f'EXPLAIN QUERY PLAN {statement}')]
+        except Exception as e:
+            return [f'unavailable: {e}']
+
+    def report(self, connection, label, seconds, statements):
+        # The plans are read on the same connection, with tracing of the
+        # EXPLAIN statements themselves switched off.
+        self._local.stack.append([])
+        try:
+            plans = [{'sql': statement, 'plan': self._plan(connection, statement)} for statement in statements]
+        finally:
+            self._local.stack.pop()
+        entry = json.dumps({
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'ms': round(seconds * 1000, 3),
+            'call': label,
+            'statements': plans,
+        })
+        with self._lock:
+            if self.log_path:
+                with open(self.log_path, 'a') as log:
+                    log.write(entry + '\n')
+            else:
+                print(f"Slow query: {entry}", file=sys.stderr)
+
+
+class _TracedCall:
+    def __init__(self, tracer, connection, label):
+        self.tracer = tracer
+        self.connection = connection
+        self.label = label
+
+    def __enter__(self):
+        local = self.tracer._local
+        if not hasattr(local, 'stack'):
+            local.stack = []
+        local.stack.append([])
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        stack = self.tracer._local.stack
+        statements = stack.pop()
+        if stack:
+            stack[-1].extend(statements)
+        if elapsed >= self.tracer.threshold:
+            self.tracer.report(self.connection, self.label, elapsed, statements)
+        return False
@@ -0,0 +1,342 @@
+# models/migrations.py
+#
+# Schema changes are numbered steps. The database records the last step it
+# has applied in PRAGMA user_version, and migrate() runs only the steps
+# after it, all in one transaction. Add new steps to the end of MIGRATIONS;
+# never edit or reorder one that has shipped.
+import sqlite3
+
+BASE_TABLES = {
+    'user': '''CREATE TABLE IF NOT EXISTS user(
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           Name TEXT NOT NULL
+       )''',
+    'medication': '''CREATE TABLE IF NOT EXISTS medication (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           Name TEXT NOT NULL,
+           Dosage TEXT NOT NULL,
+           user_id INTEGER,
+           FOREIGN KEY (user_id) REFERENCES user(id)
+       )''',
+    'schedule': '''CREATE TABLE IF NOT EXISTS schedule (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           user_id INTEGER,
+           time INTEGER NOT NULL,
+           FOREIGN KEY (user_id) REFERENCES user(id)
+       )''',
+    'reminder': '''CREATE TABLE IF NOT EXISTS reminder (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           medication_id INTEGER,
+           time INTEGER NOT NULL,
+           message TEXT,
+           FOREIGN KEY (medication_id) REFERENCES medication(id)
+       )''',
+}
+
+
+def _columns(connection, table):
+    return {row[1]: row[2] for row in connection.execute(f'PRAGMA table_info({table})')}
+
+
+def create_base_tables(connection):
+    # Databases written by the old models/reminder.py may call the column
+    # reminder_time; the rest of the code has always used time.
+    if 'reminder_time' in _columns(connection, 'reminder'):
+        connection.execute('ALTER TABLE reminder RENAME COLUMN reminder_time TO time')
+    for statement in BASE_TABLES.values():
+        connection.execute(statement)
+
+
+# Older databases declared schedule.time and reminder.time as TEXT holding
+# str(datetime). Those tables are rebuilt with INTEGER epoch seconds; a row
+# whose time cannot be parsed fails the NOT NULL check and aborts the rebuild.
+TIMESTAMP_COPIES = {
+    'schedule': '''INSERT INTO schedule (id, user_id, time)
+                   SELECT id, user_id, CAST(strftime('%s', time) AS INTEGER)
+                   FROM schedule_old''',
+    'reminder': '''INSERT INTO reminder (id, medication_id, time, message)
+                   SELECT id, medication_id, CAST(strftime('%s', time) AS INTEGER), message
+                   FROM reminder_old''',
+}
+
+
+def convert_timestamps(connection):
+    for table, copy_rows in TIMESTAMP_COPIES.items():
+        if _columns(connection, table).get('time', '').upper() != 'TEXT':
+            continue
+        connection.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+        connection.execute(BASE_TABLES[table])
+        connection.execute(copy_rows)
+        connection.execute(f'DROP TABLE {table}_old')
+
+
+def add_time_indexes(connection):
+    # Composite (owner, time) indexes serve both the foreign-key lookups and
+    # per-owner time ranges; the time-only ones serve cross-user ranges.
+    # Cross-user schedule ranges get their index in step 7.
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_medication_user ON medication (user_id)')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_schedule_user_time ON schedule (user_id, time)')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_reminder_medication_time ON reminder (medication_id, time)')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_reminder_time ON reminder (time)')
+
+
+def add_dispatcher_state(connection):
+    # The dispatcher reads reminder changes from change_log (step 9);
+    # dispatcher_state is one row: the (due, id) of the last fired reminder.
+    connection.execute('''CREATE TABLE IF NOT EXISTS dispatcher_state (
+                              id INTEGER PRIMARY KEY CHECK (id = 1),
+                              due INTEGER NOT NULL,
+                              reminder_id INTEGER NOT NULL
+                          )''')
+
+
+def add_schedule_rules(connection):
+    connection.execute('''CREATE TABLE IF NOT EXISTS schedule_rule (
+                              id INTEGER PRIMARY KEY AUTOINCREMENT,
+                              user_id INTEGER,
+                              start INTEGER NOT NULL,
+                              until INTEGER,
+                              interval_seconds INTEGER NOT NULL CHECK (interval_seconds > 0),
+                              weekdays INTEGER,
+                              FOREIGN KEY (user_id) REFERENCES user(id)
+                          )''')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_schedule_rule_user_start ON schedule_rule (user_id, start)')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_schedule_rule_start ON schedule_rule (start)')
+
+
+def add_dose_events(connection):
+    # One row per dose outcome. due is the scheduled time copied from the
+    # schedule row (or the event time for unscheduled doses), so adherence
+    # windows select on one indexed column without a join. A dose taken for
+    # a recurring rule names the rule, and due is the occurrence it was for.
+    connection.execute('''CREATE TABLE IF NOT EXISTS dose_event (
+                              id INTEGER PRIMARY KEY AUTOINCREMENT,
+                              schedule_id INTEGER,
+                              medication_id INTEGER,
+                              user_id INTEGER,
+                              due INTEGER NOT NULL,
+                              time INTEGER NOT NULL,
+                              status TEXT NOT NULL CHECK (status IN ('taken', 'skipped', 'missed')),
+                              rule_id INTEGER,
+                              FOREIGN KEY (schedule_id) REFERENCES schedule(id),
+                              FOREIGN KEY (medication_id) REFERENCES medication(id),
+                              FOREIGN KEY (user_id) REFERENCES user(id),
+                              FOREIGN KEY (rule_id) REFERENCES schedule_rule(id)
+                          )''')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_dose_event_due ON dose_event (due)')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_dose_event_user_due ON dose_event (user_id, due)')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_dose_event_medication_due ON dose_event (medication_id, due)')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_dose_event_schedule ON dose_event (schedule_id)')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_dose_event_rule_due ON dose_event (rule_id, due)')
+
+
+def cover_schedule_time_index(connection):
+    # (time, id, user_id) holds every schedule column, so cross-user
+    # time-window reads are answered from the index, in the (time, id)
+    # keyset order, instead of one table lookup per row.
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_schedule_time_id_user ON schedule (time, id, user_id)')
+
+
+def add_medication_search(connection):
+    # medication_label holds each distinct (Name, Dosage) once with a use
+    # count, kept in step by triggers on medication. Search runs over the
+    # labels, which stay small however many medication rows there are, and
+    # then fetches matching rows through idx_medication_name_dosage.
+    connection.execute('''CREATE TABLE IF NOT EXISTS medication_label (
+                              id INTEGER PRIMARY KEY,
+                              Name TEXT NOT NULL,
+                              Dosage TEXT NOT NULL,
+                              uses INTEGER NOT NULL,
+                              UNIQUE (Name, Dosage)
+                          )''')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_medication_name_dosage ON medication (Name, Dosage)')
+    connection.execute('''INSERT INTO medication_label (Name, Dosage, uses)
+                          SELECT Name, Dosage, COUNT(*) FROM medication GROUP BY Name, Dosage''')
+    add_label = '''INSERT INTO medication_label (Name, Dosage, uses) VALUES (NEW.Name, NEW.Dosage, 1)
+                   ON CONFLICT (Name, Dosage) DO UPDATE SET uses = uses + 1;'''
+    drop_label = '''UPDATE medication_label SET uses = uses - 1 WHERE Name = OLD.Name AND Dosage = OLD.Dosage;
+                    DELETE FROM medication_label WHERE Name = OLD.Name AND Dosage = OLD.Dosage AND uses <= 0;'''
+    connection.execute(f'CREATE TRIGGER IF NOT EXISTS trg_medication_label_insert AFTER INSERT ON medication '
+                       f'BEGIN {add_label} END')
+    connection.execute(f'CREATE TRIGGER IF NOT EXISTS trg_medication_label_delete AFTER DELETE ON medication '
+                       f'BEGIN {drop_label} END')
+    connection.execute(f'CREATE TRIGGER IF NOT EXISTS trg_medication_label_update AFTER UPDATE OF Name, Dosage '
+                       f'ON medication BEGIN {drop_label} {add_label} END')
+
+    # The trigram tokenizer needs SQLite 3.34+ built with FTS5. Without it
+    # searches fall back to LIKE over medication_label.
+    try:
+        connection.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS medication_label_fts USING fts5(
+                                  Name, Dosage, content='medication_label', content_rowid='id',
+                                  tokenize='trigram'
+                              )''')
+    except sqlite3.OperationalError:
+        return
+    connection.execute("INSERT INTO medication_label_fts (medication_label_fts) VALUES ('rebuild')")
+    connection.execute('''CREATE TRIGGER IF NOT EXISTS trg_medication_label_fts_insert AFTER INSERT ON medication_label
+                          BEGIN
+                              INSERT INTO medication_label_fts (rowid, Name, Dosage) VALUES (NEW.id, NEW.Name, NEW.Dosage);
+                          END''')
+    connection.execute('''CREATE TRIGGER IF NOT EXISTS trg_medication_label_fts_delete AFTER DELETE ON medication_label
+                          BEGIN
+                              INSERT INTO medication_label_fts (medication_label_fts, rowid, Name, Dosage)
+                              VALUES ('delete', OLD.id, OLD.Name, OLD.Dosage);
+                          END''')
+
+
+def add_change_log(connection):
+    # Every insert, update and delete on the synced tables appends
+    # (table, id, operation) here; seq orders changes in commit order.
+    # time is UTC epoch seconds, only used for age-based pruning.
+    connection.execute('''CREATE TABLE IF NOT EXISTS change_log (
+                              seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                              table_name TEXT NOT NULL,
+                              row_id INTEGER NOT NULL,
+                              operation TEXT NOT NULL CHECK (operation IN ('insert', 'update', 'delete')),
+                              time INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+                          )''')
+    for table in ('medication', 'schedule', 'reminder'):
+        for event, row in [('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')]:
+            connection.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_change_{event.lower()}
+                                   AFTER {event} ON {table}
+                                   BEGIN
+                                       INSERT INTO change_log (table_name, row_id, operation)
+                                       VALUES ('{table}', {row}.id, '{event.lower()}');
+                                   END''')
+    # One row per restore that took the log back: seqs after restored_seq
+    # up to lost_seq belong to the discarded history (see models/change_log.py).
+    connection.execute('''CREATE TABLE IF NOT EXISTS change_log_rewind (
+                              restored_seq INTEGER NOT NULL,
+                              lost_seq INTEGER NOT NULL,
+                              time INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                              PRIMARY KEY (restored_seq, lost_seq)
+                          )''')
+
+
+# Current time on the scale of the stored times (wall-clock seconds).
+NOW = "CAST(strftime('%s', 'now', 'localtime') AS INTEGER)"
+
+# Recompute parts of next_dose rows matching a condition. Each lookup is
+# one seek on idx_schedule_user_time / idx_reminder_medication_time.
+NEXT_SCHEDULE = '''UPDATE next_dose SET (schedule_id, schedule_time) =
+                       (SELECT id, time FROM schedule
+                        WHERE user_id = next_dose.user_id AND time >= {now} ORDER BY time, id LIMIT 1)
+                   WHERE {where};'''
+NEXT_REMINDER = '''UPDATE next_dose SET (reminder_id, reminder_time) =
+                       (SELECT id, time FROM reminder
+                        WHERE medication_id = next_dose.medication_id AND time >= {now} ORDER BY time, id LIMIT 1)
+                   WHERE {where};'''
+NEXT_DUE = '''UPDATE next_dose SET due =
+                  CASE WHEN schedule_time IS NULL OR reminder_time < schedule_time THEN reminder_time
+                       ELSE schedule_time END
+              WHERE {where};'''
+
+
+def next_dose_statements(where, parts=('schedule', 'reminder'), now=NOW):
+    # Statements that bring the matching next_dose rows up to date; where
+    # must not depend on the columns being refreshed.
+    updates = {'schedule': NEXT_SCHEDULE, 'reminder': NEXT_REMINDER}
+    return [updates[part].format(where=where, now=now) for part in parts] + [NEXT_DUE.format(where=where)]
+
+
+def add_next_doses(connection):
+    # One row per medication with the user's next schedule and the
+    # medication's next reminder from now on; due is the earlier of the two.
+    # Triggers refresh the affected rows on every write; rows whose due has
+    # passed are refreshed by NextDoseManager before it reads.
+    connection.execute('''CREATE TABLE IF NOT EXISTS next_dose (
+                              medication_id INTEGER PRIMARY KEY,
+                              user_id INTEGER,
+                              schedule_id INTEGER,
+                              schedule_time INTEGER,
+                              reminder_id INTEGER,
+                              reminder_time INTEGER,
+                              due INTEGER
+                          )''')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_next_dose_due ON next_dose (due)')
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_next_dose_user_due ON next_dose (user_id, due)')
+    connection.execute('INSERT OR IGNORE INTO next_dose (medication_id, user_id) SELECT id, user_id FROM medication')
+    for statement in next_dose_statements('1'):
+        connection.execute(statement)
+
+    def refresh(where, parts=('schedule', 'reminder')):
+        return ' '.join(next_dose_statements(where, parts))
+
+    triggers = {
+        'medication_insert': ('AFTER INSERT ON medication',
+                              'INSERT INTO next_dose (medication_id, user_id) VALUES (NEW.id, NEW.user_id); '
+                              + refresh('medication_id = NEW.id')),
+        'medication_update': ('AFTER UPDATE OF user_id ON medication',
+                              'UPDATE next_dose SET user_id = NEW.user_id WHERE medication_id = NEW.id; '
+                              + refresh('medication_id = NEW.id')),
+        'medication_delete': ('AFTER DELETE ON medication',
+                              'DELETE FROM next_dose WHERE medication_id = OLD.id;'),
+        # An insert can only move the next time earlier, so it needs no lookup.
+        'schedule_insert': ('AFTER INSERT ON schedule',
+                            f'''UPDATE next_dose SET schedule_id = NEW.id, schedule_time = NEW.time,
+                                    due = CASE WHEN reminder_time < NEW.time THEN reminder_time ELSE NEW.time END
+                                WHERE user_id = NEW.user_id AND NEW.time >= {NOW}
+                                      AND (schedule_time IS NULL OR NEW.time < schedule_time);'''),
+        'schedule_update': ('AFTER UPDATE OF user_id, time ON schedule',
+                            refresh('user_id IN (OLD.user_id, NEW.user_id)', ['schedule'])),
+        'schedule_delete': ('AFTER DELETE ON schedule',
+                            refresh('user_id = OLD.user_id', ['schedule'])),
+        'reminder_insert': ('AFTER INSERT ON reminder',
+                            f'''UPDATE next_dose SET reminder_id = NEW.id, reminder_time = NEW.time,
+                                    due = CASE WHEN schedule_time < NEW.time THEN schedule_time ELSE NEW.time END
+                                WHERE medication_id = NEW.medication_id AND NEW.time >= {NOW}
+                                      AND (reminder_time IS NULL OR NEW.time < reminder_time);'''),
+        'reminder_update': ('AFTER UPDATE OF medication_id, time ON reminder',
+                            refresh('medication_id IN (OLD.medication_id, NEW.medication_id)', ['reminder'])),
+        'reminder_delete': ('AFTER DELETE ON reminder',
+                            refresh('medication_id = OLD.medication_id', ['reminder'])),
+    }
+    for name, (event, body) in triggers.items():
+        connection.execute(f'CREATE TRIGGER IF NOT EXISTS trg_next_dose_{name} {event} BEGIN {body} END')
+
+
+def add_archive_horizon(connection):
+    # For each archived table, the cutoff below which rows may have been
+    # moved to the archive file (see models/archive.py). Range queries that
+    # start at or after it never open the archive.
+    connection.execute('''CREATE TABLE IF NOT EXISTS archive_horizon (
+                              table_name TEXT PRIMARY KEY,
+                              before INTEGER NOT NULL
+                          )''')
+
+
+# Steps 1-5 use IF NOT EXISTS / column checks so they also adopt databases
+# created before versioning, which all report user_version 0.
+MIGRATIONS = [
+    (1, 'base tables', create_base_tables),
+    (2, 'epoch timestamps', convert_timestamps),
+    (3, 'time indexes', add_time_indexes),
+    (4, 'dispatcher state', add_dispatcher_state),
+    (5, 'schedule rules', add_schedule_rules),
+    (6, 'dose events', add_dose_events),
+    (7, 'covering schedule time index', cover_schedule_time_index),
+    (8, 'medication search', add_medication_search),
+    (9, 'change log', add_change_log),
+    (10, 'next doses', add_next_doses),
+    (11, 'archive horizon', add_archive_horizon),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(connection):
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(connection, target=LATEST_VERSION):
+    # Must run inside a write transaction; returns the versions applied.
+    current = schema_version(connection)
+    if current > LATEST_VERSION:
+        raise RuntimeError(f"Database schema version {current} is newer than this code ({LATEST_VERSION})")
+    applied = []
+    for version, _, step in MIGRATIONS:
+        if current < version <= target:
+            step(connection)
+            connection.execute(f'PRAGMA user_version = {version}')
+            applied.append(version)
+    return applied
@@ -0,0 +1,130 @@
+# models/next_dose.py
+#
+# "What is due next" from the next_dose projection (migration 10): one row
+# per medication holding its user's next schedule and its own next
+# reminder, so a user's upcoming doses or everything due in a window is a
+# single range read on idx_next_dose_user_due / idx_next_dose_due.
+#
+# Writes keep rows current through triggers. Rows go stale only as time
+# passes their due time; they are refreshed here, in one indexed UPDATE,
+# before each read that could see them.
+#
+# Recurring schedule rules cannot be projected by triggers, since their
+# next occurrence moves with time alone. Each user's next rule occurrence
+# is worked out when reading instead and counts towards due for each of
+# their medications.
+from models.database import get_database, init_db, PAGE_SIZE
+from models.metrics import instrument
+from models.migrations import next_dose_statements
+from models.records import next_dose_from_row, format_next_dose, print_rows
+from models.recurrence import next_occurrence
+from models.timeutil import now_epoch, parse_time, to_epoch
+
+NEXT_DOSE_SELECT = '''SELECT n.medication_id, n.user_id, m.Name, m.Dosage, n.due,
+                             n.schedule_id, n.schedule_time, n.reminder_id, n.reminder_time, r.message
+                      FROM next_dose n
+                      JOIN medication m ON m.id = n.medication_id
+                      LEFT JOIN reminder r ON r.id = n.reminder_id'''
+
+
+class NextDoseManager:
+    def __init__(self, db=None):
+        self.db = db or get_database()
+        if self.db.config.metrics:
+            instrument(self)
+
+    def refresh(self, now=None):
+        # Moves rows whose due time has passed on to their next schedule and
+        # reminder. Returns the number of rows refreshed; when none are
+        # stale this is one indexed read and no write.
+        now = now_epoch() if now is None else now
+        if not self.db.query_one('SELECT 1 FROM next_dose WHERE due < ? LIMIT 1', (now,)):
+            return 0
+
+        def work(connection):
+            stale = connection.execute('SELECT COUNT(*) FROM next_dose WHERE due < ?', (now,)).fetchone()[0]
+            for statement in next_dose_statements(f'due < {int(now)}', now=int(now)):
+                connection.execute(statement)
+            return stale
+
+        return self.db.write(work)
+
+    def _next_rule_doses(self, user_id, lower, upper):
+        # {user_id: (time, rule_id)}: each user's first recurring dose at or
+        # after lower (and not after upper, if given).
+        conditions = ['user_id IS NOT NULL', '(until IS NULL OR until >= ?)']
+        parameters = [lower]
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            parameters.append(user_id)
+        if upper is not None:
+            conditions.append('start <= ?')
+            parameters.append(upper)
+        rules = self.db.query('SELECT id, user_id, start, until, interval_seconds, weekdays FROM schedule_rule '
+                              f'WHERE {" AND ".join(conditions)}', parameters)
+        found = {}
+        for rule_id, rule_user_id, start, until, interval_seconds, weekdays in rules:
+            time = next_occurrence(start, interval_seconds, until, weekdays, lower)
+            if time is None or (upper is not None and time > upper):
+                continue
+            if rule_user_id not in found or (time, rule_id) < found[rule_user_id]:
+                found[rule_user_id] = (time, rule_id)
+        return found
+
+    def next_doses(self, user_id=None, start_time=None, end_time=None):
+        # A user's upcoming doses, and/or everything due between start_time
+        # and end_time, in due order. Past windows are empty: the projection
+        # only looks forward.
+        now = now_epoch()
+        self.refresh(now)
+        lower, upper = now, None
+        if start_time and end_time:
+            lower = max(to_epoch(parse_time(start_time)), now)
+            upper = to_epoch(parse_time(end_time))
+        rule_doses = self._next_rule_doses(user_id, lower, upper)
+        if user_id is not None:
+            rows = self.db.query(f'{NEXT_DOSE_SELECT} WHERE n.user_id = ?', (user_id,))
+        else:
+            rows = self.db.query(f'{NEXT_DOSE_SELECT} WHERE n.due BETWEEN ? AND ?', (lower, upper))
+            # Medications of users whose only dose in the window is a rule's.
+            seen = {row[0] for row in rows}
+            users = sorted(rule_doses)
+            for index in range(0, len(users), PAGE_SIZE):
+                chunk = users[index:index + PAGE_SIZE]
+                placeholders = ', '.join('?' * len(chunk))
+                rows.extend(row for row in self.db.query(f'{NEXT_DOSE_SELECT} WHERE n.user_id IN ({placeholders})',
+                                                         chunk) if row[0] not in seen)
+        doses = []
+        for row in rows:
+            due = row[4]
+            if due is not None and (due < lower or (upper is not None and due > upper)):
+                due = None
+            rule_time, rule_id = rule_doses.get(row[1], (None, None))
+            if rule_time is not None and (due is None or rule_time < due):
+                due = rule_time
+            if due is not None:
+                doses.append(row[:4] + (due,) + row[5:] + (rule_id, rule_time))
+        doses.sort(key=lambda row: (row[4], row[0]))
+        return [next_dose_from_row(row) for row in doses]
+
+    def find_next_doses(self, user_id=None, start_time=None, end_time=None):
+        if user_id is None and (start_time is None or end_time is None):
+            print("Please provide a user ID or start_time and end_time.")
+            return []
+        try:
+            doses = self.next_doses(user_id, start_time, end_time)
+        except ValueError:
+            print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
+            return []
+        print_rows(doses, format_next_dose, "Nothing is due.")
+        return doses
+
+    def close(self):
+        pass
+
+if __name__ == "__main__":
+    init_db()
+    manager = NextDoseManager()
+    # Example usage
+    manager.find_next_doses(1)
+    manager.close()
@@ -0,0 +1,97 @@
+# models/records.py
+from collections import namedtuple
+from models.recurrence import format_weekdays
+from models.timeutil import from_epoch
+
+Medication = namedtuple('Medication', ['id', 'name', 'dosage', 'user_id'])
+Schedule = namedtuple('Schedule', ['id', 'user_id', 'time'])
+Reminder = namedtuple('Reminder', ['id', 'medication_id', 'time', 'message'])
+ScheduleRule = namedtuple('ScheduleRule', ['id', 'user_id', 'start', 'until', 'interval_seconds', 'weekdays'])
+ScheduleOccurrence = namedtuple('ScheduleOccurrence', ['rule_id', 'user_id', 'time'])
+DoseEvent = namedtuple('DoseEvent', ['id', 'schedule_id', 'medication_id', 'user_id', 'due', 'time', 'status',
+                                     'rule_id'])
+NextDose = namedtuple('NextDose', ['medication_id', 'user_id', 'name', 'dosage', 'due', 'schedule_id', 'schedule_time',
+                                   'reminder_id', 'reminder_time', 'message', 'rule_id', 'rule_time'])
+
+
+def medication_from_row(row):
+    return Medication(*row)
+
+
+def schedule_from_row(row):
+    return Schedule(row[0], row[1], from_epoch(row[2]))
+
+
+def reminder_from_row(row):
+    return Reminder(row[0], row[1], from_epoch(row[2]), row[3])
+
+
+def schedule_rule_from_row(row):
+    return ScheduleRule(row[0], row[1], from_epoch(row[2]),
+                        from_epoch(row[3]) if row[3] is not None else None, row[4], row[5])
+
+
+def dose_event_from_row(row):
+    return DoseEvent(row[0], row[1], row[2], row[3], from_epoch(row[4]), from_epoch(row[5]), row[6], row[7])
+
+
+def next_dose_from_row(row):
+    return NextDose(row[0], row[1], row[2], row[3], from_epoch(row[4]),
+                    row[5], from_epoch(row[6]) if row[6] is not None else None,
+                    row[7], from_epoch(row[8]) if row[8] is not None else None, row[9],
+                    row[10], from_epoch(row[11]) if row[11] is not None else None)
+
+
+def format_medication(med):
+    return f"Medication ID: {med.id}, Name: {med.name}, Dosage: {med.dosage}, User ID: {med.user_id}"
+
+
+def format_schedule(schedule):
+    return f"Schedule ID: {schedule.id}, User ID: {schedule.user_id}, Time: {schedule.time}"
+
+
+def format_schedule_rule(rule):
+    until = rule.until if rule.until is not None else 'no end'
+    return (f"Rule ID: {rule.id}, User ID: {rule.user_id}, Start: {rule.start}, Until: {until}, "
+            f"Every: {rule.interval_seconds // 60} min, Days: {format_weekdays(rule.weekdays)}")
+
+
+def format_occurrence(occurrence):
+    if isinstance(occurrence, Schedule):
+        return format_schedule(occurrence)
+    return f"Rule ID: {occurrence.rule_id}, User ID: {occurrence.user_id}, Time: {occurrence.time}"
+
+
+def format_reminder(rem):
+    return f"Reminder ID: {rem.id}, Medication ID: {rem.medication_id}, Time: {rem.time}, Message: {rem.message}"
+
+
+def format_dose_event(event):
+    if event.rule_id is not None:
+        schedule = f"Rule ID: {event.rule_id}"
+    else:
+        schedule = f"Schedule ID: {event.schedule_id if event.schedule_id is not None else 'unscheduled'}"
+    return (f"Dose ID: {event.id}, {schedule}, Medication ID: {event.medication_id}, "
+            f"User ID: {event.user_id}, Due: {event.due}, Time: {event.time}, Status: {event.status}")
+
+
+def format_next_dose(dose):
+    text = f"Due: {dose.due}, User ID: {dose.user_id}, Medication ID: {dose.medication_id} ({dose.name} {dose.dosage})"
+    if dose.schedule_id is not None:
+        text += f", Schedule ID: {dose.schedule_id} at {dose.schedule_time}"
+    if dose.rule_id is not None:
+        text += f", Rule ID: {dose.rule_id} at {dose.rule_time}"
+    if dose.reminder_id is not None:
+        text += f", Reminder ID: {dose.reminder_id} at {dose.reminder_time}: {dose.message}"
+    return text
+
+
+def print_rows(rows, formatter, empty_message=None):
+    # Prints rows as they arrive from a generator and returns how many there were.
+    count = 0
+    for row in rows:
+        print(formatter(row))
+        count += 1
+    if count == 0 and empty_message:
+        print(empty_message)
+    return count
@@ -0,0 +1,74 @@
+# models/recurrence.py
+import math
+import re
+
+WEEKDAY_NAMES = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+WEEKDAYS_ONLY = 0b0011111
+INTERVAL_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_interval(text):
+    # '90m', '8h', '1d', '2w' -> seconds
+    match = re.fullmatch(r'\s*(\d+)\s*([mhdw])\s*', text.lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid interval: {text!r}. Use a number followed by m, h, d or w")
+    return int(match.group(1)) * INTERVAL_UNITS[match.group(2)]
+
+
+def parse_weekdays(text):
+    # 'weekdays', 'weekends' or a comma list like 'mon,wed,fri' -> bitmask (Monday = bit 0)
+    text = text.strip().lower()
+    if text == 'weekdays':
+        return WEEKDAYS_ONLY
+    if text == 'weekends':
+        return 0b1100000
+    mask = 0
+    for name in text.split(','):
+        name = name.strip()[:3]
+        if name not in WEEKDAY_NAMES:
+            raise ValueError(f"Invalid weekday: {name!r}")
+        mask |= 1 << WEEKDAY_NAMES.index(name)
+    return mask
+
+
+def format_weekdays(mask):
+    if not mask:
+        return 'every day'
+    return ','.join(name for bit, name in enumerate(WEEKDAY_NAMES) if mask & (1 << bit))
+
+
+def weekday(epoch_seconds):
+    # 1970-01-01 was a Thursday (Monday = 0).
+    return (epoch_seconds // 86400 + 3) % 7
+
+
+def expand(start, interval, until, weekdays, window_start, window_end):
+    # Yields the occurrence times of one rule inside [window_start, window_end].
+    # The first occurrence is found arithmetically, so the cost depends on the
+    # window, not on how long ago the rule started.
+    last = window_end if until is None else min(window_end, until)
+    if window_start > start:
+        steps = -(-(window_start - start) // interval)
+        current = start + steps * interval
+    else:
+        current = start
+    while current <= last:
+        if not weekdays or weekdays & (1 << weekday(current)):
+            yield current
+        current += interval
+
+
+def nearest_occurrence(start, interval, until, weekdays, time):
+    # The rule's occurrence closest to time, or None if there is none
+    # within one interval of it.
+    candidates = expand(start, interval, until, weekdays, time - interval, time + interval)
+    return min(candidates, key=lambda occurrence: abs(occurrence - time), default=None)
+
+
+def next_occurrence(start, interval, until, weekdays, after):
+    # The rule's first occurrence at or after after, or None. Which weekday
+    # an occurrence falls on repeats every lcm(interval, week), so searching
+    # one such cycle is enough.
+    week = INTERVAL_UNITS['w']
+    cycle = interval * week // math.gcd(interval, week)
+    return next(expand(start, interval, until, weekdays, after, after + cycle), None)
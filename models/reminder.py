@@ -1,37 +1,76 @@
+# models/reminder.py
 import sqlite3
-import datetime
+from models.archive import with_archived
+from models.database import get_database, init_db, BULK_CHUNK_SIZE, PAGE_SIZE
+from models.metrics import instrument
+from models.records import reminder_from_row, format_reminder, print_rows
+from models.timeutil import parse_time, to_epoch
 
 class ReminderManager:
-    def __init__(self):
-        self.connection = sqlite3.connect('medicationtracker.db')
-        self.cursor = self.connection.cursor()
-      
+    def __init__(self, db=None):
+        self.db = db or get_database()
+        if self.db.config.metrics:
+            instrument(self)
+
     def add_reminder(self, medication_id, reminder_time, message):
         try:
-            parsed_time = datetime.datetime.strptime(reminder_time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('INSERT INTO reminder (medication_id, reminder_time, message) VALUES (?, ?, ?)',
-                                (medication_id, parsed_time, message))
-            self.connection.commit()
+            parsed_time = parse_time(reminder_time)
+            reminder_id = self.db.insert('INSERT INTO reminder (medication_id, time, message) VALUES (?, ?, ?)',
+                                         (medication_id, to_epoch(parsed_time), message))
             print(f"Added reminder for Medication ID: {medication_id} at {parsed_time} with message: {message}")
+            return reminder_id
         except ValueError:
             print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
 
+    def add_reminders_bulk(self, reminders, chunk_size=BULK_CHUNK_SIZE):
+        # reminders yields (medication_id, 'YYYY-MM-DD HH:MM', message) rows.
+        def prepare(row):
+            medication_id, reminder_time, message = row
+            return (medication_id, to_epoch(parse_time(reminder_time)), message)
+
+        result = self.db.insert_many('INSERT INTO reminder (medication_id, time, message) VALUES (?, ?, ?)',
+                                     reminders, prepare, chunk_size)
+        print(f"Added {result.inserted} reminders, {len(result.failures)} failed")
+        return result
+
+    def iter_reminders(self, medication_id=None, time=None, start_time=None, end_time=None, page_size=PAGE_SIZE):
+        # Lookups are an equality on medication_id and/or a condition on time,
+        # paged from idx_reminder_medication_time or idx_reminder_time.
+        conditions = []
+        parameters = []
+
+        if medication_id is not None:
+            conditions.append("medication_id = ?")
+            parameters.append(medication_id)
+
+        window = None
+        if time is not None:
+            window = (to_epoch(parse_time(time)),) * 2
+        elif start_time is not None and end_time is not None:
+            window = (to_epoch(parse_time(start_time)), to_epoch(parse_time(end_time)))
+        lower = None
+        if window:
+            conditions.append("time <= ?")
+            parameters.append(window[1])
+            lower = ("time >= ?", [window[0]])
+
+        order = ('time', 'id') if conditions else ('id',)
+        records = map(reminder_from_row, self.db.iter_keyset('reminder', conditions, parameters, order, page_size, lower))
+        if window:
+            # Archived rows in the window are merged back in.
+            records = with_archived(self.db, 'reminder', records, medication_id, *window)
+        yield from records
+
     def view_reminders(self):
-        self.cursor.execute('SELECT * FROM reminder')
-        reminders = self.cursor.fetchall()
-        if reminders:
-            for rem in reminders:
-                print(f"Reminder ID: {rem[0]}, Medication ID: {rem[1]}, Time: {rem[2]}, Message: {rem[3]}")
-        else:
-            print("No reminders found.")
+        return print_rows(self.iter_reminders(), format_reminder, "No reminders found.")
 
     def delete_reminder(self, reminder_id):
         try:
-            self.cursor.execute('DELETE FROM reminder WHERE id = ?', (reminder_id,))
-            self.connection.commit()
+            deleted = self.db.execute('DELETE FROM reminder WHERE id = ?', (reminder_id,))
             print(f"Deleted reminder with ID: {reminder_id}")
+            return deleted
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
 
@@ -41,9 +80,8 @@ class ReminderManager:
             parameters = []
             
             if new_time:
-                parsed_time = datetime.datetime.strptime(new_time, '%Y-%m-%d %H:%M')
-                updates.append("reminder_time = ?")
-                parameters.append(parsed_time)
+                updates.append("time = ?")
+                parameters.append(to_epoch(parse_time(new_time)))
 
             if new_message:
                 updates.append("message = ?")
@@ -52,51 +90,40 @@ class ReminderManager:
             if updates:
                 parameters.append(reminder_id)
                 query = f'UPDATE reminder SET {", ".join(updates)} WHERE id = ?'
-                self.cursor.execute(query, parameters)
-                self.connection.commit()
+                updated = self.db.execute(query, parameters)
                 print(f"Updated reminder ID: {reminder_id}")
-            else:
-                print("No updates provided.")
+                return updated
+            print("No updates provided.")
+            return 0
         except ValueError:
             print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
 
-    def find_reminder(self, medication_id=None, time=None):
+    def find_reminder(self, medication_id=None, time=None, start_time=None, end_time=None):
+        if medication_id is None and time is None and (start_time is None or end_time is None):
+            print("Please provide at least one search criterion: medication_id, time or start_time and end_time.")
+            return []
         try:
-            query = 'SELECT * FROM reminder WHERE'
-            conditions = []
-            parameters = []
-
-            if medication_id is not None:
-                conditions.append("medication_id = ?")
-                parameters.append(medication_id)
-
-            if time is not None:
-                parsed_time = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M')
-                conditions.append("reminder_time = ?")
-                parameters.append(parsed_time)
-
-            if conditions:
-                query += ' AND '.join(conditions)
-                self.cursor.execute(query, parameters)
-                reminders = self.cursor.fetchall()
-                if reminders:
-                    for rem in reminders:
-                        print(f"Reminder ID: {rem[0]}, Medication ID: {rem[1]}, Time: {rem[2]}, Message: {rem[3]}")
-                else:
-                    print("No reminders found with the given criteria.")
-            else:
-                print("Please provide at least one search criterion: medication_id or time.")
+            reminders = []
+            for rem in self.iter_reminders(medication_id, time, start_time, end_time):
+                print(format_reminder(rem))
+                reminders.append(rem)
+            if not reminders:
+                print("No reminders found with the given criteria.")
+            return reminders
         except ValueError:
             print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
+            return []
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
+            return []
 
     def close(self):
-        self.connection.close()
+        pass
 
 if __name__ == "__main__":
+    init_db()
     manager = ReminderManager()
     # Example usage
     manager.add_reminder(1, '2024-12-25 09:00', 'Take your morning medication.')
@@ -1,85 +1,282 @@
 # schedule.py
+import heapq
 import sqlite3
-import datetime
+from models.archive import with_archived
+from models.database import get_database, init_db, BULK_CHUNK_SIZE, PAGE_SIZE
+from models.metrics import instrument
+from models.records import (Schedule, ScheduleOccurrence, schedule_from_row, schedule_rule_from_row,
+                            format_schedule, format_schedule_rule, format_occurrence, print_rows)
+from models.recurrence import parse_interval, parse_weekdays, expand
+from models.schedule_index import get_schedule_index
+from models.timeutil import parse_time, to_epoch, from_epoch
+
+def _describe(record):
+    if isinstance(record, Schedule):
+        return f"Schedule ID {record.id} at {record.time}"
+    return f"Rule ID {record.rule_id} at {record.time}"
+
 
 class ScheduleManager:
-    def __init__(self):
-        self.connection = sqlite3.connect('schedule.db')
-        self.cursor = self.connection.cursor()
-        
+    def __init__(self, db=None, index=None):
+        self.db = db or get_database()
+        self.index = index or get_schedule_index(self.db)
+        if self.db.config.metrics:
+            instrument(self)
+
+    def _gap_seconds(self, minutes=None):
+        return int((self.db.config.min_dose_gap_minutes if minutes is None else minutes) * 60)
+
+    def _near(self, user_id, epoch, gap, exclude=None):
+        # The user's stored doses (from the interval index) and recurring
+        # rule doses within gap of epoch, in time order.
+        stored = [Schedule(schedule_id, user_id, from_epoch(other_time))
+                  for other_time, schedule_id in self.index.near(user_id, epoch, gap, exclude=exclude)]
+        return list(heapq.merge(stored, self.iter_occurrences(epoch - gap, epoch + gap, user_id),
+                                key=lambda record: record.time))
+
+    def _report_conflicts(self, user_id, schedule_id, epoch, conflicts):
+        for other in conflicts:
+            print(f"Warning: Schedule ID {schedule_id} for User ID {user_id} at {from_epoch(epoch)} is "
+                  f"{abs(epoch - to_epoch(other.time)) // 60} min from {_describe(other)}")
+
     def add_schedule(self, user_id, schedule_time):
+        # Doses closer than min_dose_gap_minutes to another of the user's
+        # doses are still added, but reported.
         try:
-            parsed_time = datetime.datetime.strptime(schedule_time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('INSERT INTO schedule (user_id, time) VALUES (?, ?)',
-                                (user_id, parsed_time))
-            self.connection.commit()
+            parsed_time = parse_time(schedule_time)
+            epoch = to_epoch(parsed_time)
+            conflicts = self._near(user_id, epoch, self._gap_seconds())
+            schedule_id = self.db.insert('INSERT INTO schedule (user_id, time) VALUES (?, ?)', (user_id, epoch))
+            self.index.add(user_id, epoch, schedule_id)
             print(f"Added schedule for User ID: {user_id} at {parsed_time}")
+            self._report_conflicts(user_id, schedule_id, epoch, conflicts)
+            return schedule_id
         except ValueError:
             print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
 
+    def add_schedules_bulk(self, schedules, chunk_size=BULK_CHUNK_SIZE):
+        # schedules yields (user_id, 'YYYY-MM-DD HH:MM') rows.
+        def prepare(row):
+            user_id, schedule_time = row
+            return (user_id, to_epoch(parse_time(schedule_time)))
+
+        result = self.db.insert_many('INSERT INTO schedule (user_id, time) VALUES (?, ?)',
+                                     schedules, prepare, chunk_size)
+        self.index.clear()
+        print(f"Added {result.inserted} schedules, {len(result.failures)} failed")
+        return result
+
+    def add_recurring_schedule(self, user_id, start_time, interval, until=None, weekdays=None):
+        # One row describes every dose, e.g. interval='8h', weekdays='weekdays'.
+        try:
+            start = to_epoch(parse_time(start_time))
+            end = to_epoch(parse_time(until)) if until else None
+            if end is not None and end < start:
+                raise ValueError("Until must not be before the start time")
+            interval_seconds = parse_interval(interval)
+            mask = parse_weekdays(weekdays) if weekdays else None
+            rule_id = self.db.insert('INSERT INTO schedule_rule (user_id, start, until, interval_seconds, weekdays) '
+                                     'VALUES (?, ?, ?, ?, ?)',
+                                     (user_id, start, end, interval_seconds, mask))
+            print(f"Added recurring schedule for User ID: {user_id} every {interval} from {from_epoch(start)}")
+            return rule_id
+        except ValueError as e:
+            print(f"Invalid recurring schedule: {e}")
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+
+    def iter_schedule_rules(self, user_id=None):
+        conditions = ['user_id = ?'] if user_id is not None else []
+        parameters = [user_id] if user_id is not None else []
+        for row in self.db.iter_keyset('schedule_rule', conditions, parameters):
+            yield schedule_rule_from_row(row)
+
+    def view_schedule_rules(self, user_id=None):
+        return print_rows(self.iter_schedule_rules(user_id), format_schedule_rule, "No recurring schedules found.")
+
+    def delete_schedule_rule(self, rule_id):
+        try:
+            deleted = self.db.execute('DELETE FROM schedule_rule WHERE id = ?', (rule_id,))
+            print(f"Deleted recurring schedule with ID: {rule_id}")
+            return deleted
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+
+    def iter_occurrences(self, window_start, window_end, user_id=None):
+        # Expands only the rules that overlap [window_start, window_end]
+        # (epoch seconds) and merges their doses in time order.
+        conditions = 'start <= ? AND (until IS NULL OR until >= ?)'
+        parameters = [window_end, window_start]
+        if user_id is not None:
+            conditions = 'user_id = ? AND ' + conditions
+            parameters.insert(0, user_id)
+        rules = self.db.query('SELECT id, user_id, start, until, interval_seconds, weekdays '
+                              f'FROM schedule_rule WHERE {conditions}', parameters)
+
+        def occurrences(rule):
+            rule_id, rule_user_id, start, until, interval_seconds, weekdays = rule
+            for time in expand(start, interval_seconds, until, weekdays, window_start, window_end):
+                yield ScheduleOccurrence(rule_id, rule_user_id, from_epoch(time))
+
+        return heapq.merge(*[occurrences(rule) for rule in rules], key=lambda occurrence: occurrence.time)
+
+    def iter_schedules(self, user_id=None, time=None, start_time=None, end_time=None, page_size=PAGE_SIZE):
+        # Every combination is an equality on user_id followed by a condition
+        # on time, so pages come from idx_schedule_user_time or
+        # idx_schedule_time_id_user in (time, id) order without a table scan.
+        conditions = []
+        parameters = []
+
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            parameters.append(user_id)
+
+        window = None
+        if time is not None:
+            window = (to_epoch(parse_time(time)),) * 2
+        elif start_time is not None and end_time is not None:
+            window = (to_epoch(parse_time(start_time)), to_epoch(parse_time(end_time)))
+        lower = None
+        if window:
+            conditions.append("time <= ?")
+            parameters.append(window[1])
+            lower = ("time >= ?", [window[0]])
+
+        order = ('time', 'id') if conditions else ('id',)
+        records = map(schedule_from_row, self.db.iter_keyset('schedule', conditions, parameters, order, page_size, lower))
+        if window:
+            # Archived rows in the window are merged back in.
+            records = with_archived(self.db, 'schedule', records, user_id, *window)
+        yield from records
+
     def view_schedules(self):
-        self.cursor.execute('SELECT * FROM schedule')
-        schedules = self.cursor.fetchall()
-        if schedules:
-            for schedule in schedules:
-                print(f"Schedule ID: {schedule[0]}, User ID: {schedule[1]}, Time: {schedule[2]}")
-        else:
-            print("No schedules found.")
+        return print_rows(self.iter_schedules(), format_schedule, "No schedules found.")
 
     def delete_schedule(self, schedule_id):
+        def work(connection):
+            old = connection.execute('SELECT user_id, time FROM schedule WHERE id = ?', (schedule_id,)).fetchone()
+            connection.execute('DELETE FROM schedule WHERE id = ?', (schedule_id,))
+            return old
+
         try:
-            self.cursor.execute('DELETE FROM schedule WHERE id = ?', (schedule_id,))
-            self.connection.commit()
+            old = self.db.write(work)
+            if old:
+                self.index.remove(old[0], old[1], schedule_id)
             print(f"Deleted schedule with ID: {schedule_id}")
+            return 1 if old else 0
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
 
     def update_schedule(self, schedule_id, new_time):
         try:
-            parsed_time = datetime.datetime.strptime(new_time, '%Y-%m-%d %H:%M')
-            self.cursor.execute('UPDATE schedule SET time = ? WHERE id = ?', 
-                                (parsed_time, schedule_id))
-            self.connection.commit()
+            parsed_time = parse_time(new_time)
+            epoch = to_epoch(parsed_time)
+
+            def work(connection):
+                old = connection.execute('SELECT user_id, time FROM schedule WHERE id = ?', (schedule_id,)).fetchone()
+                connection.execute('UPDATE schedule SET time = ? WHERE id = ?', (epoch, schedule_id))
+                return old
+
+            old = self.db.write(work)
+            if old:
+                user_id = old[0]
+                self.index.remove(user_id, old[1], schedule_id)
+                conflicts = self._near(user_id, epoch, self._gap_seconds(), exclude=schedule_id)
+                self.index.add(user_id, epoch, schedule_id)
             print(f"Updated schedule ID: {schedule_id} to new time: {parsed_time}")
+            if old:
+                self._report_conflicts(user_id, schedule_id, epoch, conflicts)
+            return 1 if old else 0
         except ValueError:
             print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
 
-    def find_schedule(self, user_id=None, time=None):
+    def find_schedule(self, user_id=None, time=None, start_time=None, end_time=None):
+        # With a time or a start/end window, doses generated by recurring
+        # rules are merged in with the stored ones.
+        if user_id is None and time is None and (start_time is None or end_time is None):
+            print("Please provide at least one search criterion: user_id, time or start_time and end_time.")
+            return []
         try:
-            if user_id is not None and time is not None:
-                parsed_time = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M')
-                self.cursor.execute('SELECT * FROM schedule WHERE user_id = ? AND time = ?', 
-                                    (user_id, parsed_time))
-            elif user_id is not None:
-                self.cursor.execute('SELECT * FROM schedule WHERE user_id = ?', (user_id,))
-            elif time is not None:
-                parsed_time = datetime.datetime.strptime(time, '%Y-%m-%d %H:%M')
-                self.cursor.execute('SELECT * FROM schedule WHERE time = ?', (parsed_time,))
+            results = self.iter_schedules(user_id, time, start_time, end_time)
+            if time is not None:
+                window = (to_epoch(parse_time(time)),) * 2
+            elif start_time is not None and end_time is not None:
+                window = (to_epoch(parse_time(start_time)), to_epoch(parse_time(end_time)))
             else:
-                print("Please provide at least one search criterion: user_id or time.")
-                return []
+                window = None
+            if window:
+                results = heapq.merge(results, self.iter_occurrences(*window, user_id=user_id),
+                                      key=lambda schedule: schedule.time)
 
-            schedules = self.cursor.fetchall()
-            if schedules:
-                for schedule in schedules:
-                    print(f"Schedule ID: {schedule[0]}, User ID: {schedule[1]}, Time: {schedule[2]}")
-            else:
+            schedules = []
+            for schedule in results:
+                print(format_occurrence(schedule))
+                schedules.append(schedule)
+            if not schedules:
                 print("No schedules found with the given criteria.")
             return schedules
         except ValueError:
             print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
+            return []
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
             return []
 
+    def find_conflicts(self, user_id, time, minutes=None):
+        # Doses of this user, stored or generated by a recurring rule, within
+        # the gap (default min_dose_gap_minutes) either side of time.
+        return self._near(user_id, to_epoch(parse_time(time)), self._gap_seconds(minutes))
+
+    def schedules_between(self, user_id, start_time, end_time):
+        # The user's stored doses in [start_time, end_time], from the interval index.
+        entries = self.index.between(user_id, to_epoch(parse_time(start_time)), to_epoch(parse_time(end_time)))
+        return [Schedule(schedule_id, user_id, from_epoch(epoch)) for epoch, schedule_id in entries]
+
+    def iter_conflicts(self, minutes=None, user_id=None):
+        # Walks schedules in (user_id, time) order straight from
+        # idx_schedule_user_time and yields each (earlier, later) pair of
+        # neighbouring doses of the same user that are within the gap, and
+        # each stored dose paired with a recurring rule dose near it. Rules
+        # are few, so they are loaded up front; two rules are not compared
+        # with each other.
+        gap = self._gap_seconds(minutes)
+        conditions = ['user_id = ?'] if user_id is not None else []
+        parameters = [user_id] if user_id is not None else []
+        rules = {}
+        for rule in self.iter_schedule_rules(user_id):
+            rules.setdefault(rule.user_id, []).append(rule)
+        previous = None
+        for row in self.db.iter_keyset('schedule', conditions, parameters, ('user_id', 'time', 'id'),
+                                       lower=('user_id IS NOT NULL', [])):
+            if previous is not None and previous[1] == row[1] and row[2] - previous[2] <= gap:
+                yield schedule_from_row(previous), schedule_from_row(row)
+            previous = row
+            for rule in rules.get(row[1], ()):
+                for time in expand(to_epoch(rule.start), rule.interval_seconds,
+                                   to_epoch(rule.until) if rule.until is not None else None, rule.weekdays,
+                                   row[2] - gap, row[2] + gap):
+                    occurrence = ScheduleOccurrence(rule.id, rule.user_id, from_epoch(time))
+                    schedule = schedule_from_row(row)
+                    yield (occurrence, schedule) if time <= row[2] else (schedule, occurrence)
+
+    def audit_conflicts(self, minutes=None, user_id=None):
+        count = 0
+        for earlier, later in self.iter_conflicts(minutes, user_id):
+            print(f"Conflict: User ID {later.user_id}, {_describe(later)} "
+                  f"is {int((later.time - earlier.time).total_seconds()) // 60} min after {_describe(earlier)}")
+            count += 1
+        print(f"Found {count} conflicting doses.")
+        return count
+
     def close(self):
-        self.connection.close()
+        pass
 
 if __name__ == "__main__":
+    init_db()
     manager = ScheduleManager()
     # Example usage
     manager.add_schedule(1, '2024-12-25 09:00')
@@ -0,0 +1,77 @@
+# models/schedule_index.py
+import bisect
+import threading
+import weakref
+from models.cache import LRUCache
+
+_indexes = weakref.WeakKeyDictionary()
+
+
+def get_schedule_index(db):
+    # One index per Database, shared by every ScheduleManager on it, like
+    # the medication cache. Writes from other processes show up once a
+    # user's entry expires (schedule_index_ttl seconds).
+    index = _indexes.get(db)
+    if index is None:
+        index = ScheduleIndex(db, db.config.schedule_index_users, db.config.schedule_index_ttl or None)
+        _indexes[db] = index
+    return index
+
+
+class ScheduleIndex:
+    # Per-user sorted lists of (time, schedule_id), loaded from
+    # idx_schedule_user_time the first time a user is looked at and then
+    # kept in step by ScheduleManager's add/update/delete. Lookups are a
+    # bisect, so "any dose within N minutes" costs O(log n) per user.
+    def __init__(self, db, max_users=10000, ttl=None):
+        self.db = db
+        self.cache = LRUCache(max_users, ttl)
+        self._lock = threading.Lock()
+
+    def _entries(self, user_id):
+        entries = self.cache.get(user_id)
+        if entries is None:
+            generation = self.cache.generation
+            entries = [tuple(row) for row in
+                       self.db.query('SELECT time, id FROM schedule WHERE user_id IS ? ORDER BY time, id', (user_id,))]
+            self.cache.put(user_id, entries, generation)
+        return entries
+
+    def add(self, user_id, time, schedule_id):
+        entry = (time, schedule_id)
+        with self._lock:
+            entries = self.cache.get(user_id)
+            if entries is None:
+                # Not loaded: make sure a load already in flight is not kept.
+                self.cache.invalidate(user_id)
+                return
+            position = bisect.bisect_left(entries, entry)
+            if position == len(entries) or entries[position] != entry:
+                entries.insert(position, entry)
+
+    def remove(self, user_id, time, schedule_id):
+        entry = (time, schedule_id)
+        with self._lock:
+            entries = self.cache.get(user_id)
+            if entries is None:
+                self.cache.invalidate(user_id)
+                return
+            position = bisect.bisect_left(entries, entry)
+            if position < len(entries) and entries[position] == entry:
+                del entries[position]
+
+    def between(self, user_id, start, end):
+        # (time, schedule_id) pairs with start <= time <= end, in time order.
+        entries = self._entries(user_id)
+        with self._lock:
+            low = bisect.bisect_left(entries, (start,))
+            high = bisect.bisect_left(entries, (end + 1,))
+            return entries[low:high]
+
+    def near(self, user_id, time, seconds, exclude=None):
+        # Doses within seconds either side of time (inclusive), optionally
+        # leaving out one schedule id, e.g. the one being moved.
+        return [entry for entry in self.between(user_id, time - seconds, time + seconds) if entry[1] != exclude]
+
+    def clear(self):
+        self.cache.clear()
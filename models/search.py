@@ -0,0 +1,81 @@
+# models/search.py
+#
+# Ranking for MedicationTrackerDB.search_medications. A query is split into
+# words and scored against a medication's name and dosage:
+#
+#   3     the name starts with the whole query   ('amox' -> Amoxicillin)
+#   2     every word starts a word of the label  ('amoxicillin 500' -> 500mg)
+#   1     every word appears somewhere in it     ('cillin')
+#   0-1   typo match: words with no digits are compared with the name's
+#         words and all must be at least FUZZY_THRESHOLD similar ('amoxicilin')
+#
+# Ties go to the more widely used label.
+from difflib import SequenceMatcher
+from models.interactions import normalize_name
+
+SEARCH_LIMIT = 20
+FUZZY_THRESHOLD = 0.75
+# Labels fetched from the full-text index per stage before ranking.
+CANDIDATES = 500
+
+# Shortest word the trigram index can match on its own.
+TRIGRAM = 3
+
+
+def query_words(query):
+    return normalize_name(query).split()
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def match_query(words):
+    # Every word as a substring, in either column.
+    return ' AND '.join(_quote(word) for word in words if len(word) >= TRIGRAM)
+
+
+def fuzzy_query(words):
+    # Any trigram of any text word, in the name; scored afterwards.
+    trigrams = {word[i:i + TRIGRAM] for word in _text_words(words) for i in range(len(word) - TRIGRAM + 1)}
+    if not trigrams:
+        return ''
+    return 'Name : (' + ' OR '.join(_quote(trigram) for trigram in sorted(trigrams)) + ')'
+
+
+def like_pattern(word):
+    return '%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _text_words(words):
+    return [word for word in words if len(word) >= TRIGRAM and not any(c.isdigit() for c in word)]
+
+
+def score(words, name, dosage):
+    # The rank of one label for the query words, or None if it does not match.
+    if not words:
+        return None
+    name_words = normalize_name(name).split()
+    label_words = name_words + normalize_name(dosage).split()
+    label = ' '.join(label_words)
+    if ' '.join(name_words).startswith(' '.join(words)):
+        return 3.0
+    if all(any(label_word.startswith(word) for label_word in label_words) for word in words):
+        return 2.0
+    if all(word in label for word in words):
+        return 1.0
+
+    # Numbers and very short words must still match exactly.
+    similarities = []
+    for word in words:
+        if word in _text_words(words):
+            best = max((SequenceMatcher(None, word, name_word).ratio() for name_word in name_words), default=0)
+            if best < FUZZY_THRESHOLD:
+                return None
+            similarities.append(best)
+        elif word not in label:
+            return None
+    if not similarities:
+        return None
+    # Kept below 1 so typo matches never outrank substring matches.
+    return 0.99 * sum(similarities) / len(similarities)
@@ -0,0 +1,499 @@
+# models/sharding.py
+#
+# Optional sharded storage: with shards = N (MEDICATION_TRACKER_SHARDS=N)
+# users are spread over N database files next to path, e.g.
+# medicationtracker.shard0.db ... medicationtracker.shard3.db, each with its
+# own writer, so writes for different shards commit in parallel.
+#
+# - A user lives on shard user_id % N, with their medications, schedules,
+#   schedule rules and dose events; reminders follow their medication.
+# - Row ids carry their shard in the high bits: shard k's AUTOINCREMENT
+#   sequences start at k << SHARD_BITS, so update/delete by id goes
+#   straight to the right file.
+# - Per-user calls go to one shard. Cross-user finds, views and iter_*
+#   methods merge the shards' sorted streams lazily in this process, one
+#   page per shard at a time. Audits, searches and bulk inserts fan out
+#   over a process pool.
+#
+# N must not change once data has been written.
+import contextlib
+import heapq
+import io
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from operator import attrgetter
+from models.database import get_database, BulkResult, BULK_CHUNK_SIZE
+from models.dose_log import DoseLogManager
+from models.medication_tracker import MedicationTrackerDB
+from models.next_dose import NextDoseManager
+from models.records import format_medication, format_occurrence, format_reminder, format_schedule, \
+    format_schedule_rule, format_dose_event, format_next_dose, print_rows
+from models.reminder import ReminderManager
+from models.schedule import ScheduleManager
+from models.search import SEARCH_LIMIT
+from models.timeutil import parse_time, to_epoch
+
+SHARD_BITS = 40
+SEQUENCE_TABLES = ('user', 'medication', 'schedule', 'reminder', 'schedule_rule', 'dose_event')
+
+MANAGERS = {
+    'medications': MedicationTrackerDB,
+    'schedules': ScheduleManager,
+    'reminders': ReminderManager,
+    'doses': DoseLogManager,
+    'next_doses': NextDoseManager,
+}
+
+by_id = attrgetter('id')
+by_time = attrgetter('time')
+
+
+def by_time_id(record):
+    return (record.time, record.id)
+
+
+def by_due_id(record):
+    return (record.due, record.id)
+
+
+def by_due_medication(record):
+    return (record.due, record.medication_id)
+
+
+def shard_paths(path, shards):
+    stem, extension = os.path.splitext(path)
+    return [f'{stem}.shard{shard}{extension or ".db"}' for shard in range(shards)]
+
+
+def seed_sequences(connection, shard):
+    # Gives a fresh shard its id range; tables that already have a sequence
+    # are left alone.
+    for table in SEQUENCE_TABLES:
+        connection.execute('INSERT INTO sqlite_sequence (name, seq) SELECT ?, ? '
+                           'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)',
+                           (table, shard << SHARD_BITS, table))
+
+
+def _call(path, manager, method, args):
+    # Runs in a pool process on its own connection to one shard. Iterators
+    # are drained there, and anything the manager prints is sent back.
+    target = MANAGERS[manager](get_database(path))
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        result = getattr(target, method)(*args)
+        if hasattr(result, '__next__'):
+            result = list(result)
+    return result, output.getvalue()
+
+
+class ShardSet:
+    def __init__(self, config):
+        if config.shards < 2:
+            raise ValueError("Sharded mode needs at least 2 shards")
+        self.config = config
+        self.paths = shard_paths(config.path, config.shards)
+        self.databases = [get_database(path) for path in self.paths]
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def migrate(self):
+        applied = []
+        for shard, database in enumerate(self.databases):
+            applied = database.migrate() or applied
+            database.write(lambda connection, shard=shard: seed_sequences(connection, shard))
+        return applied
+
+    def for_user(self, user_id):
+        if not isinstance(user_id, int):
+            raise TypeError(f"User ID must be an integer, not {user_id!r}")
+        return user_id % len(self.paths)
+
+    def for_id(self, row_id):
+        # Ids from no shard go to shard 0, where they simply match nothing.
+        shard = row_id >> SHARD_BITS
+        return shard if 0 <= shard < len(self.paths) else 0
+
+    def pool(self):
+        # spawn, not fork: the parent holds SQLite connections and threads.
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=min(len(self.paths), os.cpu_count() or 1),
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def fan_out(self, manager, method, *args):
+        # (result, printed output) from every shard, in shard order.
+        futures = [self.pool().submit(_call, path, manager, method, args) for path in self.paths]
+        return [future.result() for future in futures]
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+_shard_sets = {}
+_shard_sets_lock = threading.Lock()
+
+
+def get_shard_set(config):
+    with _shard_sets_lock:
+        shard_set = _shard_sets.get((config.path, config.shards))
+        if shard_set is None:
+            shard_set = ShardSet(config)
+            _shard_sets[(config.path, config.shards)] = shard_set
+        return shard_set
+
+
+def close_shard_sets():
+    with _shard_sets_lock:
+        for shard_set in _shard_sets.values():
+            shard_set.close()
+        _shard_sets.clear()
+
+
+class ShardedManager:
+    # Same methods as the manager it wraps; subclasses say how each one is
+    # routed.
+    manager = None
+
+    def __init__(self, shards):
+        self.shards = shards
+        self.managers = [MANAGERS[self.manager](database) for database in shards.databases]
+
+    def _user(self, user_id):
+        return self.managers[self.shards.for_user(user_id)]
+
+    def _owner(self, row_id):
+        return self.managers[self.shards.for_id(row_id)]
+
+    def _merge(self, method, args, key):
+        # Lazy, in-process merge of per-shard iterators.
+        return heapq.merge(*[getattr(manager, method)(*args) for manager in self.managers], key=key)
+
+    def _print_all(self, rows, formatter, empty_message=None):
+        # Prints rows as they stream in and returns them, like the find_*
+        # methods of the single-database managers.
+        found = []
+        for row in rows:
+            print(formatter(row))
+            found.append(row)
+        if not found and empty_message:
+            print(empty_message)
+        return found
+
+    def _each(self, method, *args):
+        # Runs method on every shard and shows each shard's output in turn;
+        # the results are added up.
+        total = 0
+        for path, (result, output) in zip(self.shards.paths, self.shards.fan_out(self.manager, method, *args)):
+            print(f"Shard {path}:")
+            print(output, end='')
+            total += result or 0
+        return total
+
+    def _bulk(self, method, rows, route, chunk_size):
+        # Rows are dealt to per-shard chunks and each full chunk is inserted
+        # by a pool process; a few chunks are in flight at once. Failure
+        # indexes are mapped back to positions in rows.
+        pool = self.shards.pool()
+        pending = [[] for _ in self.shards.paths]
+        in_flight = deque()
+        inserted = 0
+        failures = []
+
+        def collect(future, indexes):
+            nonlocal inserted
+            result, _ = future.result()
+            inserted += result.inserted
+            failures.extend((indexes[index], row, error) for index, row, error in result.failures)
+
+        def submit(shard):
+            chunk = pending[shard]
+            pending[shard] = []
+            indexes = [index for index, _ in chunk]
+            future = pool.submit(_call, self.shards.paths[shard], self.manager, method,
+                                 ([row for _, row in chunk], chunk_size))
+            in_flight.append((future, indexes))
+            while len(in_flight) > 2 * len(self.shards):
+                collect(*in_flight.popleft())
+
+        for index, row in enumerate(rows):
+            try:
+                shard = route(row)
+            except (IndexError, TypeError, ValueError) as e:
+                failures.append((index, row, f"Cannot route row: {e}"))
+                continue
+            pending[shard].append((index, row))
+            if len(pending[shard]) >= chunk_size:
+                submit(shard)
+        for shard, chunk in enumerate(pending):
+            if chunk:
+                submit(shard)
+        while in_flight:
+            collect(*in_flight.popleft())
+        # The inserts happened in other processes, so this process's
+        # medication caches and schedule indexes know nothing about them.
+        for manager in self.managers:
+            cached = getattr(manager, 'cache', None) or getattr(manager, 'index', None)
+            if cached is not None:
+                cached.clear()
+        result = BulkResult(inserted, sorted(failures, key=lambda failure: failure[0]))
+        print(f"Added {result.inserted} {self.manager}, {len(result.failures)} failed")
+        return result
+
+    def close(self):
+        for manager in self.managers:
+            manager.close()
+
+
+class ShardedMedicationTrackerDB(ShardedManager):
+    manager = 'medications'
+
+    def add_medication(self, user_id, name, dosage):
+        return self._user(user_id).add_medication(user_id, name, dosage)
+
+    def add_medications_bulk(self, medications, chunk_size=BULK_CHUNK_SIZE):
+        return self._bulk('add_medications_bulk', medications, lambda row: self.shards.for_user(row[0]), chunk_size)
+
+    def iter_medications(self, name=None, user_id=None):
+        if user_id:
+            return self._user(user_id).iter_medications(name, user_id)
+        return self._merge('iter_medications', (name,), by_id)
+
+    def view_medication(self):
+        return print_rows(self._merge('iter_medications', (), by_id), format_medication)
+
+    def update_medication(self, med_id, name=None, dosage=None):
+        return self._owner(med_id).update_medication(med_id, name, dosage)
+
+    def find_medication(self, name=None, user_id=None):
+        if user_id:
+            return self._user(user_id).find_medication(name, user_id)
+        if not name:
+            return []
+        return self._print_all(self._merge('iter_medications', (name,), by_id), format_medication)
+
+    def delete_medication(self, med_id):
+        return self._owner(med_id).delete_medication(med_id)
+
+    def search_medications(self, query, user_id=None, limit=SEARCH_LIMIT):
+        if user_id:
+            return self._user(user_id).search_medications(query, user_id, limit)
+        # Each shard ranks its own best matches; the merged list is cut back
+        # to limit.
+        matches = sorted((match for result, _ in self.shards.fan_out(self.manager, '_search', query, None, limit)
+                          for match in result),
+                         key=lambda match: (-match[0], -match[1], match[2].id))
+        medications = [med for _, _, med in matches[:limit]]
+        for med in medications:
+            print(format_medication(med))
+        if not medications:
+            print(f"No medications match '{query}'.")
+        return medications
+
+    def iter_interactions(self, user_id=None, min_severity=None):
+        if user_id is not None:
+            return self._user(user_id).iter_interactions(user_id, min_severity)
+        return itertools.chain.from_iterable(manager.iter_interactions(None, min_severity)
+                                             for manager in self.managers)
+
+    def audit_interactions(self, user_id=None, min_severity=None):
+        if user_id is not None:
+            return self._user(user_id).audit_interactions(user_id, min_severity)
+        return self._each('audit_interactions', None, min_severity)
+
+    def cache_stats(self):
+        return [manager.cache_stats() for manager in self.managers]
+
+
+class ShardedScheduleManager(ShardedManager):
+    manager = 'schedules'
+
+    def add_schedule(self, user_id, schedule_time):
+        return self._user(user_id).add_schedule(user_id, schedule_time)
+
+    def add_schedules_bulk(self, schedules, chunk_size=BULK_CHUNK_SIZE):
+        return self._bulk('add_schedules_bulk', schedules, lambda row: self.shards.for_user(row[0]), chunk_size)
+
+    def add_recurring_schedule(self, user_id, start_time, interval, until=None, weekdays=None):
+        return self._user(user_id).add_recurring_schedule(user_id, start_time, interval, until, weekdays)
+
+    def iter_schedule_rules(self, user_id=None):
+        if user_id is not None:
+            return self._user(user_id).iter_schedule_rules(user_id)
+        return self._merge('iter_schedule_rules', (), by_id)
+
+    def view_schedule_rules(self, user_id=None):
+        if user_id is not None:
+            return self._user(user_id).view_schedule_rules(user_id)
+        return print_rows(self._merge('iter_schedule_rules', (), by_id), format_schedule_rule,
+                          "No recurring schedules found.")
+
+    def delete_schedule_rule(self, rule_id):
+        return self._owner(rule_id).delete_schedule_rule(rule_id)
+
+    def iter_occurrences(self, window_start, window_end, user_id=None):
+        if user_id is not None:
+            return self._user(user_id).iter_occurrences(window_start, window_end, user_id)
+        return self._merge('iter_occurrences', (window_start, window_end), by_time)
+
+    def iter_schedules(self, user_id=None, time=None, start_time=None, end_time=None):
+        if user_id is not None:
+            return self._user(user_id).iter_schedules(user_id, time, start_time, end_time)
+        key = by_time_id if time is not None or (start_time and end_time) else by_id
+        return self._merge('iter_schedules', (None, time, start_time, end_time), key)
+
+    def view_schedules(self):
+        return print_rows(self._merge('iter_schedules', (), by_id), format_schedule, "No schedules found.")
+
+    def delete_schedule(self, schedule_id):
+        return self._owner(schedule_id).delete_schedule(schedule_id)
+
+    def update_schedule(self, schedule_id, new_time):
+        return self._owner(schedule_id).update_schedule(schedule_id, new_time)
+
+    def find_schedule(self, user_id=None, time=None, start_time=None, end_time=None):
+        if user_id is not None:
+            return self._user(user_id).find_schedule(user_id, time, start_time, end_time)
+        if time is None and (start_time is None or end_time is None):
+            print("Please provide at least one search criterion: user_id, time or start_time and end_time.")
+            return []
+        try:
+            if time is not None:
+                window = (to_epoch(parse_time(time)),) * 2
+            else:
+                window = (to_epoch(parse_time(start_time)), to_epoch(parse_time(end_time)))
+        except ValueError:
+            print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
+            return []
+        # As in ScheduleManager.find_schedule, doses generated by recurring
+        # rules are merged in with the stored ones.
+        results = heapq.merge(self.iter_schedules(None, time, start_time, end_time),
+                              self.iter_occurrences(*window), key=by_time)
+        return self._print_all(results, format_occurrence, "No schedules found with the given criteria.")
+
+    def find_conflicts(self, user_id, time, minutes=None):
+        return self._user(user_id).find_conflicts(user_id, time, minutes)
+
+    def schedules_between(self, user_id, start_time, end_time):
+        return self._user(user_id).schedules_between(user_id, start_time, end_time)
+
+    def iter_conflicts(self, minutes=None, user_id=None):
+        if user_id is not None:
+            return self._user(user_id).iter_conflicts(minutes, user_id)
+        return itertools.chain.from_iterable(manager.iter_conflicts(minutes) for manager in self.managers)
+
+    def audit_conflicts(self, minutes=None, user_id=None):
+        if user_id is not None:
+            return self._user(user_id).audit_conflicts(minutes, user_id)
+        return self._each('audit_conflicts', minutes)
+
+
+class ShardedReminderManager(ShardedManager):
+    manager = 'reminders'
+
+    def add_reminder(self, medication_id, reminder_time, message):
+        return self._owner(medication_id).add_reminder(medication_id, reminder_time, message)
+
+    def add_reminders_bulk(self, reminders, chunk_size=BULK_CHUNK_SIZE):
+        return self._bulk('add_reminders_bulk', reminders, lambda row: self.shards.for_id(row[0]), chunk_size)
+
+    def iter_reminders(self, medication_id=None, time=None, start_time=None, end_time=None):
+        if medication_id is not None:
+            return self._owner(medication_id).iter_reminders(medication_id, time, start_time, end_time)
+        key = by_time_id if time is not None or (start_time and end_time) else by_id
+        return self._merge('iter_reminders', (None, time, start_time, end_time), key)
+
+    def view_reminders(self):
+        return print_rows(self._merge('iter_reminders', (), by_id), format_reminder, "No reminders found.")
+
+    def delete_reminder(self, reminder_id):
+        return self._owner(reminder_id).delete_reminder(reminder_id)
+
+    def update_reminder(self, reminder_id, new_time=None, new_message=None):
+        return self._owner(reminder_id).update_reminder(reminder_id, new_time, new_message)
+
+    def find_reminder(self, medication_id=None, time=None, start_time=None, end_time=None):
+        if medication_id is not None:
+            return self._owner(medication_id).find_reminder(medication_id, time, start_time, end_time)
+        if time is None and (start_time is None or end_time is None):
+            print("Please provide at least one search criterion: medication_id, time or start_time and end_time.")
+            return []
+        try:
+            for value in (time, start_time, end_time):
+                if value is not None:
+                    parse_time(value)
+        except ValueError:
+            print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
+            return []
+        return self._print_all(self._merge('iter_reminders', (None, time, start_time, end_time), by_time_id),
+                               format_reminder, "No reminders found with the given criteria.")
+
+
+class ShardedDoseLogManager(ShardedManager):
+    manager = 'doses'
+
+    def _dose_owner(self, schedule_id, medication_id, rule_id=None):
+        for row_id in (schedule_id, rule_id, medication_id):
+            if row_id is not None:
+                return self._owner(row_id)
+        return self._owner(0)
+
+    def record_dose(self, schedule_id, medication_id, dose_time, status='taken', rule_id=None):
+        return self._dose_owner(schedule_id, medication_id, rule_id).record_dose(schedule_id, medication_id,
+                                                                                 dose_time, status, rule_id)
+
+    def record_doses_bulk(self, doses, chunk_size=BULK_CHUNK_SIZE):
+        return self._bulk('record_doses_bulk', doses,
+                          lambda row: self.shards.for_id(row[0] if row[0] is not None else row[1]), chunk_size)
+
+    def iter_dose_events(self, user_id=None, medication_id=None, start_time=None, end_time=None):
+        if user_id is not None:
+            return self._user(user_id).iter_dose_events(user_id, medication_id, start_time, end_time)
+        if medication_id is not None:
+            return self._owner(medication_id).iter_dose_events(None, medication_id, start_time, end_time)
+        key = by_due_id if start_time and end_time else by_id
+        return self._merge('iter_dose_events', (None, None, start_time, end_time), key)
+
+    def view_dose_events(self, user_id=None):
+        if user_id is not None:
+            return self._user(user_id).view_dose_events(user_id)
+        return print_rows(self._merge('iter_dose_events', (), by_id), format_dose_event, "No doses recorded.")
+
+    def delete_dose_event(self, event_id):
+        return self._owner(event_id).delete_dose_event(event_id)
+
+
+class ShardedNextDoseManager(ShardedManager):
+    manager = 'next_doses'
+
+    def refresh(self, now=None):
+        return sum(manager.refresh(now) for manager in self.managers)
+
+    def next_doses(self, user_id=None, start_time=None, end_time=None):
+        if user_id is not None:
+            return self._user(user_id).next_doses(user_id, start_time, end_time)
+        return list(heapq.merge(*[manager.next_doses(None, start_time, end_time) for manager in self.managers],
+                                key=by_due_medication))
+
+    def find_next_doses(self, user_id=None, start_time=None, end_time=None):
+        if user_id is not None:
+            return self._user(user_id).find_next_doses(user_id, start_time, end_time)
+        if start_time is None or end_time is None:
+            print("Please provide a user ID or start_time and end_time.")
+            return []
+        try:
+            for value in (start_time, end_time):
+                parse_time(value)
+        except ValueError:
+            print("Invalid date format. Please use 'YYYY-MM-DD HH:MM'")
+            return []
+        return self._print_all(self.next_doses(None, start_time, end_time), format_next_dose, "Nothing is due.")
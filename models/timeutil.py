@@ -0,0 +1,26 @@
+# models/timeutil.py
+import datetime
+
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+# Times are stored as integer seconds since the epoch. Entered times carry no
+# timezone, so they are treated as UTC wall-clock values; that keeps the
+# conversion exact in both directions and matches SQLite's strftime('%s').
+
+
+def to_epoch(value):
+    return int((value - _EPOCH).total_seconds())
+
+
+def from_epoch(seconds):
+    return _EPOCH + datetime.timedelta(seconds=seconds)
+
+
+def parse_time(text):
+    return datetime.datetime.strptime(text, TIME_FORMAT)
+
+
+def now_epoch():
+    # The current local wall-clock time on the same scale.
+    return to_epoch(datetime.datetime.now())
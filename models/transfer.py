@@ -0,0 +1,172 @@
+# models/transfer.py
+import contextlib
+import csv
+import json
+import os
+import sys
+from models.database import get_database, BULK_CHUNK_SIZE
+from models.medication_tracker import MedicationTrackerDB, get_medication_cache
+from models.reminder import ReminderManager
+from models.schedule import ScheduleManager
+from models.schedule_index import get_schedule_index
+from models.timeutil import TIME_FORMAT, from_epoch, parse_time, to_epoch
+
+PROGRESS_EVERY = 100000
+FORMATS = ('csv', 'jsonl')
+
+
+def _text(value):
+    return None if value in (None, '') else value
+
+
+def _integer(value):
+    value = _text(value)
+    return None if value is None else int(value)
+
+
+def _time(value):
+    return to_epoch(parse_time(value))
+
+
+# For each kind: table, (file field, column, parser) triples in file order.
+KINDS = {
+    'medications': ('medication', [
+        ('id', 'id', _integer),
+        ('user_id', 'user_id', _integer),
+        ('name', 'Name', _text),
+        ('dosage', 'Dosage', _text),
+    ]),
+    'schedules': ('schedule', [
+        ('id', 'id', _integer),
+        ('user_id', 'user_id', _integer),
+        ('time', 'time', _time),
+    ]),
+    'reminders': ('reminder', [
+        ('id', 'id', _integer),
+        ('medication_id', 'medication_id', _integer),
+        ('time', 'time', _time),
+        ('message', 'message', _text),
+    ]),
+}
+
+
+def detect_format(path, fmt=None):
+    # stdin/stdout default to JSON Lines, which needs no header to stream.
+    if fmt:
+        return fmt
+    if path == '-':
+        return 'jsonl'
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    raise ValueError(f"Cannot tell the format of {path!r}; pass csv or jsonl explicitly")
+
+
+def _open(path, mode):
+    if path == '-':
+        return contextlib.nullcontext(sys.stdin if 'r' in mode else sys.stdout)
+    return open(path, mode, newline='')
+
+
+def _read_records(handle, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(handle)
+    else:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _report(verb, kind, count):
+    print(f"{verb} {count} {kind}...", file=sys.stderr)
+
+
+def _counted(records, kind, progress_every):
+    count = 0
+    for record in records:
+        yield record
+        count += 1
+        if progress_every and count % progress_every == 0:
+            _report("Read", kind, count)
+
+
+def import_file(kind, path, fmt=None, chunk_size=BULK_CHUNK_SIZE, keep_ids=True,
+                progress_every=PROGRESS_EVERY, db=None):
+    # Streams the file straight into chunked bulk inserts, so memory stays at
+    # one chunk. With keep_ids, rows that carry an id keep it, which keeps
+    # reminder -> medication references intact between environments.
+    db = db or get_database()
+    table, fields = KINDS[kind]
+    fmt = detect_format(path, fmt)
+    if not keep_ids:
+        fields = [field for field in fields if field[0] != 'id']
+    columns = ', '.join(column for _, column, _ in fields)
+    placeholders = ', '.join('?' * len(fields))
+    sql = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
+
+    def prepare(record):
+        if not isinstance(record, dict):
+            raise ValueError("Each record must be an object")
+        return tuple(parse(record.get(field)) for field, _, parse in fields)
+
+    with _open(path, 'r') as handle:
+        records = _counted(_read_records(handle, fmt), kind, progress_every)
+        result = db.insert_many(sql, records, prepare, chunk_size)
+    if kind == 'medications':
+        get_medication_cache(db).clear()
+    elif kind == 'schedules':
+        get_schedule_index(db).clear()
+
+    print(f"Imported {result.inserted} {kind}, {len(result.failures)} failed", file=sys.stderr)
+    for index, _, error in result.failures[:10]:
+        print(f"  record {index + 1}: {error}", file=sys.stderr)
+    return result
+
+
+def export_record(kind, row):
+    # A row selected in KINDS column order, as export writes it.
+    record = {}
+    for (field, _, parse), value in zip(KINDS[kind][1], row):
+        if parse is _time and value is not None:
+            value = from_epoch(value).strftime(TIME_FORMAT)
+        record[field] = value
+    return record
+
+
+def _rows(kind, db):
+    if kind == 'medications':
+        for med in MedicationTrackerDB(db).iter_medications():
+            yield {'id': med.id, 'user_id': med.user_id, 'name': med.name, 'dosage': med.dosage}
+    elif kind == 'schedules':
+        for schedule in ScheduleManager(db).iter_schedules():
+            yield {'id': schedule.id, 'user_id': schedule.user_id, 'time': schedule.time.strftime(TIME_FORMAT)}
+    else:
+        for rem in ReminderManager(db).iter_reminders():
+            yield {'id': rem.id, 'medication_id': rem.medication_id,
+                   'time': rem.time.strftime(TIME_FORMAT), 'message': rem.message}
+
+
+def export_file(kind, path, fmt=None, progress_every=PROGRESS_EVERY, db=None):
+    # Walks the table with the keyset-paginated iterators and writes rows as
+    # they arrive; nothing larger than one page is held in memory.
+    db = db or get_database()
+    fields = [field for field, _, _ in KINDS[kind][1]]
+    fmt = detect_format(path, fmt)
+    count = 0
+    with _open(path, 'w') as handle:
+        writer = csv.DictWriter(handle, fieldnames=fields) if fmt == 'csv' else None
+        if writer:
+            writer.writeheader()
+        for row in _rows(kind, db):
+            if writer:
+                writer.writerow(row)
+            else:
+                handle.write(json.dumps(row) + '\n')
+            count += 1
+            if progress_every and count % progress_every == 0:
+                _report("Wrote", kind, count)
+        handle.flush()
+    print(f"Exported {count} {kind}", file=sys.stderr)
+    return count
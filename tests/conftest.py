@@ -0,0 +1,38 @@
+# tests/conftest.py
+import pytest
+from models.config import DEFAULTS, DatabaseConfig
+from models.database import Database, close_databases
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    # Each test runs in its own directory, without a config file or
+    # MEDICATION_TRACKER_* settings from the environment.
+    monkeypatch.chdir(tmp_path)
+    for name in DEFAULTS:
+        monkeypatch.delenv(f'MEDICATION_TRACKER_{name.upper()}', raising=False)
+    yield
+    close_databases()
+
+
+@pytest.fixture(params=[False, True], ids=['pool', 'single_writer'])
+def make_db(request, tmp_path):
+    # Opens Databases in tmp_path, once per writer mode.
+    databases = []
+
+    def make(name='test.db', **settings):
+        config = DatabaseConfig(path=str(tmp_path / name), single_writer=request.param, **settings)
+        database = Database(config=config)
+        databases.append(database)
+        return database
+
+    yield make
+    for database in databases:
+        database.close()
+
+
+@pytest.fixture
+def db(make_db):
+    database = make_db()
+    database.migrate()
+    return database
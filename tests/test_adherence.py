@@ -0,0 +1,62 @@
+# tests/test_adherence.py
+import numpy as np
+from models.adherence import adherence_by_medication, adherence_by_user, load_window, missed_streaks, summary
+from models.dose_log import DoseLogManager
+from models.schedule import ScheduleManager
+from models.timeutil import parse_time, to_epoch
+
+
+def _epoch(text):
+    return to_epoch(parse_time(text))
+
+
+def _window(db):
+    schedules = ScheduleManager(db)
+    for hour in (8, 12, 16, 20):
+        schedules.add_schedule(1, f'2024-01-01 {hour:02d}:00')
+    rule_id = schedules.add_recurring_schedule(2, '2024-01-01 08:00', '12h')
+    doses = DoseLogManager(db)
+    doses.record_dose(1, 1, '2024-01-01 08:10')
+    doses.record_dose(2, 1, '2024-01-01 13:00')
+    doses.record_dose(3, 1, '2024-01-01 16:05', 'skipped')
+    # Linked to the rule's 08:00 dose.
+    doses.record_dose(None, 1, '2024-01-01 08:20', rule_id=rule_id)
+    return load_window(_epoch('2024-01-01 00:00'), _epoch('2024-01-01 23:59'), db)
+
+
+def test_dose_is_linked_to_the_nearest_rule_occurrence(db):
+    _window(db)
+    event = list(DoseLogManager(db).iter_dose_events(user_id=2))[0]
+    assert (event.user_id, event.due) == (2, parse_time('2024-01-01 08:00'))
+    assert DoseLogManager(db).record_dose(None, None, '2024-01-01 08:00') is None
+
+
+def test_adherence_by_user(db):
+    users = adherence_by_user(_window(db))
+    assert users.user_id.tolist() == [1, 2]
+    assert users.due.tolist() == [4, 2]
+    assert users.taken.tolist() == [2, 1]
+    assert users.late.tolist() == [1, 0]
+    assert users.mean_delay_minutes.tolist() == [35.0, 20.0]
+    assert users.longest_missed_streak.tolist() == [2, 1]
+    assert users.current_missed_streak.tolist() == [2, 1]
+
+
+def test_adherence_by_medication_and_summary(db):
+    window = _window(db)
+    medications = adherence_by_medication(window)
+    assert (medications.medication_id.tolist(), medications.events.tolist(), medications.taken.tolist()) == \
+        ([1], [4], [3])
+    result = summary(window, adherence_by_user(window), medications)
+    assert (result['due_doses'], result['taken_doses'], result['adherence']) == (6, 3, 0.5)
+    assert result['late_distribution']['buckets']['30-60m'] == 0
+    assert result['late_distribution']['buckets']['1-2h'] == 1
+
+
+def test_missed_streaks_restart_per_user():
+    users = np.array([0, 0, 0, 1, 1, 0])
+    due = np.array([1, 2, 3, 1, 2, 4])
+    taken = np.array([False, False, True, False, False, False])
+    longest, current = missed_streaks(users, due, taken, 2)
+    assert longest.tolist() == [2, 2]
+    assert current.tolist() == [1, 2]
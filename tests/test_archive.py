@@ -0,0 +1,85 @@
+# tests/test_archive.py
+import os
+import pytest
+from models.adherence import load_window, adherence_by_user
+from models.archive import archive_old_rows, archive_path, archived_rows
+from models.backup import backup, restore
+from models.database import get_database, init_db
+from models.schedule import ScheduleManager
+from models.timeutil import parse_time, to_epoch
+
+CUTOFF = to_epoch(parse_time('2024-02-01 00:00'))
+
+
+@pytest.fixture
+def tracker():
+    return init_db('tracker.db')
+
+
+def _schedules(db):
+    # Days 1-20 of January for users 1 and 2, plus one February dose.
+    manager = ScheduleManager(db)
+    for day in range(1, 21):
+        for user_id in (1, 2):
+            manager.add_schedule(user_id, f'2024-01-{day:02d} 0{user_id}:00')
+    manager.add_schedule(1, '2024-02-10 08:00')
+    return manager
+
+
+def _window(manager, user_id=None, start='2024-01-01 00:00', end='2024-03-01 00:00'):
+    return [(schedule.id, schedule.time) for schedule in manager.iter_schedules(user_id, start_time=start,
+                                                                              end_time=end)]
+
+
+def test_archived_rows_are_merged_back_in_order(tracker):
+    manager = _schedules(tracker)
+    windows = [(None, '2024-01-01 00:00', '2024-03-01 00:00'), (2, '2024-01-01 00:00', '2024-03-01 00:00'),
+               (1, '2024-01-05 00:00', '2024-01-06 23:59')]
+    before = [_window(manager, *window) for window in windows]
+
+    moved = archive_old_rows(before=CUTOFF, batch_size=7, pause=0, db=tracker)
+    assert moved['schedule'] == 40
+    assert tracker.query('SELECT COUNT(*) FROM schedule') == [(1,)]
+    assert [_window(manager, *window) for window in windows] == before
+
+
+def test_blocks_that_overlap_are_merged(tracker):
+    manager = _schedules(tracker)
+    archive_old_rows(before=CUTOFF, batch_size=7, pause=0, db=tracker)
+    # Backdated after the first run, so the second run's block overlaps.
+    late = manager.add_schedule(1, '2024-01-03 12:00')
+    archive_old_rows(before=CUTOFF, pause=0, db=tracker)
+
+    rows = archived_rows(tracker, 'schedule', 0, CUTOFF, owner=1)
+    times = [(schedule.time, schedule.id) for schedule in rows]
+    assert times == sorted(times)
+    assert len(times) == 21 and late in [schedule_id for _, schedule_id in times]
+
+
+def test_owner_filter_skips_other_blocks(tracker):
+    manager = ScheduleManager(tracker)
+    manager.add_schedule(1, '2024-01-01 08:00')
+    archive_old_rows(before=CUTOFF, pause=0, db=tracker)
+    manager.add_schedule(2, '2024-01-02 08:00')
+    archive_old_rows(before=CUTOFF, pause=0, db=tracker)
+    assert [schedule.user_id for schedule in archived_rows(tracker, 'schedule', 0, CUTOFF, owner=2)] == [2]
+    assert list(archived_rows(tracker, 'schedule', 0, CUTOFF, owner=3)) == []
+
+
+def test_adherence_counts_archived_schedules(tracker):
+    _schedules(tracker)
+    start, end = to_epoch(parse_time('2024-01-01 00:00')), to_epoch(parse_time('2024-03-01 00:00'))
+    due = adherence_by_user(load_window(start, end, tracker)).due.tolist()
+    archive_old_rows(before=CUTOFF, batch_size=7, pause=0, db=tracker)
+    assert adherence_by_user(load_window(start, end, tracker)).due.tolist() == due == [21, 20]
+
+
+def test_backup_and_restore_carry_the_archive(tracker):
+    manager = _schedules(tracker)
+    archive_old_rows(before=CUTOFF, pause=0, db=tracker)
+    expected = _window(manager)
+    assert backup('backup.db', tracker) == ['backup.db', 'backup.archive.db']
+
+    os.remove(archive_path(tracker))
+    restore('backup.db', 'tracker.db')
+    assert _window(ScheduleManager(get_database('tracker.db'))) == expected
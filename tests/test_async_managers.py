@@ -0,0 +1,44 @@
+# tests/test_async_managers.py
+import asyncio
+import threading
+import pytest
+from models.async_managers import AsyncMedicationTrackerDB, AsyncScheduleManager, shutdown_executors
+
+
+@pytest.fixture(autouse=True)
+def executors():
+    yield
+    shutdown_executors()
+
+
+def test_concurrent_writes_all_land(db):
+    async def scenario():
+        medications = AsyncMedicationTrackerDB(db)
+        await asyncio.gather(*[medications.add_medication(user, f'Drug{user}', '10mg') for user in range(1, 21)])
+        found = await medications.find_medication(user_id=7)
+        streamed = [med.id async for med in medications.iter_medications(page_size=3)]
+        return found, streamed
+
+    found, streamed = asyncio.run(scenario())
+    assert [(med.name, med.user_id) for med in found] == [('Drug7', 7)]
+    assert streamed == list(range(1, 21))
+
+
+def test_writes_run_off_the_event_loop_thread(db):
+    threads = []
+
+    async def scenario():
+        schedules = AsyncScheduleManager(db)
+        add = schedules.manager.add_schedule
+
+        def recording_add(*args):
+            threads.append(threading.current_thread().name)
+            return add(*args)
+
+        schedules.manager.add_schedule = recording_add
+        await schedules.add_schedule(1, '2024-01-01 08:00')
+        return [schedule.time async for schedule in schedules.iter_schedules(user_id=1)]
+
+    times = asyncio.run(scenario())
+    assert [time.hour for time in times] == [8]
+    assert threads[0].startswith('db-write')
@@ -0,0 +1,87 @@
+# tests/test_backup.py
+import os
+import threading
+import pytest
+from models.backup import SnapshotScheduler, backup, check_integrity, list_snapshots, restore, snapshot
+from models.database import get_database, init_db
+from models.medication_tracker import MedicationTrackerDB
+
+
+@pytest.fixture
+def tracker():
+    return init_db('tracker.db')
+
+
+def test_backup_is_consistent_while_writes_continue(tracker):
+    medications = MedicationTrackerDB(tracker)
+    medications.add_medications_bulk((1, f'Drug{n}', '1mg') for n in range(2000))
+    stop = threading.Event()
+
+    def write():
+        while not stop.is_set():
+            medications.add_medication(2, 'Late', '1mg')
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        assert backup('backup.db', tracker, verify=True) == ['backup.db']
+    finally:
+        stop.set()
+        writer.join()
+    assert check_integrity('backup.db') == []
+    assert not os.path.exists('backup.db.partial')
+
+
+def test_restore_replaces_the_live_database(tracker):
+    medications = MedicationTrackerDB(tracker)
+    medications.add_medication(1, 'Aspirin', '100mg')
+    backup('backup.db', tracker)
+    medications.add_medication(1, 'Ibuprofen', '200mg')
+
+    assert restore('backup.db', 'tracker.db') == 'tracker.db'
+    assert [med.name for med in MedicationTrackerDB(get_database('tracker.db')).iter_medications()] == ['Aspirin']
+
+
+def test_damaged_backup_is_refused(tracker):
+    MedicationTrackerDB(tracker).add_medication(1, 'Aspirin', '100mg')
+    with open('backup.db', 'wb') as damaged:
+        damaged.write(b'not a database' * 100)
+    with pytest.raises(ValueError, match='integrity check'):
+        restore('backup.db', 'tracker.db')
+    assert len(MedicationTrackerDB(get_database('tracker.db')).find_medication(user_id=1)) == 1
+
+
+def test_snapshots_keep_the_newest(tracker):
+    os.makedirs('snapshots')
+    for stamp in ('20240101-000000', '20240102-000000'):
+        backup(os.path.join('snapshots', f'tracker-{stamp}.db'), tracker)
+    # Files snapshot() did not write are left alone.
+    open(os.path.join('snapshots', 'tracker-notes.db'), 'w').close()
+
+    newest = snapshot('snapshots', keep=2, db=tracker)
+    assert list_snapshots('snapshots', tracker) == [os.path.join('snapshots', 'tracker-20240102-000000.db'), newest]
+    assert sorted(os.listdir('snapshots')) == sorted(['tracker-20240102-000000.db', 'tracker-notes.db',
+                                                      os.path.basename(newest)])
+
+
+def _wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        threading.Event().wait(0.01)
+
+
+def test_scheduler_retries_a_failed_snapshot(tracker, capsys):
+    # A file where the directory should be makes the first snapshot fail.
+    open('snapshots', 'w').close()
+    scheduler = SnapshotScheduler('snapshots', 0.01, keep=1, db=tracker)
+    runner = threading.Thread(target=scheduler.run)
+    runner.start()
+    try:
+        _wait_for(lambda: 'An error occurred' in capsys.readouterr().out)
+        os.remove('snapshots')
+        _wait_for(lambda: list_snapshots('snapshots', tracker))
+    finally:
+        scheduler.stop()
+        runner.join()
+    assert len(list_snapshots('snapshots', tracker)) == 1
@@ -0,0 +1,67 @@
+# tests/test_cache.py
+from models.cache import LRUCache
+from models.medication_tracker import MedicationTrackerDB
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LRUCache(10, ttl=5, clock=clock)
+    cache.put('a', 1)
+    clock.now = 4
+    assert cache.get('a') == 1
+    clock.now = 5
+    assert cache.get('a') is None
+
+
+def test_stale_put_is_skipped_after_invalidation():
+    # A reader that started before an invalidation must not cache what it read.
+    cache = LRUCache(10)
+    generation = cache.generation
+    cache.invalidate('a')
+    cache.put('a', 'stale', generation)
+    assert cache.get('a') is None
+    cache.put('a', 'fresh', cache.generation)
+    assert cache.get('a') == 'fresh'
+
+
+def test_medication_cache_sees_writes(db):
+    manager = MedicationTrackerDB(db)
+    med_id = manager.add_medication(1, 'Aspirin', '100mg')
+    assert [med.id for med in manager.find_medication(user_id=1)] == [med_id]
+
+    other = manager.add_medication(1, 'Ibuprofen', '200mg')
+    assert [med.id for med in manager.find_medication(user_id=1)] == [med_id, other]
+    manager.update_medication(med_id, name='Paracetamol')
+    assert [med.name for med in manager.find_medication(user_id=1)] == ['Paracetamol', 'Ibuprofen']
+    assert manager.find_medication(name='Aspirin') == []
+    manager.delete_medication(other)
+    assert [med.id for med in manager.find_medication(user_id=1)] == [med_id]
+    assert manager.cache_stats()['hits'] == 0
+
+
+def test_medication_cache_hits(db):
+    manager = MedicationTrackerDB(db)
+    manager.add_medication(1, 'Aspirin', '100mg')
+    manager.find_medication(user_id=1)
+    manager.find_medication(user_id=1)
+    assert manager.cache_stats()['hits'] == 1
+
@@ -0,0 +1,65 @@
+# tests/test_change_log.py
+import pytest
+from models.backup import backup, restore
+from models.change_log import ChangeLogManager
+from models.database import get_database, init_db
+from models.medication_tracker import MedicationTrackerDB
+
+
+@pytest.fixture
+def tracker():
+    return init_db('tracker.db')
+
+
+def test_changes_carry_current_rows(db):
+    medications = MedicationTrackerDB(db)
+    first = medications.add_medication(1, 'Aspirin', '100mg')
+    second = medications.add_medication(1, 'Ibuprofen', '200mg')
+    medications.update_medication(first, dosage='300mg')
+    medications.delete_medication(second)
+
+    changes = list(ChangeLogManager(db).iter_changes(0, page_size=2))
+    assert [(change.seq, change.id, change.operation) for change in changes] == [
+        (1, first, 'insert'), (2, second, 'insert'), (3, first, 'update'), (4, second, 'delete')]
+    assert changes[0].record == {'id': first, 'user_id': 1, 'name': 'Aspirin', 'dosage': '300mg'}
+    assert changes[1].record is None
+    assert [change.seq for change in ChangeLogManager(db).iter_changes(3)] == [4]
+
+
+def test_pruned_changes_are_refused(db):
+    medications = MedicationTrackerDB(db)
+    for name in ('a', 'b', 'c'):
+        medications.add_medication(1, name, '1mg')
+    log = ChangeLogManager(db)
+    log.prune_changes(before_seq=3)
+    assert [change.seq for change in log.iter_changes(2)] == [3]
+    with pytest.raises(ValueError, match='pruned'):
+        list(log.iter_changes(1))
+
+
+def test_restore_rewind_is_detected(tracker):
+    MedicationTrackerDB(tracker).add_medication(1, 'Aspirin', '100mg')
+    backup('backup.db', tracker)
+    for name in ('b', 'c', 'd'):
+        MedicationTrackerDB(tracker).add_medication(1, name, '1mg')
+    synced = ChangeLogManager(tracker).last_seq()
+    assert synced == 4
+
+    restore('backup.db', 'tracker.db')
+    db = get_database('tracker.db')
+    new_id = MedicationTrackerDB(db).add_medication(1, 'e', '1mg')
+    log = ChangeLogManager(db)
+
+    # A consumer past the restored seq has history that no longer exists.
+    for since in (2, synced):
+        with pytest.raises(ValueError, match='rewound'):
+            list(log.iter_changes(since))
+    # Seqs are not reused, so one that synced before the backup carries on.
+    assert [(change.seq, change.id) for change in log.iter_changes(1)] == [(synced + 1, new_id)]
+    assert log.last_seq() == synced + 1
+
+
+def test_log_copied_back_without_restore_is_refused(db):
+    MedicationTrackerDB(db).add_medication(1, 'Aspirin', '100mg')
+    with pytest.raises(ValueError, match='rewound'):
+        list(ChangeLogManager(db).iter_changes(5))
@@ -0,0 +1,55 @@
+# tests/test_commands.py
+import io
+import json
+from models.commands import Managers, run_batch, run_command
+
+
+def _batch(db, *requests):
+    lines = [request if isinstance(request, str) else json.dumps(request) for request in requests]
+    output = io.StringIO()
+    failed = run_batch(io.StringIO('\n'.join(lines) + '\n'), output, db=db)
+    return failed, [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_run_command_reports_results_and_errors(db):
+    managers = Managers(db)
+    added = run_command(managers, 'add-medication', {'user_id': '1', 'name': 'Aspirin', 'dosage': '100mg'})
+    assert added == {'command': 'add-medication', 'ok': True, 'result': 1}
+    missing = run_command(managers, 'add-medication', {'user_id': 1, 'name': 'Aspirin'})
+    assert missing['ok'] is False and 'dosage' in missing['error']
+    assert run_command(managers, 'fly', {})['error'] == "Unknown command: fly"
+    found = run_command(managers, 'find-medication', {'user_id': 1})
+    assert found['result'] == [{'id': 1, 'name': 'Aspirin', 'dosage': '100mg', 'user_id': 1}]
+
+
+def test_batch_undoes_only_failed_commands(db):
+    failed, outcomes = _batch(
+        db,
+        {'command': 'add-schedule', 'user_id': 1, 'time': '2024-01-01 08:00'},
+        {'command': 'add-schedule', 'user_id': 1, 'time': 'tomorrow'},
+        'not json',
+        {'command': 'add-schedule', 'user_id': 1, 'time': '2024-01-01 08:10'})
+    assert failed == 2
+    assert [(outcome['line'], outcome['ok']) for outcome in outcomes] == [(1, True), (2, False), (3, False), (4, True)]
+    assert outcomes[2]['error'].startswith('Invalid JSON')
+    # The second dose is reported as a conflict but still added.
+    assert outcomes[3]['warnings']
+    assert db.query('SELECT time FROM schedule ORDER BY id') == [(1704096000,), (1704096600,)]
+
+
+def test_recurring_schedule_commands(db):
+    failed, outcomes = _batch(
+        db,
+        {'command': 'add-recurring-schedule', 'user_id': 1, 'start_time': '2024-01-01 08:00', 'interval': '8h',
+         'weekdays': 'weekdays'},
+        {'command': 'add-recurring-schedule', 'user_id': 1, 'start_time': '2024-01-01 08:00', 'interval': '0h'},
+        {'command': 'view-recurring-schedules', 'user_id': 1},
+        {'command': 'find-schedule', 'user_id': 1, 'start_time': '2024-01-01 00:00', 'end_time': '2024-01-01 23:59'},
+        {'command': 'delete-recurring-schedule', 'rule_id': 1},
+        {'command': 'view-recurring-schedules'})
+    assert failed == 1
+    assert [outcome['ok'] for outcome in outcomes] == [True, False, True, True, True, True]
+    assert outcomes[2]['result'] == [{'id': 1, 'user_id': 1, 'start': '2024-01-01 08:00', 'until': None,
+                                      'interval_seconds': 28800, 'weekdays': 31}]
+    assert [dose['time'] for dose in outcomes[3]['result']] == ['2024-01-01 08:00', '2024-01-01 16:00']
+    assert outcomes[5]['result'] == []
@@ -0,0 +1,134 @@
+# tests/test_database.py
+import sqlite3
+import threading
+import pytest
+from models.config import DatabaseConfig
+from models.database import WriteQueue, get_database, init_db
+from models.medication_tracker import MedicationTrackerDB
+from models.schedule import ScheduleManager
+
+
+def _insert(user_id, time):
+    def work(connection):
+        return connection.execute('INSERT INTO schedule (user_id, time) VALUES (?, ?)', (user_id, time)).lastrowid
+    return work
+
+
+def _fail(connection):
+    connection.execute('INSERT INTO schedule (user_id, time) VALUES (99, 99)')
+    raise ValueError("job failed")
+
+
+def test_failed_job_rolls_back_alone_in_its_batch(db):
+    config = DatabaseConfig(path=db.path)
+    writer = WriteQueue(db.path, config, batch_size=10)
+    release = threading.Event()
+    try:
+        # The first job holds the writer until the rest are queued, so they
+        # are committed as one batch.
+        first = writer.submit(lambda connection: release.wait(5))
+        futures = [writer.submit(_insert(1, 10)), writer.submit(_fail), writer.submit(_insert(1, 20))]
+        release.set()
+        assert first.result() is True
+        assert futures[0].result() and futures[2].result()
+        with pytest.raises(ValueError):
+            futures[1].result()
+    finally:
+        writer.close()
+    assert db.query('SELECT user_id, time FROM schedule ORDER BY time') == [(1, 10), (1, 20)]
+
+
+def test_write_rolls_back_on_error(db):
+    with pytest.raises(ValueError):
+        db.write(_fail)
+    assert db.query('SELECT COUNT(*) FROM schedule') == [(0,)]
+
+
+def test_nested_write_joins_the_outer_transaction(db):
+    def work(connection):
+        db.write(_insert(1, 10))
+        raise ValueError("outer failed")
+
+    with pytest.raises(ValueError):
+        db.write(work)
+    assert db.query('SELECT COUNT(*) FROM schedule') == [(0,)]
+
+
+def test_error_in_sql_is_reported(db):
+    with pytest.raises(sqlite3.OperationalError):
+        db.execute('INSERT INTO missing_table VALUES (1)')
+
+
+
+def test_insert_many_reports_bad_rows_and_keeps_the_rest(db):
+    rows = [(1, 'Aspirin', '100mg'), (1, None, '5mg'), ('x', 'Ibuprofen'), (2, 'Ibuprofen', '200mg')]
+
+    def prepare(row):
+        user_id, name, dosage = row
+        return (user_id, name, dosage)
+
+    # The NOT NULL failure makes its chunk replay row by row.
+    result = db.insert_many('INSERT INTO medication (user_id, Name, Dosage) VALUES (?, ?, ?)', rows, prepare,
+                            chunk_size=2)
+    assert result.inserted == 2
+    assert [(index, row) for index, row, _ in result.failures] == [(1, rows[1]), (2, rows[2])]
+    assert 'NOT NULL' in result.failures[0][2]
+    assert db.query('SELECT user_id, Name FROM medication ORDER BY id') == [(1, 'Aspirin'), (2, 'Ibuprofen')]
+    with pytest.raises(ValueError):
+        db.insert_many('INSERT INTO medication (Name) VALUES (?)', [], chunk_size=0)
+
+
+def test_bulk_schedules_parse_times(db):
+    result = ScheduleManager(db).add_schedules_bulk([(1, '2024-01-01 08:00'), (1, 'soon')])
+    assert result.inserted == 1 and result.failures[0][0] == 1
+    assert db.query('SELECT user_id, time FROM schedule') == [(1, 1704096000)]
+
+
+@pytest.fixture
+def schedules(db):
+    # Many rows share a time, so pages split runs of equal keys.
+    rows = [(user_id, time) for time in range(0, 50, 5) for user_id in (1, 2, None)]
+    db.insert_many('INSERT INTO schedule (user_id, time) VALUES (?, ?)', rows)
+    return db
+
+
+def test_keyset_pages_follow_the_order(schedules):
+    expected = schedules.query('SELECT * FROM schedule ORDER BY time, id')
+    assert list(schedules.iter_keyset('schedule', order=('time', 'id'), page_size=4)) == expected
+    assert list(schedules.iter_keyset('schedule', page_size=7)) == schedules.query('SELECT * FROM schedule ORDER BY id')
+
+
+def test_keyset_window_with_lower_bound(schedules):
+    # The bound on the first page must not cut off later pages.
+    expected = schedules.query('SELECT * FROM schedule WHERE time BETWEEN 10 AND 35 ORDER BY time, id')
+    rows = schedules.iter_keyset('schedule', ['time <= ?'], [35], ('time', 'id'), page_size=2,
+                                 lower=('time >= ?', [10]))
+    assert list(rows) == expected
+
+
+def test_keyset_lower_bound_skips_nulls(schedules):
+    expected = schedules.query('SELECT * FROM schedule WHERE user_id IS NOT NULL ORDER BY user_id, time, id')
+    rows = schedules.iter_keyset('schedule', order=('user_id', 'time', 'id'), page_size=3,
+                                 lower=('user_id IS NOT NULL', []))
+    assert list(rows) == expected
+
+
+def test_managers_share_one_database_per_path(monkeypatch):
+    monkeypatch.setenv('MEDICATION_TRACKER_PATH', 'tracker.db')
+    tracker = init_db()
+    assert get_database('tracker.db') is tracker
+    assert MedicationTrackerDB().db is ScheduleManager().db is tracker
+    assert get_database('other.db') is not tracker
+
+
+def test_pool_reuses_and_caps_connections(make_db):
+    database = make_db(pool_size=1)
+    with database.pool.connection() as first:
+        # The only connection is out, so a second caller times out.
+        with pytest.raises(sqlite3.OperationalError, match='No free connection'):
+            database.pool.acquire(timeout=0.01)
+    with database.pool.connection() as second:
+        assert second is first
+        second.execute('BEGIN')
+    # An open transaction is rolled back on release.
+    assert not database.pool.acquire().in_transaction
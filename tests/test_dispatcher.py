@@ -0,0 +1,122 @@
+# tests/test_dispatcher.py
+import pytest
+from models import dispatcher
+from models.backup import backup, restore, _restore_file
+from models.database import get_database, init_db
+from models.dispatcher import ReminderDispatcher
+from models.reminder import ReminderManager
+from models.timeutil import parse_time, to_epoch
+
+NOON = to_epoch(parse_time('2024-01-01 12:00'))
+
+
+class ListSink:
+    def __init__(self):
+        self.sent = []
+        self.down = False
+
+    def send(self, reminder):
+        if self.down:
+            raise OSError("sink is down")
+        self.sent.append(reminder.id)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [NOON]
+    monkeypatch.setattr(dispatcher, 'now_epoch', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def tracker():
+    return init_db('tracker.db')
+
+
+def _dispatcher(db, sink):
+    reminders = ReminderDispatcher(sink, db, retry_delay=30)
+    reminders.load()
+    return reminders
+
+
+def test_fires_due_reminders_once(tracker, clock):
+    reminders = ReminderManager(tracker)
+    first = reminders.add_reminder(1, '2024-01-01 11:55', 'late but in grace')
+    reminders.add_reminder(1, '2024-01-01 11:00', 'too old')
+    later = reminders.add_reminder(1, '2024-01-01 12:30', 'later')
+    sink = ListSink()
+    fired = _dispatcher(tracker, sink)
+    assert fired.fire_due() == 1
+
+    added = reminders.add_reminder(1, '2024-01-01 12:10', 'added while running')
+    fired.poll_changes()
+    clock[0] += 3600
+    assert fired.fire_due() == 2
+    assert sink.sent == [first, added, later]
+
+    # A restarted dispatcher resumes after the last fired reminder.
+    restarted = ListSink()
+    assert _dispatcher(tracker, restarted).fire_due() == 0
+
+
+def test_failed_send_is_retried_in_order(tracker, clock):
+    reminders = ReminderManager(tracker)
+    first = reminders.add_reminder(1, '2024-01-01 12:00', 'first')
+    second = reminders.add_reminder(1, '2024-01-01 12:00', 'second')
+    sink = ListSink()
+    sink.down = True
+    fired = _dispatcher(tracker, sink)
+    assert fired.fire_due() == 0
+    assert fired.last_fired() is None
+
+    sink.down = False
+    assert fired.fire_due() == 0
+    clock[0] += 30
+    assert fired.fire_due() == 2
+    assert sink.sent == [first, second]
+    assert tuple(fired.last_fired()) == (NOON, second)
+
+
+def test_failed_send_survives_a_restart(tracker, clock):
+    reminder = ReminderManager(tracker).add_reminder(1, '2024-01-01 12:00', 'first')
+    sink = ListSink()
+    sink.down = True
+    _dispatcher(tracker, sink).fire_due()
+
+    sink.down = False
+    assert _dispatcher(tracker, sink).fire_due() == 1
+    assert sink.sent == [reminder]
+
+
+def test_reloads_after_restore(tracker, clock):
+    reminders = ReminderManager(tracker)
+    reminders.add_reminder(1, '2024-01-01 11:50', 'before backup')
+    backup('backup.db', tracker)
+    for minute in range(10, 20):
+        reminders.add_reminder(1, f'2024-01-01 13:{minute}', 'after backup')
+    sink = ListSink()
+    fired = _dispatcher(tracker, sink)
+    fired.poll_changes()
+    assert fired.fire_due() == 1
+
+    restore('backup.db', 'tracker.db')
+    added = ReminderManager(get_database('tracker.db')).add_reminder(1, '2024-01-01 12:05', 'after restore')
+    fired.poll_changes()
+    # The reminders the restore discarded must not fire either.
+    clock[0] += 3 * 3600
+    assert fired.fire_due() == 1
+    assert sink.sent[-1] == added
+
+
+def test_reloads_when_the_log_goes_back(tracker, clock):
+    # A file copied back by hand rewinds the log without recording it.
+    reminders = ReminderManager(tracker)
+    backup('backup.db', tracker)
+    ghost = reminders.add_reminder(1, '2024-01-01 12:30', 'discarded')
+    sink = ListSink()
+    fired = _dispatcher(tracker, sink)
+    _restore_file('backup.db', 'tracker.db', tracker.config)
+    fired.poll_changes()
+    clock[0] += 3600
+    assert fired.fire_due() == 0
+    assert ghost not in sink.sent
@@ -0,0 +1,68 @@
+# tests/test_interactions.py
+import pytest
+from models.interactions import InteractionIndex, normalize_name
+from models.medication_tracker import MedicationTrackerDB
+from models.metrics import get_metrics
+
+DATASET = '''drug_a,drug_b,severity,description
+warfarin,aspirin,major,Increased risk of bleeding
+simvastatin,clarithromycin,contraindicated,
+'''
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / 'interactions.csv'
+    path.write_text(DATASET)
+    return str(path)
+
+
+def _tracker(make_db, path):
+    db = make_db(interactions_path=path)
+    db.migrate()
+    return MedicationTrackerDB(db)
+
+
+def test_lookup_ignores_case_and_punctuation(dataset):
+    index = InteractionIndex.load(dataset)
+    assert normalize_name('Aspirin  (EC)') == 'aspirin ec'
+    assert index.lookup('Aspirin', 'WARFARIN').severity == 'major'
+    assert index.lookup('aspirin', 'simvastatin') is None
+
+
+def test_bad_row_names_its_line(tmp_path):
+    path = tmp_path / 'bad.csv'
+    path.write_text(DATASET + 'a,b,deadly,\n')
+    with pytest.raises(ValueError, match='line 4'):
+        InteractionIndex.load(str(path))
+
+
+def test_add_warns_about_interactions(make_db, dataset, capsys):
+    tracker = _tracker(make_db, dataset)
+    tracker.add_medication(1, 'Warfarin', '5mg')
+    tracker.add_medication(2, 'Aspirin', '100mg')
+    assert 'Warning' not in capsys.readouterr().out
+    assert tracker.add_medication(1, 'Aspirin', '100mg')
+    assert 'Interaction (major): Aspirin + Warfarin' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('contents', [None, DATASET + 'a,b,deadly,\n'], ids=['missing', 'malformed'])
+def test_unreadable_dataset_does_not_block_adds(make_db, tmp_path, capsys, contents):
+    path = tmp_path / 'interactions.csv'
+    if contents is not None:
+        path.write_text(contents)
+    tracker = _tracker(make_db, str(path))
+    tracker.add_medication(1, 'Warfarin', '5mg')
+    assert tracker.add_medication(1, 'Aspirin', '100mg')
+    assert 'Warning: interactions not checked' in capsys.readouterr().out
+    assert len(tracker.find_medication(user_id=1)) == 2
+
+
+def test_dataset_lookup_is_not_a_metrics_operation(make_db):
+    db = make_db(metrics=True)
+    db.migrate()
+    MedicationTrackerDB(db).add_medication(1, 'Aspirin', '100mg')
+    snapshot = get_metrics().snapshot()
+    get_metrics().reset()
+    assert 'MedicationTrackerDB.interactions' not in snapshot
+    assert snapshot['MedicationTrackerDB.add_medication']['failures'] == 0
@@ -0,0 +1,58 @@
+# tests/test_metrics.py
+import json
+import sqlite3
+import pytest
+from models.medication_tracker import MedicationTrackerDB
+from models.metrics import Histogram, Metrics, instrument
+from models.schedule import ScheduleManager
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 10))
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(1, 2), (10, 3), ('+Inf', 4)]
+    assert histogram.total == 56.5
+
+
+def test_instrumented_manager_counts_calls_rows_and_errors(db):
+    metrics = Metrics()
+    manager = instrument(MedicationTrackerDB(db), metrics)
+    manager.add_medication(1, 'Aspirin', '100mg')
+    manager.add_medication(1, 'Ibuprofen', '200mg')
+    # Iterators are recorded once they are exhausted.
+    rows = manager.iter_medications()
+    next(rows)
+    assert 'MedicationTrackerDB.iter_medications' not in metrics.snapshot()
+    list(rows)
+    manager.find_medication(user_id=1)
+    with pytest.raises(sqlite3.IntegrityError):
+        manager.add_medication(1, None, '5mg')
+    snapshot = metrics.snapshot()
+    assert snapshot['MedicationTrackerDB.add_medication']['calls'] == 3
+    assert snapshot['MedicationTrackerDB.add_medication']['errors'] == 1
+    assert snapshot['MedicationTrackerDB.find_medication']['rows'] == 2
+    # find_medication's own call to iter_medications is counted too.
+    assert snapshot['MedicationTrackerDB.iter_medications']['calls'] == 2
+    assert 'medtracker_calls_total{operation="MedicationTrackerDB.add_medication"} 3' in metrics.to_prometheus()
+
+
+def test_reported_failures_are_counted(db):
+    metrics = Metrics()
+    manager = instrument(ScheduleManager(db), metrics)
+    # The manager prints the error and returns None.
+    manager.add_schedule(1, 'soon')
+    manager.add_schedule(1, '2024-01-01 08:00')
+    stats = metrics.snapshot()['ScheduleManager.add_schedule']
+    assert (stats['calls'], stats['failures'], stats['rows']) == (2, 1, 1)
+
+
+def test_slow_query_log_includes_plans(make_db, tmp_path):
+    log = tmp_path / 'slow.jsonl'
+    db = make_db(slow_query_ms=1e-6, slow_query_log=str(log))
+    db.migrate()
+    db.query('SELECT id FROM schedule WHERE user_id = ? AND time >= ?', (1, 0))
+    entries = [json.loads(line) for line in log.read_text().splitlines()]
+    lookup = next(entry for entry in entries if entry['call'] == 'query'
+                  and entry['statements'][0]['sql'].startswith('SELECT id FROM schedule'))
+    assert any('idx_schedule_user_time' in step for step in lookup['statements'][0]['plan'])
@@ -0,0 +1,72 @@
+# tests/test_migrations.py
+import datetime
+import sqlite3
+import pytest
+from models import migrations
+from models.timeutil import to_epoch
+
+# The schema the tracker shipped with before migrations existed: TEXT
+# times, and reminder.reminder_time instead of reminder.time.
+BASELINE = '''
+CREATE TABLE user (id INTEGER PRIMARY KEY AUTOINCREMENT, Name TEXT NOT NULL);
+CREATE TABLE medication (id INTEGER PRIMARY KEY AUTOINCREMENT, Name TEXT NOT NULL, Dosage TEXT NOT NULL,
+                         user_id INTEGER);
+CREATE TABLE schedule (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, time TEXT NOT NULL);
+CREATE TABLE reminder (id INTEGER PRIMARY KEY AUTOINCREMENT, medication_id INTEGER, reminder_time TEXT NOT NULL,
+                       message TEXT);
+INSERT INTO schedule (user_id, time) VALUES (1, '2024-01-01 08:00:00'), (1, 'tomorrow');
+INSERT INTO reminder (medication_id, reminder_time, message) VALUES (1, '2024-01-01 09:00:00', 'Take it');
+'''
+
+
+def _baseline(path):
+    connection = sqlite3.connect(path)
+    connection.executescript(BASELINE)
+    connection.close()
+
+
+def _inspect(path, sql):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(sql).fetchall()
+    finally:
+        connection.close()
+
+
+def test_fresh_database_reaches_latest_version(db):
+    assert db.schema_version() == migrations.LATEST_VERSION
+    assert db.migrate() == []
+
+
+def test_bad_row_rolls_back_every_step(make_db):
+    db = make_db()
+    _baseline(db.path)
+    with pytest.raises(sqlite3.IntegrityError):
+        db.migrate()
+
+    assert _inspect(db.path, 'PRAGMA user_version') == [(0,)]
+    assert ('time', 'TEXT') in [(row[1], row[2]) for row in _inspect(db.path, 'PRAGMA table_info(schedule)')]
+    assert 'reminder_time' in [row[1] for row in _inspect(db.path, 'PRAGMA table_info(reminder)')]
+    assert _inspect(db.path, "SELECT name FROM sqlite_master WHERE name = 'dose_event'") == []
+
+
+def test_baseline_is_adopted_once_fixed(make_db):
+    db = make_db()
+    _baseline(db.path)
+    with pytest.raises(sqlite3.IntegrityError):
+        db.migrate()
+    db.execute("UPDATE schedule SET time = '2024-01-02 08:00:00' WHERE time = 'tomorrow'")
+
+    applied = db.migrate()
+
+    assert applied == [version for version, _, _ in migrations.MIGRATIONS]
+    assert db.query('SELECT time FROM schedule ORDER BY id') == [
+        (to_epoch(datetime.datetime(2024, 1, 1, 8)),), (to_epoch(datetime.datetime(2024, 1, 2, 8)),)]
+    assert db.query('SELECT time, message FROM reminder') == [
+        (to_epoch(datetime.datetime(2024, 1, 1, 9)), 'Take it')]
+
+
+def test_newer_schema_is_refused(db):
+    db.execute(f'PRAGMA user_version = {migrations.LATEST_VERSION + 1}')
+    with pytest.raises(RuntimeError):
+        db.migrate(migrations.LATEST_VERSION + 2)
@@ -0,0 +1,60 @@
+# tests/test_next_dose.py
+import datetime
+import pytest
+from models.medication_tracker import MedicationTrackerDB
+from models.next_dose import NextDoseManager
+from models.reminder import ReminderManager
+from models.schedule import ScheduleManager
+from models.timeutil import TIME_FORMAT, to_epoch
+
+# Due times are only projected forward from the real clock, so the
+# scenario starts a day from now.
+BASE = (datetime.datetime.now() + datetime.timedelta(days=1)).replace(second=0, microsecond=0)
+
+
+def _at(minutes):
+    return (BASE + datetime.timedelta(minutes=minutes)).strftime(TIME_FORMAT)
+
+
+@pytest.fixture
+def doses(db):
+    medications = MedicationTrackerDB(db)
+    for user_id, name in ((1, 'Aspirin'), (1, 'Ibuprofen'), (2, 'Metformin')):
+        medications.add_medication(user_id, name, '100mg')
+    schedules = ScheduleManager(db)
+    schedules.add_schedule(1, _at(-3 * 24 * 60))
+    schedules.add_schedule(1, _at(120))
+    schedules.add_schedule(1, _at(60))
+    schedules.add_recurring_schedule(2, _at(180), '1d')
+    ReminderManager(db).add_reminder(2, _at(30), 'With food')
+    return NextDoseManager(db)
+
+
+def _due(doses):
+    return [(dose.medication_id, dose.due) for dose in doses]
+
+
+def test_users_next_doses_follow_writes(doses, db):
+    # Ibuprofen's reminder comes before the user's next schedule.
+    assert _due(doses.next_doses(user_id=1)) == [(2, BASE + datetime.timedelta(minutes=30)),
+                                                 (1, BASE + datetime.timedelta(minutes=60))]
+    ScheduleManager(db).delete_schedule(3)
+    assert _due(doses.next_doses(user_id=1))[1] == (1, BASE + datetime.timedelta(minutes=120))
+
+
+def test_window_includes_rule_doses(doses):
+    found = doses.next_doses(start_time=_at(0), end_time=_at(200))
+    assert _due(found) == [(2, BASE + datetime.timedelta(minutes=30)), (1, BASE + datetime.timedelta(minutes=60)),
+                           (3, BASE + datetime.timedelta(minutes=180))]
+    assert (found[2].rule_id, found[2].schedule_id) == (1, None)
+    # Only each medication's next dose is projected.
+    assert _due(doses.next_doses(start_time=_at(100), end_time=_at(200))) == [
+        (3, BASE + datetime.timedelta(minutes=180))]
+    assert doses.next_doses(start_time=_at(-5 * 24 * 60), end_time=_at(-4 * 24 * 60)) == []
+
+
+def test_refresh_moves_past_rows_on(doses, db):
+    assert doses.refresh(to_epoch(BASE)) == 0
+    assert doses.refresh(to_epoch(BASE) + 90 * 60) == 2
+    assert db.query('SELECT medication_id, due FROM next_dose WHERE user_id = 1 ORDER BY medication_id') == [
+        (1, to_epoch(BASE) + 120 * 60), (2, to_epoch(BASE) + 120 * 60)]
@@ -0,0 +1,58 @@
+# tests/test_recurrence.py
+import datetime
+import pytest
+from models.recurrence import (expand, next_occurrence, nearest_occurrence, parse_interval, parse_weekdays,
+                               weekday)
+from models.timeutil import to_epoch
+
+HOUR = 3600
+DAY = 86400
+# A Monday.
+MONDAY = to_epoch(datetime.datetime(2024, 1, 1, 8))
+
+
+def test_parse_interval():
+    assert parse_interval('90m') == 90 * 60
+    assert parse_interval(' 8H ') == 8 * HOUR
+    assert parse_interval('2w') == 14 * DAY
+    for text in ('0h', '8', 'h', '1y'):
+        with pytest.raises(ValueError):
+            parse_interval(text)
+
+
+def test_parse_weekdays():
+    assert parse_weekdays('weekdays') == 0b0011111
+    assert parse_weekdays('mon, wednesday,fri') == 0b0010101
+    with pytest.raises(ValueError):
+        parse_weekdays('mon,funday')
+    assert weekday(MONDAY) == 0
+
+
+def test_expand_starts_inside_the_window():
+    times = list(expand(MONDAY, 8 * HOUR, None, None, MONDAY + HOUR, MONDAY + DAY))
+    assert times == [MONDAY + 8 * HOUR, MONDAY + 16 * HOUR, MONDAY + DAY]
+
+
+def test_expand_stops_at_until_and_skips_weekdays():
+    weekends = parse_weekdays('weekends')
+    times = list(expand(MONDAY, DAY, MONDAY + 6 * DAY, weekends, MONDAY, MONDAY + 30 * DAY))
+    assert times == [MONDAY + 5 * DAY, MONDAY + 6 * DAY]
+
+
+def test_expand_window_before_start():
+    assert list(expand(MONDAY, DAY, None, None, MONDAY - 10 * DAY, MONDAY - DAY)) == []
+
+
+def test_next_occurrence():
+    fridays = parse_weekdays('fri')
+    assert next_occurrence(MONDAY, DAY, None, None, MONDAY + HOUR) == MONDAY + DAY
+    assert next_occurrence(MONDAY, DAY, None, fridays, MONDAY + 5 * DAY) == MONDAY + 11 * DAY
+    # Every 3 days lands on a Friday only once every 3 weeks.
+    assert next_occurrence(MONDAY, 3 * DAY, None, fridays, MONDAY) == MONDAY + 18 * DAY
+    assert next_occurrence(MONDAY, DAY, MONDAY + DAY, None, MONDAY + 2 * DAY) is None
+
+
+def test_nearest_occurrence():
+    assert nearest_occurrence(MONDAY, DAY, None, None, MONDAY + DAY - HOUR) == MONDAY + DAY
+    assert nearest_occurrence(MONDAY, DAY, None, None, MONDAY + 2 * HOUR) == MONDAY
+    assert nearest_occurrence(MONDAY, DAY, None, None, MONDAY - 2 * DAY) is None
@@ -0,0 +1,20 @@
+# tests/test_schedule_index.py
+from models.schedule import ScheduleManager
+from models.schedule_index import get_schedule_index
+from models.timeutil import parse_time, to_epoch
+
+
+def test_schedule_index_follows_writes(db):
+    manager = ScheduleManager(db)
+    index = get_schedule_index(db)
+    first = manager.add_schedule(1, '2024-01-01 08:00')
+    assert index.between(1, 0, 2 ** 40) == [(to_epoch(parse_time('2024-01-01 08:00')), first)]
+
+    second = manager.add_schedule(1, '2024-01-01 08:10')
+    manager.update_schedule(first, '2024-01-01 12:00')
+    assert [schedule.id for schedule in manager.find_conflicts(1, '2024-01-01 08:20')] == [second]
+    manager.delete_schedule(second)
+    assert manager.find_conflicts(1, '2024-01-01 08:20') == []
+    # The index matches the table.
+    index.clear()
+    assert index.between(1, 0, 2 ** 40) == [(to_epoch(parse_time('2024-01-01 12:00')), first)]
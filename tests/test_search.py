@@ -0,0 +1,42 @@
+# tests/test_search.py
+from models.medication_tracker import MedicationTrackerDB
+from models.search import match_query, query_words, score
+
+
+def test_score_ranks_prefix_word_substring_and_typo_matches():
+    assert score(query_words('amox'), 'Amoxicillin', '500mg') == 3.0
+    assert score(query_words('amoxicillin 500'), 'Amoxicillin', '500mg') == 2.0
+    assert score(query_words('cillin'), 'Amoxicillin', '500mg') == 1.0
+    assert 0.75 < score(query_words('amoxicilin'), 'Amoxicillin', '500mg') < 1.0
+    # Numbers must match exactly.
+    assert score(query_words('amoxicilin 250'), 'Amoxicillin', '500mg') is None
+    assert score(query_words('ibuprofen'), 'Amoxicillin', '500mg') is None
+
+
+def test_match_query_quotes_words():
+    assert match_query(['a"b"c', 'x']) == '"a""b""c"'
+
+
+def _tracker(db):
+    tracker = MedicationTrackerDB(db)
+    tracker.add_medications_bulk([(1, 'Amoxicillin', '500mg'), (2, 'Amoxicillin', '500mg'),
+                                  (3, 'Amoxicillin', '250mg'), (4, 'Ampicillin', '250mg'),
+                                  (5, 'Ibuprofen', '200mg')])
+    return tracker
+
+
+def test_search_ranks_labels_and_prefers_common_ones(db):
+    tracker = _tracker(db)
+    assert [med.id for med in tracker.search_medications('amox')] == [1, 2, 3]
+    # Ampicillin is a close typo too, but a worse one.
+    assert [med.id for med in tracker.search_medications('amoxicilin 250')] == [3, 4]
+    assert [med.id for med in tracker.search_medications('cillin', limit=2)] == [1, 2]
+    assert tracker.search_medications('paracetamol') == []
+
+
+def test_search_within_one_user_follows_writes(db):
+    tracker = _tracker(db)
+    tracker.add_medication(4, 'Amoxicillin', '125mg')
+    assert [med.name for med in tracker.search_medications('amox', user_id=4)] == ['Amoxicillin']
+    tracker.update_medication(1, name='Paracetamol')
+    assert [med.id for med in tracker.search_medications('paracet')] == [1]
@@ -0,0 +1,44 @@
+# tests/test_sharding.py
+import pytest
+from models.config import DatabaseConfig
+from models.sharding import SHARD_BITS, ShardSet, shard_paths
+
+
+def test_shard_paths():
+    assert shard_paths('data/tracker.db', 3) == ['data/tracker.shard0.db', 'data/tracker.shard1.db',
+                                                 'data/tracker.shard2.db']
+    assert shard_paths('tracker', 2) == ['tracker.shard0.db', 'tracker.shard1.db']
+
+
+@pytest.fixture
+def shard_set(tmp_path):
+    shards = ShardSet(DatabaseConfig(path=str(tmp_path / 'tracker.db'), shards=3))
+    shards.migrate()
+    return shards
+
+
+def test_users_are_routed_by_id(shard_set):
+    assert [shard_set.for_user(user_id) for user_id in range(6)] == [0, 1, 2, 0, 1, 2]
+    with pytest.raises(TypeError):
+        shard_set.for_user('1')
+
+
+def test_row_ids_carry_their_shard(shard_set):
+    for shard, database in enumerate(shard_set.databases):
+        schedule_id = database.insert('INSERT INTO schedule (user_id, time) VALUES (?, 0)', (shard,))
+        assert schedule_id == (shard << SHARD_BITS) + 1
+        assert shard_set.for_id(schedule_id) == shard
+    # Ids outside every shard's range go to shard 0 and match nothing there.
+    assert shard_set.for_id(5 << SHARD_BITS) == 0
+    assert shard_set.for_id(-1) == 0
+
+
+def test_migrate_keeps_existing_sequences(shard_set):
+    shard_set.databases[1].insert('INSERT INTO schedule (user_id, time) VALUES (1, 0)')
+    shard_set.migrate()
+    assert shard_set.databases[1].insert('INSERT INTO schedule (user_id, time) VALUES (1, 0)') == (1 << SHARD_BITS) + 2
+
+
+def test_needs_two_shards(tmp_path):
+    with pytest.raises(ValueError):
+        ShardSet(DatabaseConfig(path=str(tmp_path / 'tracker.db'), shards=1))
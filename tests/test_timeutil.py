@@ -0,0 +1,32 @@
+# tests/test_timeutil.py
+import datetime
+import sqlite3
+from models.reminder import ReminderManager
+from models.schedule import ScheduleManager
+from models.timeutil import from_epoch, parse_time, to_epoch
+
+
+def test_epoch_matches_sqlite():
+    connection = sqlite3.connect(':memory:')
+    for text in ('1970-01-01 00:00', '2024-02-29 23:59', '2038-01-19 03:15'):
+        expected, = connection.execute("SELECT CAST(strftime('%s', ?) AS INTEGER)", (text,)).fetchone()
+        assert to_epoch(parse_time(text)) == expected
+        assert from_epoch(expected) == parse_time(text)
+    connection.close()
+
+
+def test_times_are_stored_as_epoch_seconds(db):
+    schedule_id = ScheduleManager(db).add_schedule(1, '2024-01-01 08:00')
+    ReminderManager(db).add_reminder(1, '2024-01-01 09:00', 'Take it')
+    assert db.query_one('SELECT typeof(time), time FROM schedule') == ('integer', 1704096000)
+    assert db.query_one('SELECT typeof(time), time FROM reminder') == ('integer', 1704099600)
+    found = ScheduleManager(db).find_schedule(start_time='2024-01-01 07:00', end_time='2024-01-01 08:00')
+    assert [(schedule.id, schedule.time) for schedule in found] == [(schedule_id, datetime.datetime(2024, 1, 1, 8))]
+
+
+def test_time_lookups_use_an_index(db):
+    for sql in ('SELECT id FROM schedule WHERE time BETWEEN ? AND ?',
+                'SELECT id FROM reminder WHERE time = ?',
+                'SELECT id FROM reminder WHERE medication_id = ? AND time >= ?'):
+        plan = ' '.join(row[-1] for row in db.query(f'EXPLAIN QUERY PLAN {sql}', (1, 2)[:sql.count('?')]))
+        assert 'USING' in plan and 'INDEX' in plan, plan
@@ -0,0 +1,42 @@
+# tests/test_transfer.py
+import json
+import pytest
+from models.transfer import detect_format, export_file, import_file
+
+
+def test_detect_format():
+    assert detect_format('-') == 'jsonl'
+    assert detect_format('rows.NDJSON') == 'jsonl'
+    assert detect_format('rows.csv') == 'csv'
+    assert detect_format('rows.txt', 'csv') == 'csv'
+    with pytest.raises(ValueError):
+        detect_format('rows.txt')
+
+
+def test_csv_import_keeps_ids_and_reports_bad_records(db, tmp_path):
+    path = tmp_path / 'schedules.csv'
+    path.write_text('id,user_id,time\n7,1,2024-01-01 08:00\n,2,2024-01-01 09:00\n9,1,later\n')
+    result = import_file('schedules', str(path), db=db)
+    assert result.inserted == 2 and [failure[0] for failure in result.failures] == [2]
+    assert db.query('SELECT id, user_id, time FROM schedule ORDER BY id') == [(7, 1, 1704096000),
+                                                                                (8, 2, 1704099600)]
+
+
+def test_jsonl_round_trip(make_db, tmp_path):
+    source = make_db('source.db')
+    source.migrate()
+    source.insert_many('INSERT INTO medication (id, user_id, Name, Dosage) VALUES (?, ?, ?, ?)',
+                       [(3, 1, 'Aspirin', '100mg'), (5, None, 'Ibuprofen', '200mg')])
+    source.insert_many('INSERT INTO reminder (medication_id, time, message) VALUES (?, ?, ?)',
+                       [(5, 1704096000, 'With food')])
+    assert export_file('medications', str(tmp_path / 'medications.jsonl'), db=source) == 2
+    assert export_file('reminders', str(tmp_path / 'reminders.jsonl'), db=source) == 1
+    assert json.loads((tmp_path / 'reminders.jsonl').read_text()) == {
+        'id': 1, 'medication_id': 5, 'time': '2024-01-01 08:00', 'message': 'With food'}
+
+    target = make_db('target.db')
+    target.migrate()
+    for kind in ('medications', 'reminders'):
+        assert import_file(kind, str(tmp_path / f'{kind}.jsonl'), db=target).failures == []
+    for table in ('medication', 'reminder'):
+        assert target.query(f'SELECT * FROM {table}') == source.query(f'SELECT * FROM {table}')